@@ -0,0 +1,111 @@
+import numpy as np
+from typing import Dict, List, Optional
+
+
+class GroupAccumulator:
+    """
+    Суммы K по группам на массивах NumPy.
+
+    Ключ группы (например, (самолет, количество)) один раз получает целочисленный код,
+    дальше суммы и количества накапливаются в массивах по кодам через np.bincount.
+    Группы хранятся в порядке первого появления, как ключи в словаре.
+    """
+
+    def __init__(self):
+        self.keys: List[tuple] = []
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0)
+        self._codes: Dict[tuple, int] = {}
+
+    @classmethod
+    def from_arrays(cls, keys: List[tuple], sums, counts) -> "GroupAccumulator":
+        """Восстанавливает аккумулятор из ключей и массивов сумм и количеств"""
+        accumulator = cls()
+        for key in keys:
+            accumulator._code(key)
+        accumulator.sums = np.array(sums, dtype=float)
+        accumulator.counts = np.array(counts, dtype=float)
+        return accumulator
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, prefix: tuple, columns: list, values, weights: Optional[np.ndarray] = None):
+        """
+        Добавляет пачку значений.
+
+        Ключ строки - prefix плюс значения колонок в этой строке; weights задает вес
+        каждой строки (по умолчанию 1).
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+
+        group_keys, local = self._group(prefix, columns, len(values))
+        codes = np.array([self._code(key) for key in group_keys])[local]
+
+        size = len(self.keys)
+        self._grow(size)
+        if weights is None:
+            self.sums += np.bincount(codes, weights=values, minlength=size)
+            self.counts += np.bincount(codes, minlength=size)
+        else:
+            weights = np.asarray(weights, dtype=float)
+            self.sums += np.bincount(codes, weights=values * weights, minlength=size)
+            self.counts += np.bincount(codes, weights=weights, minlength=size)
+
+    def merge(self, other: "GroupAccumulator"):
+        """Прибавляет суммы другого аккумулятора (новые группы добавляются в конец)"""
+        if len(other) == 0:
+            return
+        codes = np.array([self._code(key) for key in other.keys])
+        self._grow(len(self.keys))
+        self.sums[codes] += other.sums
+        self.counts[codes] += other.counts
+
+    def means(self) -> List[float]:
+        """Средние значения по группам в порядке ключей"""
+        return (self.sums / self.counts).tolist()
+
+    def items(self):
+        """Пары (ключ, среднее) в порядке первого появления групп"""
+        return zip(self.keys, self.means())
+
+    def _code(self, key: tuple) -> int:
+        code = self._codes.get(key)
+        if code is None:
+            code = len(self.keys)
+            self._codes[key] = code
+            self.keys.append(key)
+        return code
+
+    def _grow(self, size: int):
+        if len(self.sums) < size:
+            self.sums = np.concatenate([self.sums, np.zeros(size - len(self.sums))])
+            self.counts = np.concatenate([self.counts, np.zeros(size - len(self.counts))])
+
+    @staticmethod
+    def _group(prefix: tuple, columns: list, n: int):
+        """Ключи групп пачки в порядке первого появления и номер группы каждой строки"""
+        if not columns:
+            return [prefix], np.zeros(n, dtype=np.intp)
+
+        # Каждая колонка кодируется отдельно, чтобы значения сохранили свой тип
+        uniques = []
+        inverses = []
+        composite = np.zeros(n, dtype=np.int64)
+        for column in columns:
+            unique, inverse = np.unique(np.asarray(column), return_inverse=True)
+            inverse = inverse.reshape(-1)
+            uniques.append(unique.tolist())
+            inverses.append(inverse.tolist())
+            composite = composite * len(unique) + inverse
+
+        _, first, inverse = np.unique(composite, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind="stable")
+        rank = np.empty(len(order), dtype=np.intp)
+        rank[order] = np.arange(len(order))
+
+        group_keys = [prefix + tuple(unique[codes[row]] for unique, codes in zip(uniques, inverses))
+                      for row in first[order].tolist()]
+        return group_keys, rank[inverse.reshape(-1)]
@@ -0,0 +1,322 @@
+"""
+Бенчмарк расчета на синтетических данных.
+
+Данные строятся из образца sample_data.sample_data() и масштабируются:
+N самолетов, M ракет, K объектов ПВО и несколько значений sigma_z.
+Замеряются dataCollection, count (векторный и скалярный), каждая функция
+вероятностей (через инструментацию Count) и загрузка объектов из БД.
+
+База зависит от машины и в репозиторий не входит. Один раз на машине, где идет
+сравнение (и после смены машины или версии Python), она создается командой
+    python benchmark.py --update-baseline
+которая сохраняет медиану нескольких запусков в benchmark_baseline.json.
+
+Проверка на регрессии:
+    python benchmark.py --output bench_results.json --baseline benchmark_baseline.json
+
+Если пропускная способность какого-либо замера упала ниже базовой больше чем
+на tolerance, скрипт завершается с кодом 1; без базы сравнение пропускается.
+Текущая нагрузка машины учитывается калибровочным циклом, допуск по умолчанию (30%)
+перекрывает разброс между запусками на одной машине.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence
+
+from count import Count
+from data_base import DatabaseManager
+from sample_data import sample_data
+
+# Функции вероятностей, которые попадают в отчет
+PROBABILITY_FUNCTIONS = ["_calculate_probabilities", "_P_4", "_P_prl1", "_P_prl2", "_ZVA", "_polygon", "_choice"]
+
+
+class SyntheticDB:
+    """База в памяти со списками синтетических объектов (интерфейс DatabaseManager.get_all_*)"""
+
+    def __init__(self, planes, rockets, purposes, air_defenses, reliefs):
+        self.planes = planes
+        self.rockets = rockets
+        self.purposes = purposes
+        self.air_defenses = air_defenses
+        self.reliefs = reliefs
+
+    def get_all_planes(self):
+        return self.planes
+
+    def get_all_rockets(self):
+        return self.rockets
+
+    def get_all_purposes(self):
+        return self.purposes
+
+    def get_all_air_defenses(self):
+        return self.air_defenses
+
+    def get_all_reliefs(self):
+        return self.reliefs
+
+
+def synthetic_db(n_planes: int, n_rockets: int, n_sites: int, sigma_z: Sequence[float]) -> SyntheticDB:
+    """
+    Масштабированный тестовый набор.
+
+    Самолеты получают sigma_z по кругу из списка, ракеты - разный R_min,
+    объекты ПВО - сдвинутые позиции сфер.
+    """
+    sample = sample_data()
+
+    planes = []
+    for i in range(n_planes):
+        plane = copy.deepcopy(sample.plane)
+        plane.name = f"Plane {i + 1}"
+        plane.sigma_z = sigma_z[i % len(sigma_z)]
+        planes.append(plane)
+
+    rockets = []
+    for i in range(n_rockets):
+        rocket = copy.deepcopy(sample.rocket)
+        rocket.name = f"Rocket {i + 1}"
+        rocket.R_min = sample.rocket.R_min + 250 * i
+        rockets.append(rocket)
+
+    air_defenses = []
+    for i in range(n_sites):
+        air_defence = copy.deepcopy(sample.air_defence)
+        air_defence.name = f"Site {i + 1}"
+        air_defence.x_defense = [x + 100 * i for x in sample.air_defence.x_defense]
+        air_defence.y_defense = [y + 50 * i for y in sample.air_defence.y_defense]
+        air_defenses.append(air_defence)
+
+    return SyntheticDB(planes, rockets, [sample.purpose], air_defenses, [sample.relief])
+
+
+def _best_time(function, repeat: int) -> float:
+    """Лучшее время из repeat запусков (меньше всего зависит от фоновой нагрузки)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _entry(seconds: float, operations: int) -> dict:
+    return {
+        "seconds": seconds,
+        "operations": operations,
+        "throughput": operations / seconds if seconds > 0 else 0.0
+    }
+
+
+def calibration(repeat: int, size: int = 200000) -> float:
+    """
+    Скорость эталонного цикла на Python (операций в секунду).
+
+    Показывает общую скорость машины в момент запуска: пропускная способность
+    замеров сравнивается с базой с поправкой на отношение калибровок.
+    """
+    return size / _best_time(lambda: sum(i * i for i in range(size)), repeat)
+
+
+def bench_count(db: SyntheticDB, repeat: int, collections: int = 100) -> Dict[str, dict]:
+    """
+    dataCollection и векторный count на всем наборе.
+
+    dataCollection ленивый и занимает микросекунды, поэтому замеряется пачка из
+    collections вызовов (операции - вызовы); у count операции - сценарии.
+    """
+    counter = Count(db)
+
+    def collect():
+        for _ in range(collections):
+            counter.dataCollection()
+
+    results = {"dataCollection": _entry(_best_time(collect, repeat), collections)}
+    scenarios = len(counter.data)
+
+    def run():
+        # Новый экземпляр, чтобы не переиспользовать агрегаты блоков прошлого запуска
+        fresh = Count(db)
+        fresh.dataCollection()
+        fresh.count()
+
+    results["count"] = _entry(_best_time(run, repeat), scenarios)
+    return results
+
+
+def bench_probabilities(db: SyntheticDB) -> Dict[str, dict]:
+    """
+    Скалярный count на первом самолете, ракете и объекте ПВО с инструментацией.
+
+    Операции функции - количество ее вызовов, время - суммарное время вызовов.
+    """
+    sample = SyntheticDB(db.planes[:1], db.rockets[:1], db.purposes, db.air_defenses[:1], db.reliefs)
+    counter = Count(sample, vectorized=False, instrument=True)
+    counter.dataCollection()
+    counter.count()
+
+    report = counter.stats.report()
+    results = {"count_scalar": _entry(report["elapsed_s"], report["scenarios"])}
+    for name in PROBABILITY_FUNCTIONS:
+        call = report["calls"].get(name)
+        if call is not None:
+            results[f"probability.{name}"] = _entry(call["total_s"], call["count"])
+    return results
+
+
+def bench_database(db: SyntheticDB, repeat: int, rows: int = 200, loads: int = 10) -> Dict[str, dict]:
+    """
+    Загрузка объектов из временной SQLite-базы (операции - объекты).
+
+    В базу кладется по rows копий объектов набора по кругу, чтобы одна загрузка
+    длилась заметное время. Загрузки замеряются с пустой картой объектов (чтение
+    и декодирование строк); db.cached.* - повторное чтение из карты объектов.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        manager = DatabaseManager(os.path.join(directory, "benchmark.db"))
+        try:
+            plane_ids = manager.save_many([db.planes[i % len(db.planes)] for i in range(rows)])
+            manager.save_many([db.rockets[i % len(db.rockets)] for i in range(rows)])
+            site_ids = manager.save_many([db.air_defenses[i % len(db.air_defenses)] for i in range(rows)])
+
+            paths = {
+                "db.get_all_planes": manager.get_all_planes,
+                "db.get_all_rockets": manager.get_all_rockets,
+                "db.get_all_air_defenses": manager.get_all_air_defenses,
+                "db.get_planes_by_ids": lambda: manager.get_planes_by_ids(plane_ids),
+                "db.get_air_defenses_by_ids": lambda: manager.get_air_defenses_by_ids(site_ids),
+            }
+            for name, load in paths.items():
+                def run():
+                    for _ in range(loads):
+                        manager.invalidate()
+                        load()
+                results[name] = _entry(_best_time(run, repeat), rows * loads)
+
+            for name, load in [("db.cached.get_all_planes", manager.get_all_planes),
+                               ("db.cached.get_planes_by_ids", paths["db.get_planes_by_ids"])]:
+                def run():
+                    for _ in range(loads):
+                        load()
+                load()
+                results[name] = _entry(_best_time(run, repeat), rows * loads)
+        finally:
+            manager.close()
+    return results
+
+
+def run_benchmarks(n_planes: int = 3, n_rockets: int = 2, n_sites: int = 2,
+                   sigma_z: Sequence[float] = (300, 500), repeat: int = 3) -> dict:
+    """Все замеры; результат - словарь, который сохраняется в JSON"""
+    db = synthetic_db(n_planes, n_rockets, n_sites, sigma_z)
+    benchmarks = {}
+    benchmarks.update(bench_count(db, repeat))
+    benchmarks.update(bench_probabilities(db))
+    benchmarks.update(bench_database(db, repeat))
+    return {
+        "parameters": {
+            "planes": n_planes,
+            "rockets": n_rockets,
+            "sites": n_sites,
+            "sigma_z": list(sigma_z),
+            "repeat": repeat
+        },
+        "python": platform.python_version(),
+        "calibration": calibration(repeat),
+        "benchmarks": benchmarks
+    }
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.3) -> List[str]:
+    """
+    Замеры, пропускная способность которых упала ниже базовой больше чем на tolerance.
+
+    Сравниваются только замеры с одинаковыми параметрами набора. Базовая пропускная
+    способность масштабируется отношением калибровок, чтобы общее замедление
+    машины не считалось регрессией.
+    """
+    if results["parameters"] != baseline["parameters"]:
+        raise ValueError("Параметры набора отличаются от базовых, сравнение невозможно")
+
+    scale = 1.0
+    if results.get("calibration") and baseline.get("calibration"):
+        scale = results["calibration"] / baseline["calibration"]
+
+    regressions = []
+    for name, base in baseline["benchmarks"].items():
+        current = results["benchmarks"].get(name)
+        if current is None:
+            continue
+        expected = base["throughput"] * scale
+        if current["throughput"] < expected * (1 - tolerance):
+            regressions.append(
+                f"{name}: {current['throughput']:.1f}/с против {expected:.1f}/с по базе"
+            )
+    return regressions
+
+
+def median_results(runs: List[dict]) -> dict:
+    """Медиана по нескольким запускам: база из одного запуска может оказаться случайно быстрой"""
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    result = copy.deepcopy(runs[0])
+    result["calibration"] = median([run["calibration"] for run in runs])
+    for name, entry in result["benchmarks"].items():
+        entry["seconds"] = median([run["benchmarks"][name]["seconds"] for run in runs])
+        entry["throughput"] = median([run["benchmarks"][name]["throughput"] for run in runs])
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк расчета на синтетических данных")
+    parser.add_argument("--planes", type=int, default=3)
+    parser.add_argument("--rockets", type=int, default=2)
+    parser.add_argument("--sites", type=int, default=2)
+    parser.add_argument("--sigma-z", type=float, nargs="+", default=[300, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--baseline-runs", type=int, default=5, help="запусков для медианы при --update-baseline")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.planes, args.rockets, args.sites, args.sigma_z, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+
+    for name, entry in results["benchmarks"].items():
+        print(f"{name:40} {entry['seconds']:10.4f} с {entry['throughput']:14.1f}/с")
+
+    if args.update_baseline:
+        runs = [results] + [run_benchmarks(args.planes, args.rockets, args.sites, args.sigma_z, args.repeat)
+                            for _ in range(args.baseline_runs - 1)]
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(median_results(runs), file, indent=2, ensure_ascii=False)
+        print(f"Базовые результаты сохранены в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Нет базовых результатов {args.baseline}, сравнение пропущено "
+              f"(база этой машины создается командой python benchmark.py --update-baseline)")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"Регрессия: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+# Настройки соединений: WAL позволяет читать во время записи и писать во время чтения,
+# synchronous=NORMAL в режиме WAL не теряет согласованность базы и реже вызывает fsync
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -16000,  # 16 МБ на соединение
+    "busy_timeout": 5000,  # мс ожидания блокировки записи
+}
+
+
+class ConnectionPool:
+    """
+    Соединения с одной базой SQLite: по одному на поток.
+
+    Поток интерфейса и поток расчета работают каждый со своим соединением и курсором,
+    поэтому не делят состояние курсора и не блокируют друг друга (в режиме WAL
+    читатели не мешают писателю). Соединения завершившихся потоков закрываются
+    при создании новых.
+    """
+
+    def __init__(self, db_name: str, pragmas: Optional[Dict[str, object]] = None):
+        self.db_name = db_name
+        self.pragmas = dict(PRAGMAS if pragmas is None else pragmas)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # (поток, соединение) всех открытых соединений
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создается при первом обращении)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """Общий курсор текущего потока"""
+        self.connection()
+        return self._local.cursor
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False нужен только для close() из другого потока:
+        # каждым соединением пользуется лишь создавший его поток
+        conn = sqlite3.connect(self.db_name, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+
+        with self._lock:
+            alive = []
+            for thread, other in self._connections:
+                if thread.is_alive():
+                    alive.append((thread, other))
+                else:
+                    other.close()
+            alive.append((threading.current_thread(), conn))
+            self._connections = alive
+        return conn
+
+    def __len__(self):
+        with self._lock:
+            return len(self._connections)
+
+    def close(self):
+        """Закрывает соединения всех потоков"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn.close()
+        # Соединение и курсор текущего потока больше не действительны
+        self._local = threading.local()
@@ -1,14 +1,25 @@
 import math
 from data_base import DatabaseManager
-from typing import Optional, Union, List
+from typing import Callable, Optional, List
 from entities import *
 from dataclasses import dataclass
 from collections import defaultdict
-import bisect
+import itertools
+import multiprocessing
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from db_cache import DBCache
-
-# Создаем экземпляр DatabaseManager
-db = DatabaseManager()
+from accumulator import GroupAccumulator
+from fingerprint import entity_fingerprint, block_key
+from result_cache import ResultCache
+from result_store import ResultStore
+from scenario_grid import ScenarioGrid
+from vector_engine import VectorEngine
+from probability_curve import ProbabilityCurve, curve_for
+from trajectory import TrajectoryCache, TrajectoryGeometry
+from defense_index import defense_index
+from progress import CancellationToken, ProgressEvent, ProgressReporter
+from instrumentation import Instrumentation
 
 @dataclass
 class CurrentDataSet:
@@ -49,6 +60,7 @@ class ProbabSurlData:
         psi_max: any
         angle_effect: any
         n_planes: any
+        defense_index: any = None  # DefenseIndex сфер ПВО (None - перебор всех сфер)
 
 @dataclass
 class GrafForNumPlanes:
@@ -96,11 +108,130 @@ class das:
 def degrees_to_radians(degrees):
     return degrees * (math.pi / 180)
 
+class ScenarioStream:
+    """
+    Ленивый источник сценариев для Count.count().
+
+    Хранит только списки объектов из базы и перебирает декартово произведение
+    объектов и сетки по требованию, не создавая список всех сценариев.
+    Порядок перебора совпадает с вложенными циклами dataCollection.
+    """
+
+    def __init__(self, planes: List[Plane], purposes: List[Purpose], rockets: List[Rocket],
+                 air_defences: List[AirDefense], reliefs: List[Relief], grid: ScenarioGrid = None):
+        self.planes = planes
+        self.purposes = purposes
+        self.rockets = rockets
+        self.air_defences = air_defences
+        self.reliefs = reliefs
+        self.grid = grid if grid is not None else ScenarioGrid()
+
+    def tuples(self):
+        """Перебирает наборы (самолет, цель, ракета, ПВО, рельеф)"""
+        return itertools.product(self.planes, self.purposes, self.rockets, self.air_defences, self.reliefs)
+
+    def blocks(self):
+        """Перебирает блоки: набор объектов и массивы точек сетки для него"""
+        for entities in self.tuples():
+            yield entities, self.grid.points(entities[0].sigma_z)
+
+    def weights(self, plane: Plane) -> Optional[np.ndarray]:
+        """Веса точек блока самолета (None при плотном переборе)"""
+        return self.grid.weights(plane.sigma_z)
+
+    def shards(self):
+        """
+        Делит перебор на шарды по парам (самолет, ракета).
+
+        Возвращает список пар: номера блоков шарда в общем порядке перебора и сам шард.
+        """
+        n_purposes, n_rockets = len(self.purposes), len(self.rockets)
+        n_inner = len(self.air_defences) * len(self.reliefs)
+        shards = []
+        for plane_index, plane in enumerate(self.planes):
+            for rocket_index, rocket in enumerate(self.rockets):
+                indices = [
+                    ((plane_index * n_purposes + purpose_index) * n_rockets + rocket_index) * n_inner + inner_index
+                    for purpose_index in range(n_purposes)
+                    for inner_index in range(n_inner)
+                ]
+                shard = ScenarioStream([plane], self.purposes, [rocket], self.air_defences, self.reliefs, self.grid)
+                shards.append((indices, shard))
+        return shards
+
+    def __iter__(self):
+        for plane, purpose, rocket, air_defence, relief in self.tuples():
+            for speed in self.grid.speeds:
+                for height in self.grid.heights:
+                    for plane_num in self.grid.plane_nums:
+                        for z in self.grid.z_points(plane.sigma_z)[0]:
+                            yield CurrentDataSet(
+                                plane=plane,
+                                rocket=rocket,
+                                purpose=purpose,
+                                air_defence=air_defence,
+                                relief=relief,
+                                plane_num=plane_num,
+                                v=speed,
+                                h=height,
+                                z=z
+                            )
+
+    def __len__(self):
+        points = sum(self.grid.size(plane.sigma_z) for plane in self.planes)
+        return points * len(self.purposes) * len(self.rockets) * len(self.air_defences) * len(self.reliefs)
+
+# Методы, которые оборачиваются при Count(instrument=True)
+INSTRUMENTED_METHODS = ["_calculate_probabilities", "_P_4", "_P_prl1", "_P_prl2", "_ZVA", "_polygon", "_choice"]
+INSTRUMENTED_ENGINE_METHODS = ["calculate_block", "_N_p4", "_N_prl", "_ZVA", "_polygon"]
+
 class Count():
-    def __init__(self, db: DatabaseManager, cache: DBCache):
+    def __init__(self, db: DatabaseManager, cache: DBCache = None, vectorized: bool = True, workers: int = 1,
+                 result_cache: ResultCache = None, z_nodes: Optional[int] = None, grid: ScenarioGrid = None,
+                 instrument: bool = False, results: ResultStore = None):
+        """
+        :param db: объект DatabaseManager для получения данных
+        :param cache: кэш выбранных пользователем ID (по умолчанию пустой)
+        :param vectorized: считать блоками через VectorEngine (False - поштучно скалярными методами)
+        :param workers: количество процессов для расчета (1 - в текущем процессе)
+        :param result_cache: постоянный кэш агрегатов блоков между запусками (по умолчанию не используется)
+        :param z_nodes: количество узлов квадратуры по z вместо плотного перебора с шагом Z_STEP
+        :param grid: сетка перебора (по умолчанию ScenarioGrid с z_nodes)
+        :param instrument: собирать счетчики и время горячих методов (отчет - self.stats.report())
+        :param results: хранилище результатов запусков; если задано, данные графиков строятся
+                        запросами GROUP BY к сохраненному запуску (номер - self.run_id)
+        """
         self.db = db
-        self.data: CurrentDataSet = []
-        self.cache = cache
+        self.data = []  # список CurrentDataSet или ленивый ScenarioStream
+        self.cache = cache if cache is not None else DBCache()
+        self.vectorized = vectorized
+        self.workers = workers
+        self.trajectories = TrajectoryCache()
+        self.engine = VectorEngine(self.trajectories)
+        self.result_cache = result_cache
+        self.results = results
+        self.run_id = None  # номер последнего запуска в results
+        self.last_stream = None  # поток сценариев последнего count() (для z_error_report)
+        self._collect_cells = False  # собирать ли в текущем запуске ячейки для results
+        self._cancel = None  # токен отмены текущего запуска count()
+        self.stats = None
+        if instrument:
+            self._instrument()
+        self.grid = grid if grid is not None else ScenarioGrid(z_nodes=z_nodes)
+        self._block_partials = {}  # агрегаты блоков прошлого запуска по ключу блока
+        self._refine_partials = {}  # агрегаты кусков уточнения сетки прошлого запуска
+        self.reused_blocks = 0
+        self.computed_blocks = 0
+        self.reused_refine_blocks = 0
+        self.computed_refine_blocks = 0
+
+    def _instrument(self):
+        """Включает инструментацию: оборачивает горячие методы и передает счетчики движкам"""
+        self.stats = Instrumentation()
+        self.stats.instrument(self, INSTRUMENTED_METHODS)
+        self.stats.instrument(self.engine, INSTRUMENTED_ENGINE_METHODS, "VectorEngine.")
+        self.engine.stats = self.stats
+        self.trajectories.stats = self.stats
 
     def dataCollection(self):
         if self.cache.count(Plane):
@@ -136,63 +267,79 @@ class Count():
         if planes == None or rockets == None or purposes == None or air_defences == None or reliefs == None:
             raise Exception("Один из объектов из базы данных пустой")
 
-        for plane in planes:
-            for purpose in purposes:
-                for rocket in rockets:
-                    for air_defence in air_defences:
-                        for relief in reliefs:
-                            for speed in range(100, 301, 50):
-                                for height in range(50, 500, 50):
-                                    for plane_num in range(1, 6):
-                                        for z in range(int(-3 * plane.sigma_z), int(3 * plane.sigma_z), 100):
-                                            currentDataSet = CurrentDataSet(
-                                                plane=plane,
-                                                rocket=rocket,
-                                                purpose=purpose, 
-                                                air_defence=air_defence,
-                                                relief=relief,
-                                                plane_num = plane_num,
-                                                v = speed,
-                                                h = height,
-                                                z = z
-                                                )
-                                            self.data.append(currentDataSet)
-
-    def count(self):
-        # self.dataCollection()
-        planeNameAndNumByK = {}
-        planeAndRocketNameByK = {}
-        planeNameAndVAndHByK = {}
-        for currentData in self.data:
-            data_K = self._calculate_probabilities(currentData)
-            K = self._cout_K(data_K)
-
-            #print(data_K.plane_name, K)
-
-            numberContainer = NumberContainer(1, K)
-            if (data_K.plane_name, data_K.plane_num) in planeNameAndNumByK:
-                planeNameAndNumByK[(data_K.plane_name, data_K.plane_num)] += numberContainer
-            else:
-                planeNameAndNumByK[(data_K.plane_name, data_K.plane_num)] = numberContainer
-
-            if (data_K.plane_name, data_K.rocket_name) in planeAndRocketNameByK:
-                planeAndRocketNameByK[(data_K.plane_name, data_K.rocket_name)] += numberContainer
-            else:
-                planeAndRocketNameByK[(data_K.plane_name, data_K.rocket_name)] = numberContainer
+        # Сценарии не материализуются: count() перебирает их лениво
+        self.data = ScenarioStream(planes, purposes, rockets, air_defences, reliefs, self.grid)
 
-            if (data_K.plane_name, data_K.v, data_K.h) in planeNameAndVAndHByK:
-                planeNameAndVAndHByK[(data_K.plane_name, data_K.v, data_K.h)] += numberContainer
+    def count(self, progress: Callable[[ProgressEvent], None] = None, cancel: CancellationToken = None):
+        """
+        :param progress: вызывается с ProgressEvent по мере расчета (из потока расчета)
+        :param cancel: токен отмены; после cancel.cancel() расчет прерывается исключением CountCancelled
+        """
+        # self.dataCollection()
+        self._cancel = cancel
+        if self.stats is not None:
+            self.stats.reset()
+
+        # Запуск с теми же объектами, сеткой и моделью уже сохранен: сценарии не перебираются
+        # и ничего не записывается, графики строятся запросами к сохраненному запуску
+        run_key = None
+        stored_run = None
+        if self.results is not None and isinstance(self.data, ScenarioStream):
+            run_key = self._run_key()
+            stored_run = self.results.find_run(run_key)
+        self._collect_cells = self.results is not None and stored_run is None
+        try:
+            planeNameAndNumByK = GroupAccumulator()
+            planeAndRocketNameByK = GroupAccumulator()
+            planeNameAndVAndHByK = GroupAccumulator()
+            # Ячейки для хранилища результатов: равномерная сетка и точки уточнения
+            cells = GroupAccumulator() if self._collect_cells else None
+            refinedCells = GroupAccumulator() if self._collect_cells else None
+            reporter = ProgressReporter(len(self.data), progress)
+            if stored_run is not None:
+                # Блоки и уточнение сетки не пересчитываются: все берется из сохраненного запуска
+                self.reused_blocks = 0
+                self.computed_blocks = 0
+                self.reused_refine_blocks = 0
+                self.computed_refine_blocks = 0
+                reporter.advance(len(self.data))
             else:
-                planeNameAndVAndHByK[(data_K.plane_name, data_K.v, data_K.h)] = numberContainer
+                for partial, size in self._partials():
+                    planeNameAndNumByK.merge(partial[0])
+                    planeAndRocketNameByK.merge(partial[1])
+                    planeNameAndVAndHByK.merge(partial[2])
+                    if cells is not None:
+                        cells.merge(partial[3])
+                    reporter.advance(size)
+            if self.stats is not None:
+                self.stats.scenarios = reporter.done
+                self.stats.elapsed = reporter.event().elapsed
+
+            if stored_run is None and self.grid.adaptive and isinstance(self.data, ScenarioStream):
+                self._refine(planeNameAndVAndHByK, refinedCells, reporter)
+        finally:
+            self._cancel = None
+            self._collect_cells = False
         
-        self.data: CurrentDataSet = []
+        if isinstance(self.data, ScenarioStream):
+            self.last_stream = self.data
+        self.data = []
+
+        numItems = planeNameAndNumByK.items()
+        rocketItems = planeAndRocketNameByK.items()
+        heightItems = planeNameAndVAndHByK.items()
+        if self.results is not None:
+            if stored_run is not None:
+                self.run_id = stored_run
+            else:
+                self.run_id = self.results.save_run(cells, refinedCells, self.grid.definition(), run_key)
+            numItems, rocketItems, heightItems = self.chart_items(self.run_id)
 
         bestPlane = ""
         bestPlaneK = 0
         planeNameByNumAndK = defaultdict(lambda: {"plane_nums": [], "K_values": []})
-        for (plane_name, plane_num), numberContainer in planeNameAndNumByK.items():
+        for (plane_name, plane_num), k in numItems:
             planeNameByNumAndK[plane_name]["plane_nums"].append(plane_num)
-            k = numberContainer.float_value / numberContainer.int_value
             planeNameByNumAndK[plane_name]["K_values"].append(k)
 
             if bestPlaneK < k:
@@ -200,20 +347,410 @@ class Count():
         planeNameByNumAndK = dict(planeNameByNumAndK)
 
         planeAndRocketNameByK2 = {}
-        for (plane_name, plane_num), numberContainer in planeAndRocketNameByK.items():
-            k = numberContainer.float_value / numberContainer.int_value
+        for (plane_name, plane_num), k in rocketItems:
             planeAndRocketNameByK2[plane_name + " " + plane_num] = k
 
         HeightByV = defaultdict(lambda: {"v": [], "k": []})
-        for (plane_name, v, h), numberContainer in planeNameAndVAndHByK.items():
+        if self.grid.adaptive:
+            # Точки уточнения добавлены в конец, для графика их нужно упорядочить по h и v
+            heightItems = sorted(heightItems, key=lambda item: (item[0][2], item[0][1]))
+        for (plane_name, v, h), k in heightItems:
             if plane_name == bestPlane:
                 HeightByV[h]["v"].append(v)
-                k = numberContainer.float_value / numberContainer.int_value
                 HeightByV[h]["k"].append(k)
         HeightByV = dict(HeightByV)
 
         return planeNameByNumAndK, planeAndRocketNameByK2, HeightByV
 
+    def chart_items(self, run_id: int):
+        """
+        Средние K сохраненного запуска для трех графиков: по (самолет, количество),
+        (самолет, ракета) и (самолет, v, h) - в том же виде, что и items() аккумуляторов
+        """
+        return (
+            self.results.group_by(run_id, ["plane_name", "plane_num"], refined=False),
+            self.results.group_by(run_id, ["plane_name", "rocket_name"], refined=False),
+            self.results.group_by(run_id, ["plane_name", "v", "h"])
+        )
+
+    def _refine(self, accumulator: GroupAccumulator, cells: GroupAccumulator = None,
+                reporter: ProgressReporter = None):
+        """
+        Адаптивное уточнение сетки (v, h) для HeightByV.
+
+        Между соседними скоростями (высотами), где K хотя бы одного самолета меняется
+        больше чем на grid.tolerance, добавляется середина интервала. Новые точки
+        считаются для всех наборов объектов и попадают только в агрегат (самолет, v, h):
+        средние по количеству самолетов и по ракетам остаются на равномерной сетке.
+        Ячейки новых точек для хранилища результатов добавляются в cells, точки
+        каждого шага уточнения добавляются к общему числу сценариев reporter.
+        Агрегаты уточнения запоминаются, как и блоки в _partials: по ключу блока
+        и куску сетки (скорости, высоты), в памяти и в постоянном кэше.
+        """
+        grid = self.grid
+        speeds, heights = sorted(grid.speeds), sorted(grid.heights)
+        min_speed_step, min_height_step = grid.min_step(speeds), grid.min_step(heights)
+
+        previous = self._refine_partials
+        self._refine_partials = {}
+        self.reused_refine_blocks = 0
+        self.computed_refine_blocks = 0
+        computed = {}
+        fingerprints = {}
+        finished = False
+        try:
+            while True:
+                K = dict(accumulator.items())
+                plane_names = list(dict.fromkeys(key[0] for key in K))
+
+                def changes_fast(keys_a, keys_b) -> bool:
+                    for key_a, key_b in zip(keys_a, keys_b):
+                        if key_a in K and key_b in K and abs(K[key_b] - K[key_a]) > grid.tolerance:
+                            return True
+                    return False
+
+                new_speeds = grid.midpoints(speeds, lambda a, b: (b - a) / 2 >= min_speed_step and changes_fast(
+                    [(name, a, h) for name in plane_names for h in heights],
+                    [(name, b, h) for name in plane_names for h in heights]))
+                new_heights = grid.midpoints(heights, lambda a, b: (b - a) / 2 >= min_height_step and changes_fast(
+                    [(name, v, a) for name in plane_names for v in speeds],
+                    [(name, v, b) for name in plane_names for v in speeds]))
+
+                if not new_speeds and not new_heights:
+                    break
+                if (len(speeds) + len(new_speeds)) * (len(heights) + len(new_heights)) > grid.max_points:
+                    break
+
+                # Новые ячейки: новые скорости на всех высотах и старые скорости на новых высотах
+                pieces = [(new_speeds, heights + new_heights), (speeds, new_heights)]
+                if reporter is not None:
+                    points_per_z = sum(len(s) * len(h) for s, h in pieces) * len(grid.plane_nums)
+                    reporter.extend(sum(points_per_z * len(grid.z_points(entities[0].sigma_z)[0])
+                                        for entities in self.data.tuples()))
+                blocks = [(entities, piece_speeds, piece_heights,
+                           self._refine_key(entities, piece_speeds, piece_heights, fingerprints))
+                          for entities in self.data.tuples() for piece_speeds, piece_heights in pieces]
+                if self.result_cache is not None:
+                    # Куски, которых нет в памяти, ищутся в постоянном кэше
+                    missing = [block[3] for block in blocks if block[3] not in previous]
+                    previous.update(self.result_cache.get_many(missing))
+
+                for entities, piece_speeds, piece_heights, key in blocks:
+                    self._check_cancelled()
+                    sigma_z = entities[0].sigma_z
+                    points = grid.points(sigma_z, piece_speeds, piece_heights)
+                    partial = previous.get(key)
+                    # Агрегаты, посчитанные без ячеек, хранилищу результатов не подходят
+                    if partial is None or (cells is not None and len(partial) < 4):
+                        weights = grid.weights(sigma_z, len(piece_speeds) * len(piece_heights))
+                        partial = self._block_partial(entities, points, weights, cells is not None)
+                        computed[key] = partial
+                        self.computed_refine_blocks += 1
+                    else:
+                        self.reused_refine_blocks += 1
+                    self._refine_partials[key] = partial
+                    accumulator.merge(partial[2])
+                    if cells is not None:
+                        cells.merge(partial[3])
+                    if reporter is not None:
+                        reporter.advance(len(points[3]))
+
+                speeds = sorted(speeds + new_speeds)
+                heights = sorted(heights + new_heights)
+            finished = True
+        finally:
+            if not finished:
+                # Прерванный запуск не должен терять агрегаты, посчитанные раньше
+                self._refine_partials = {**previous, **self._refine_partials}
+            if self.result_cache is not None:
+                self.result_cache.put_many(computed)
+
+        self.refined_speeds, self.refined_heights = speeds, heights
+
+    def _refine_key(self, entities, speeds, heights, fingerprints: dict) -> str:
+        """Ключ куска уточнения: ключ блока объектов и скорости, высоты куска"""
+        return block_key([self._block_key(entities, None, fingerprints)], ["refine", list(speeds), list(heights)])
+
+    def z_error_report(self, z_nodes: Optional[int] = None) -> dict:
+        """
+        Оценка погрешности квадратуры по z относительно плотного перебора.
+
+        Каждый набор объектов потока считается обоими способами, и средние K
+        по количеству самолетов сравниваются отдельно для каждого набора.
+        Возвращает {имя самолета: {количество наборов, количество точек набора,
+        максимальные по всем наборам абсолютная и относительная ошибки}}.
+        Относительная ошибка считается только там, где плотное среднее K не равно нулю.
+        После count() используется поток сценариев этого запуска.
+        """
+        stream = self.data if isinstance(self.data, ScenarioStream) else self.last_stream
+        if stream is None:
+            raise ValueError("Сначала нужно вызвать dataCollection()")
+        z_nodes = z_nodes if z_nodes is not None else self.grid.z_nodes
+        if z_nodes is None:
+            raise ValueError("Не задано количество узлов квадратуры по z")
+
+        dense_sweep = ScenarioGrid(self.grid.speeds, self.grid.heights, self.grid.plane_nums, self.grid.z_step)
+        quadrature_sweep = ScenarioGrid(self.grid.speeds, self.grid.heights, self.grid.plane_nums, z_nodes=z_nodes)
+        report = {}
+        for plane in stream.planes:
+            dense_grid = dense_sweep.points(plane.sigma_z)
+            quadrature_grid = quadrature_sweep.points(plane.sigma_z)
+            quadrature_weights = quadrature_sweep.weights(plane.sigma_z)
+            tuples = 0
+            max_abs_error = max_rel_error = 0.0
+            for entities in ScenarioStream([plane], stream.purposes, stream.rockets,
+                                           stream.air_defences, stream.reliefs).tuples():
+                dense_means = dict(self._block_partial(entities, dense_grid)[0].items())
+                quadrature_means = dict(self._block_partial(entities, quadrature_grid, quadrature_weights)[0].items())
+                if not dense_means:
+                    continue
+                dense = np.array(list(dense_means.values()))
+                quadrature = np.array([quadrature_means[key] for key in dense_means])
+
+                error = np.abs(quadrature - dense)
+                relative = np.divide(error, np.abs(dense), out=np.zeros_like(error), where=dense != 0)
+                max_abs_error = max(max_abs_error, float(error.max()))
+                max_rel_error = max(max_rel_error, float(relative.max()))
+                tuples += 1
+
+            if tuples:
+                report[plane.name] = {
+                    "tuples": tuples,
+                    "points_dense": len(dense_grid[3]),
+                    "points_quadrature": len(quadrature_grid[3]),
+                    "max_abs_error": max_abs_error,
+                    "max_rel_error": max_rel_error
+                }
+        return report
+
+    def _partials(self):
+        """
+        Частичные агрегаты по блокам сценариев в порядке перебора.
+
+        Итог всегда складывается из агрегатов блоков в одном и том же порядке,
+        поэтому последовательный и параллельный режимы дают одинаковый результат.
+        Агрегаты блоков запоминаются по содержимому объектов: при следующем запуске
+        пересчитываются только блоки с новыми или измененными объектами, а блоки
+        удаленных объектов просто не попадают в сумму.
+        """
+        previous = self._block_partials
+        self._block_partials = {}
+        self.reused_blocks = 0
+        self.computed_blocks = 0
+
+        stream = isinstance(self.data, ScenarioStream)
+        if self.result_cache is not None and stream:
+            # Блоки, которых нет в памяти, ищутся в постоянном кэше
+            missing = [key for key in self._stream_keys() if key not in previous]
+            previous = {**previous, **self.result_cache.get_many(missing)}
+
+        if self._collect_cells:
+            # Агрегаты, посчитанные без ячеек, хранилищу результатов не подходят
+            previous = {key: partial for key, partial in previous.items() if len(partial) > 3}
+
+        if self.workers > 1 and stream:
+            partials = self._parallel_partials(previous)
+        else:
+            partials = self._serial_partials(previous)
+
+        computed = {}
+        finished = False
+        try:
+            for key, partial, size in partials:
+                if key not in previous:
+                    computed[key] = partial
+                self._block_partials[key] = partial
+                yield partial, size
+            finished = True
+        finally:
+            if not finished:
+                # Прерванный запуск не должен терять агрегаты, посчитанные раньше
+                self._block_partials = {**previous, **self._block_partials}
+            if self.result_cache is not None and stream:
+                self.result_cache.put_many(computed)
+
+    def _serial_partials(self, previous: dict):
+        """Агрегаты блоков в текущем процессе; уже посчитанные блоки берутся из previous"""
+        fingerprints = {}
+        for entities, grid in self._blocks():
+            self._check_cancelled()
+            key = self._block_key(entities, grid, fingerprints)
+            partial = previous.get(key)
+            if partial is None:
+                partial = self._block_partial(entities, grid, self._weights(entities), self._collect_cells)
+                self.computed_blocks += 1
+            else:
+                self.reused_blocks += 1
+            yield key, partial, len(grid[3])
+
+    def _parallel_partials(self, previous: dict):
+        """Считает шарды (самолет, ракета) в пуле процессов и отдает агрегаты блоков по порядку"""
+        keys = self._stream_keys()
+        sizes = [self.data.grid.size(entities[0].sigma_z) for entities in self.data.tuples()]
+        pending = {index: previous[key] for index, key in enumerate(keys) if key in previous}
+        self.reused_blocks = len(pending)
+        self.computed_blocks = len(keys) - len(pending)
+
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        finished = False
+        try:
+            futures = [
+                executor.submit(_count_shard, shard, indices, self.vectorized, [index in pending for index in indices],
+                                self.stats is not None, self._collect_cells)
+                for indices, shard in self.data.shards()
+                if not all(index in pending for index in indices)
+            ]
+
+            next_index = 0
+            outstanding = set(futures)
+            while True:
+                while next_index in pending:
+                    yield keys[next_index], pending.pop(next_index), sizes[next_index]
+                    next_index += 1
+                if not outstanding:
+                    break
+                # Ждем любой из шардов короткими интервалами: отмена проверяется все время,
+                # а готовые шарды забираются сразу, даже если выдавать их еще рано
+                done, outstanding = wait(outstanding, timeout=0.1, return_when=FIRST_COMPLETED)
+                self._check_cancelled()
+                for future in done:
+                    results, stats = future.result()
+                    if self.stats is not None:
+                        self.stats.merge(stats)
+                    for index, partial in results:
+                        pending[index] = partial
+            finished = True
+        finally:
+            # При отмене или ошибке не ждем шарды, которые уже считаются, а очередь снимаем
+            executor.shutdown(wait=finished, cancel_futures=not finished)
+
+    def _check_cancelled(self):
+        """Прерывает расчет, если выставлен токен отмены"""
+        if self._cancel is not None:
+            self._cancel.raise_if_cancelled()
+
+    def _stream_keys(self) -> List[str]:
+        """Ключи всех блоков ScenarioStream в порядке перебора (без построения сеток)"""
+        fingerprints = {}
+        return [self._block_key(entities, None, fingerprints) for entities in self.data.tuples()]
+
+    def _run_key(self) -> str:
+        """Ключ запуска: ключи всех блоков потока и параметры адаптивного уточнения сетки"""
+        grid = self.grid
+        return block_key(self._stream_keys(), [grid.adaptive, grid.tolerance, grid.max_points, grid.max_depth])
+
+    def _block_key(self, entities, grid, fingerprints: dict) -> str:
+        """Ключ блока по содержимому объектов, сетке и режиму расчета"""
+        entity_keys = []
+        for entity in entities:
+            if id(entity) not in fingerprints:
+                fingerprints[id(entity)] = entity_fingerprint(entity)
+            entity_keys.append(fingerprints[id(entity)])
+
+        if isinstance(self.data, ScenarioStream):
+            # Сетка потока определяется диапазонами, разбиением z и sigma_z самолета (он уже в отпечатке)
+            grid_key = self.data.grid.definition()
+        else:
+            grid_key = [np.asarray(values).tolist() for values in grid]
+        return block_key(entity_keys, [grid_key, self.vectorized])
+
+    def _weights(self, entities) -> Optional[np.ndarray]:
+        """Веса точек блока: только у потока с квадратурой по z"""
+        if isinstance(self.data, ScenarioStream):
+            return self.data.weights(entities[0])
+        return None
+
+    def _block_partial(self, entities, grid, weights: Optional[np.ndarray] = None, cells: bool = False):
+        """
+        Агрегаты одного блока: суммы K по (самолет, количество), (самолет, ракета) и (самолет, v, h).
+
+        С cells=True четвертый агрегат - ячейки для хранилища результатов:
+        имена всех объектов блока и (v, h, plane_num), ключ в порядке RESULT_COLUMNS.
+        """
+        planeNameAndNumByK = GroupAccumulator()
+        planeAndRocketNameByK = GroupAccumulator()
+        planeNameAndVAndHByK = GroupAccumulator()
+        cellsByK = GroupAccumulator()
+
+        values = self._k_values(entities, grid)
+        if values is not None:
+            plane_name, rocket_name, v, h, plane_num, K = values
+            planeNameAndNumByK.add((plane_name,), [plane_num], K, weights)
+            planeAndRocketNameByK.add((plane_name, rocket_name), [], K, weights)
+            planeNameAndVAndHByK.add((plane_name,), [v, h], K, weights)
+            if cells:
+                _, purpose, _, air_defence, relief = entities
+                cellsByK.add((plane_name, rocket_name, purpose.name, air_defence.name, relief.name),
+                             [v, h, plane_num], K, weights)
+
+        if cells:
+            return planeNameAndNumByK, planeAndRocketNameByK, planeNameAndVAndHByK, cellsByK
+        return planeNameAndNumByK, planeAndRocketNameByK, planeNameAndVAndHByK
+
+    def _k_values(self, entities, grid):
+        """Считает K для всех точек блока; возвращает имена, колонки группировки и массив K"""
+        v, h, plane_num, z = (np.asarray(values) for values in grid)
+        if len(z) == 0:
+            return None
+
+        if not self.vectorized:
+            plane, purpose, rocket, air_defence, relief = entities
+            v_list, h_list, plane_num_list, z_list = v.tolist(), h.tolist(), plane_num.tolist(), z.tolist()
+            K = []
+            for i in range(len(z_list)):
+                data_K = self._calculate_probabilities(CurrentDataSet(
+                    plane=plane,
+                    purpose=purpose,
+                    rocket=rocket,
+                    air_defence=air_defence,
+                    relief=relief,
+                    v=v_list[i],
+                    h=h_list[i],
+                    z=z_list[i],
+                    plane_num=plane_num_list[i]
+                ))
+                K.append(self._cout_K(data_K))
+            return plane.name, rocket.name, v, h, plane_num, np.array(K)
+
+        block = self.engine.calculate_block(*entities, *grid)
+        return block.plane_name, block.rocket_name, v, h, plane_num, block.K()
+
+    def _blocks(self):
+        """Перебирает блоки сценариев с одинаковым набором объектов"""
+        if isinstance(self.data, ScenarioStream):
+            yield from self.data.blocks()
+            return
+
+        # Произвольный список сценариев: группируем подряд идущие с одинаковыми объектами
+        def entities_key(data: CurrentDataSet):
+            return id(data.plane), id(data.purpose), id(data.rocket), id(data.air_defence), id(data.relief)
+
+        for _, group in itertools.groupby(self.data, key=entities_key):
+            group = list(group)
+            first = group[0]
+            yield ((first.plane, first.purpose, first.rocket, first.air_defence, first.relief),
+                   ([d.v for d in group], [d.h for d in group], [d.plane_num for d in group], [d.z for d in group]))
+
+    def calculate_block(self, plane: Plane, purpose: Purpose, rocket: Rocket, air_defence: AirDefense,
+                        relief: Relief, v, h, plane_num, z) -> List[Data_K]:
+        """Считает блок точек сетки для одного набора объектов и возвращает Data_K по каждой точке"""
+        block = self.engine.calculate_block(plane, purpose, rocket, air_defence, relief, v, h, plane_num, z)
+        fields = ["P_def", "P5", "P4", "P_prl1", "P_prl2", "W_a", "W_a_max"]
+        values = {field: getattr(block, field).tolist() for field in fields}
+        return [
+            Data_K(
+                plane_name=block.plane_name,
+                plane_num=plane_num[i],
+                rocket_name=block.rocket_name,
+                v=v[i],
+                h=h[i],
+                z=z[i],
+                **{field: values[field][i] for field in fields}
+            )
+            for i in range(len(block))
+        ]
+
     def _cout_K(self,data: Data_K):
         W = (data.P_def * data.P4 * data.W_a + (data.W_a_max - data.W_a) * data.P_def * data.P5 + (1 - data.W_a_max))
         Q = (1 - data.P_prl1 * data.P_prl2) * data.W_a + (data.W_a_max - data.W_a) * (1 - (1 - data.P_prl1 * data.P_prl2)**2) + (1 - data.W_a_max) * (1 - data.P_prl1)
@@ -224,7 +761,7 @@ class Count():
 
     def _calculate_probabilities(self, data: CurrentDataSet):
         probabSurlData = ProbabSurlData(
-            P_detect=data.air_defence.P_detect,
+            P_detect=curve_for(data.air_defence, "P_detect"),
             n_defense=data.air_defence.n_defense,
             n_rocket_d=data.air_defence.n_rocket_d,
             v_defense=data.air_defence.v_defense,
@@ -247,7 +784,8 @@ class Count():
             n_planes=data.plane_num,
             h=data.h,
             v=data.v,
-            z=data.z
+            z=data.z,
+            defense_index=defense_index(data.air_defence)
         )
         
         P4 = self._P_4(probabSurlData)
@@ -256,14 +794,15 @@ class Count():
         P_prl2 = self._P_prl2(probabSurlData)
 
         D3 = data.z / math.sin(degrees_to_radians(data.plane.psi_max))
-        probab_average = self._choice(data.plane.P_detect, D3)
+        plane_curve = curve_for(data.plane, "P_detect")
+        probab_average = self._choice(plane_curve, D3)
         p_z = self._P_z(data.plane.sigma_z, data.z)
         W_a_max = probab_average * p_z
         # if W_a_max > 1:
         #     print(probab_average, data.plane.P_detect)
 
         D_ob = self._ZVA(probabSurlData)
-        probab_average = self._choice(data.plane.P_detect, D_ob)
+        probab_average = self._choice(plane_curve, D_ob)
         p_z = self._P_z(data.plane.sigma_z, data.z)
         W_a = probab_average * p_z
 
@@ -356,6 +895,16 @@ class Count():
 
         return P_def
 
+    def _spheres(self, data: ProbabSurlData, radius: float, z: float = 0.0):
+        """
+        Номера сфер защиты, которые могут содержать точку на высоте data.h.
+
+        Остальные сферы дают N = 0 и не меняют сумму, поэтому их можно не перебирать.
+        """
+        if data.defense_index is None:
+            return range(data.n_defense)
+        return data.defense_index.candidates(radius, data.h, data.h, z)
+
     def _P_prl1(self, data: ProbabSurlData):
         global P_all_survive
         g = 9.81  # ускорение свободного падения (м/с²)
@@ -365,9 +914,10 @@ class Count():
 
         total_N = 0.0
         N_per_sphere = []
+        steps = 0  # итерации циклов перехвата для инструментации
 
-        # Обработка каждой сферы защиты
-        for i in range(data.n_defense):
+        # Обработка каждой сферы защиты, до которой может дотянуться точка
+        for i in self._spheres(data, data.l_max, abs(data.z)):
             sphere_x = data.x_defense[i]
             sphere_y = data.y_defense[i]
             sphere_radius = data.l_max  # Используем максимальный радиус
@@ -388,6 +938,7 @@ class Count():
             D_pys = segment_length
             N = 0.0
             while D_pys > 0 or N < data.n_rocket_d:
+                steps += 1
                 t_per = D_pys / (data.v + data.v_defense) + data.t_def
                 if t_per * data.v > D_pys:
                     P_detect_current = self._choice(data.P_detect, D_pys)
@@ -404,6 +955,8 @@ class Count():
         # Вероятность, что все самолёты выживут
         P_all_survive = (1 - P_kill)
 
+        if self.stats is not None:
+            self.stats.add("intercept_steps", steps)
         return P_all_survive
     
     def _P_prl2(self, data: ProbabSurlData):
@@ -414,9 +967,10 @@ class Count():
 
         total_N = 0.0
         N_per_sphere = []
+        steps = 0  # итерации циклов перехвата для инструментации
 
-        # Обработка каждой сферы защиты
-        for i in range(data.n_defense):
+        # Обработка каждой сферы защиты, до которой может дотянуться точка
+        for i in self._spheres(data, data.l_max, abs(data.z)):
             sphere_x = data.x_defense[i]
             sphere_y = data.y_defense[i]
             sphere_radius = data.l_max  # Используем максимальный радиус
@@ -437,6 +991,7 @@ class Count():
             D_pys = segment_length
             N = 0.0
             while D_pys > 0 and N < data.n_rocket_d:
+                steps += 1
                 t_per = D_pys / (data.v_defense - data.v) + data.t_def
                 if t_per * data.v > D_pys:
                     P_detect_current = self._choice(data.P_detect, D_pys)
@@ -453,6 +1008,8 @@ class Count():
         # Вероятность, что все самолёты выживут
         P_all_survive = (1 - P_kill)
 
+        if self.stats is not None:
+            self.stats.add("intercept_steps", steps)
         return P_all_survive
     """""
     def _P_5(self, data: ProbabSurlData):
@@ -558,46 +1115,20 @@ class Count():
         return P_all_survive
     """""
     def _P_4(self, data: ProbabSurlData):
-        g = 9.81  # ускорение свободного падения (м/с²)
-
-        # Расчет D1, y_0, fi_0, R
-        sqrt_part = math.sqrt(abs(data.z ** 2 - data.R_min ** 2))
-        D1 = math.sqrt(data.R_min ** 2 + (data.v * data.t_aim) ** 2 + 2 * data.v * data.t_aim * sqrt_part)
-
-        y_0 = math.sqrt(data.R_min ** 2 + (data.v * data.t_aim) ** 2 + 2 * data.v * data.t_aim * math.cos(degrees_to_radians(data.psi_max)))
-        fi_0 = abs(math.asin(degrees_to_radians(data.R_min * math.sin(degrees_to_radians(data.psi_max)) / y_0)))
-        R = data.v ** 2 / (g * math.sqrt(data.gap_max ** 2 - 1))
-
-        # Решение уравнения для alf методом Ньютона
-        def equation(alf):
-            return data.z - (y_0 * math.sin(degrees_to_radians(alf)) + R * (1 - math.cos(degrees_to_radians(alf - fi_0))))
-
-        alf = 0.5
-        tolerance = 1e-6
-        max_iter = 100
-
-        for _ in range(max_iter):
-            f = equation(alf)
-            df = y_0 * math.cos(degrees_to_radians(alf)) - R * math.sin(degrees_to_radians(alf - fi_0))
-            alf_new = alf - f / df
-
-            if abs(alf_new - alf) < tolerance:
-                break
-            alf = alf_new
-
-        # Расчет x_2 и D2
-        x_2 = y_0 * math.cos(degrees_to_radians(alf)) + R * math.sin(degrees_to_radians(alf - fi_0))
-        D2 = math.sqrt(x_2 ** 2 + data.z ** 2)
-
-        # Расчет D3
-        D3 = data.z / math.sin(degrees_to_radians(data.psi_max))
+        # Расчет D1, x_2, D2, D3 (общий с _ZVA кэш геометрии захода)
+        geometry = self._trajectory(data)
+        D1 = geometry.D1
+        x_2 = geometry.x_2_p4
+        D2 = geometry.D2_p4
+        D3 = geometry.D3
 
         total_P_kill = 0.0
         N_per_sphere = []
+        steps = 0  # итерации циклов перехвата для инструментации
         N_sym = 0.0
 
-        # Обработка каждой сферы защиты
-        for i in range(data.n_defense):
+        # Обработка каждой сферы защиты, до которой может дотянуться траектория
+        for i in self._spheres(data, (data.l_min + data.l_max) / 2):
             sphere_x = data.x_defense[i]
             sphere_y = data.y_defense[i]
             sphere_radius = (data.l_min + data.l_max) / 2  # Средний радиус сферы защиты
@@ -620,6 +1151,7 @@ class Count():
 
                 # Расчет количества ракет и вероятности поражения для этого отрезка
                 while D_pys > 0 and N < data.n_rocket_d:
+                    steps += 1
                     t_per = D_pys / (data.v + data.v_defense) + data.t_def
                     if t_per * data.v > D_pys:
                         P_detect_current = self._choice(data.P_detect, D_pys)
@@ -651,6 +1183,7 @@ class Count():
                   D_pys = segment1 + segment2
                   N = 0
                   while D_pys > 0 and N < data.n_rocket_d:
+                        steps += 1
                         t_per = D_pys / (data.v + data.v_defense) + data.t_def
                         if t_per * data.v > D_pys:
                             P_detect_current = self._choice(data.P_detect, D_pys)
@@ -667,6 +1200,8 @@ class Count():
         # Вероятность, что все самолёты выживут
         P_all_survive = (1 - P_kill)
 
+        if self.stats is not None:
+            self.stats.add("intercept_steps", steps)
         return P_all_survive
 
     # def _W_a(self, data: CurrentDataSet, z: int, v: float):
@@ -677,49 +1212,15 @@ class Count():
     #     return W_a
 
     def _ZVA(self, data: ProbabSurlData) -> float:
-        #print('zva')
-        g = 9.81  # ускорение свободного падения (м/с²)
-
-        # Расчет D1
-        sqrt_part = math.sqrt(abs(data.R_min ** 2 - data.z ** 2))
-        D1 = math.sqrt(data.R_min ** 2 + (data.v * data.t_aim) ** 2 + 2 * data.v * data.t_aim * sqrt_part)
-
-        # Расчет y_0 и fi_0
-        y_0 = math.sqrt(data.R_min ** 2 + (data.v * data.t_aim) ** 2 + 2 * data.v * data.t_aim * data.angle_effect)
-        fi_0 = math.asin(degrees_to_radians(data.R_min * data.angle_effect / y_0))
-
-        # Расчет R
-        R = data.v ** 2 / (g * math.sqrt(data.gap_max ** 2 - 1))
-
-        # Решение уравнения для alf (итеративный метод)
-        def equation(alf):
-            return data.z - (y_0 * math.sin(degrees_to_radians(alf)) + R * (1 - math.cos(degrees_to_radians(alf - fi_0))))
-
-        # Начальное приближение
-        alf = 0.5
-        tolerance = 1e-6
-        max_iter = 100
-
-        for i in range(max_iter):
-            #print(i)
-            f = equation(alf)
-            df = y_0 * math.cos(degrees_to_radians(alf)) - R * math.sin(degrees_to_radians(alf - fi_0))
-
-            alf_new = alf - f / df
-
-            if abs(alf_new - alf) < tolerance:
-                break
-            alf = alf_new
-
-        # Расчет x_2 и D2
-        x_2 = y_0 * math.cos(degrees_to_radians(alf)) + R * math.sin(degrees_to_radians(alf - fi_0))
-        D2 = math.sqrt(x_2 ** 2 + data.z ** 2)
-
-        # Расчет D3
-        D3 = data.z / math.sin(degrees_to_radians(data.psi_max))
+        # Расчет D1, D2, D3 (общий с _P_4 кэш геометрии захода)
+        geometry = self._trajectory(data)
 
         # Выбор максимальной дистанции
-        return max(D1, D2, D3)
+        return max(geometry.D1, geometry.D2_zva, geometry.D3)
+
+    def _trajectory(self, data: ProbabSurlData) -> TrajectoryGeometry:
+        """Геометрия захода из кэша: метод Ньютона решается один раз на набор входных параметров"""
+        return self.trajectories.get(data.v, data.z, data.R_min, data.t_aim, data.psi_max, data.gap_max, data.angle_effect)
     
     def _P_z(self, sigma_z: float, z: float) -> float:
         """
@@ -742,52 +1243,29 @@ class Count():
         С проверкой на пустые значения и некорректные входные данные.
 
         Параметры:
-        P_detect (list of lists): Двумерный массив, где первый столбец - значения D, второй - соответствующие значения P.
+        P_detect (list of lists | ProbabilityCurve): Двумерный массив, где первый столбец - значения D, второй - соответствующие значения P,
+            или уже скомпилированная таблица.
         D_ob (float): Значение D, для которого нужно найти соответствующее P.
 
         Возвращает:
         float: Найденное значение P или None при ошибке.
         """
-        # Проверка на пустые входные данные
-        if not P_detect or not isinstance(P_detect, list) or len(P_detect) == 0:
-            return None
-
-        try:
-            # Извлекаем первый столбец (значения D)
-            D_values = [row[0] for row in P_detect]
-
-            # Проверка, что D_ob - число
-            if not isinstance(D_ob, (int, float)):
+        # Уже скомпилированная таблица (см. probability_curve.curve_for)
+        if isinstance(P_detect, ProbabilityCurve):
+            curve = P_detect
+        else:
+            # Проверка на пустые входные данные
+            if not isinstance(P_detect, (list, np.ndarray)) or len(P_detect) == 0:
                 return None
-
-            # Сортируем массив по D_values
-            P_detect_sorted = sorted(P_detect, key=lambda x: x[0])
-            D_sorted = [row[0] for row in P_detect_sorted]
-            P_sorted = [row[1] for row in P_detect_sorted]
-
-            # Проверка на пустой массив после сортировки
-            if not D_sorted:
+            curve = ProbabilityCurve.from_points(P_detect)
+            if curve is None:
                 return None
 
-            # Используем bisect для поиска позиции
-            pos = bisect.bisect_left(D_sorted, D_ob)
-
-            if pos == 0:
-                return P_sorted[0]
-            elif pos == len(D_sorted):
-                return P_sorted[-1]
-            elif D_sorted[pos] == D_ob:
-                return P_sorted[pos]
-            else:
-                # Проверка на возможность интерполяции
-                if pos >= len(D_sorted) or pos - 1 < 0:
-                    return None
-                return (P_sorted[pos - 1] + P_sorted[pos]) / 2
-
-        except (TypeError, IndexError) as e:
-            # Обработка возможных ошибок
-            print(f"Error in _choice: {e}")
+        # Проверка, что D_ob - число
+        if not isinstance(D_ob, (int, float)):
             return None
+
+        return curve.lookup_scalar(D_ob)
     """
     def _choice(self, P_detect: List[List[float]], D_ob: float) -> Optional[float]:
         
@@ -806,18 +1284,14 @@ class Count():
         return sum(x[1] for x in closest) / 2
          """
 
-class NumberContainer:
-    def __init__(self, int_value: int, float_value: float):
-        self.int_value = int_value
-        self.float_value = float_value
-
-    def __add__(self, other):
-        if isinstance(other, NumberContainer):
-            new_int = self.int_value + other.int_value
-            new_float = self.float_value + other.float_value
-            return NumberContainer(new_int, new_float)
-        else:
-            raise TypeError("Unsupported operand type for +: expected 'NumberContainer'")
-
-    def __repr__(self):
-        return f"NumberContainer(int_value={self.int_value}, float_value={self.float_value})"
\ No newline at end of file
+def _count_shard(shard: ScenarioStream, indices: List[int], vectorized: bool, skip: List[bool] = None,
+                 instrument: bool = False, cells: bool = False):
+    """
+    Расчет одного шарда в процессе пула: агрегаты блоков вместе с их номерами (кроме пропускаемых)
+    и показания инструментации процесса (None, если она выключена)
+    """
+    counter = Count(None, vectorized=vectorized, instrument=instrument)
+    skip = skip if skip is not None else [False] * len(indices)
+    results = [(index, counter._block_partial(entities, grid, shard.weights(entities[0]), cells))
+               for index, skipped, (entities, grid) in zip(indices, skip, shard.blocks()) if not skipped]
+    return results, counter.stats
@@ -1,14 +1,131 @@
 import sqlite3
 import json
+import threading
+import math
+import struct
 import numpy as np
 from typing import Optional, Union, List
 from entities import *
+from probability_curve import compile_curves
+from connection_pool import ConnectionPool
+
+# Таблицы для каждого класса объектов
+TABLES = {
+    Plane: "planes",
+    Rocket: "rockets",
+    Purpose: "purposes",
+    AirDefense: "air_defenses",
+    Relief: "reliefs",
+}
+
+
+# Сигнатура бинарного массива в базе. Формат: сигнатура, dtype (3 байта, например '<f8'),
+# число измерений (1 байт), размеры (uint32), выравнивание до 8 байт, затем данные
+ARRAY_MAGIC = b"NDA1"
+
+# Разобранные коды dtype из заголовков
+_dtypes = {}
+
+
+def _array_to_blob(value) -> Optional[bytes]:
+    """Массив в бинарный формат; None, если значение нельзя представить прямоугольным числовым массивом"""
+    try:
+        array = np.ascontiguousarray(value, dtype="<f8")
+    except (TypeError, ValueError):
+        return None
+    header = ARRAY_MAGIC + array.dtype.str.encode() + struct.pack(f"<B{array.ndim}I", array.ndim, *array.shape)
+    return header + bytes(-len(header) % 8) + array.tobytes()
+
+
+def _array_from_blob(value: bytes) -> np.ndarray:
+    """Массив из бинарного формата без копирования данных (только для чтения)"""
+    if value[:4] != ARRAY_MAGIC:
+        raise ValueError("Unknown array format")
+    code = value[4:7]
+    dtype = _dtypes.get(code)
+    if dtype is None:
+        dtype = _dtypes.setdefault(code, np.dtype(code.decode()))
+    ndim = value[7]
+    shape = struct.unpack_from(f"<{ndim}I", value, 8)
+    offset = 8 + 4 * ndim
+    array = np.frombuffer(value, dtype=dtype, count=math.prod(shape), offset=offset + -offset % 8)
+    return array if ndim == 1 else array.reshape(shape)
+
+
+def _identity(value):
+    return value
+
+
+def _decode_table(value):
+    """P_detect, P_see: двумерный массив (бинарный массив или JSON в базе)"""
+    if isinstance(value, bytes):
+        array = _array_from_blob(value)
+        return array if array.ndim == 2 else array.reshape(1, -1)
+    if not isinstance(value, str):
+        return value if isinstance(value, list) else [[value]]
+    try:
+        loaded = json.loads(value)
+    except json.JSONDecodeError:
+        return [[]]
+    if isinstance(loaded, list):
+        # Одномерный список оборачивается, двумерный остается как есть
+        return loaded if loaded and isinstance(loaded[0], list) else [loaded]
+    return [[loaded]]
+
+
+def _decode_list(value):
+    """x_defense, y_defense: одномерный список (бинарный массив или JSON в базе)"""
+    if isinstance(value, bytes):
+        array = _array_from_blob(value)
+        if array.ndim >= 2:
+            # Из двумерного массива берется первая строка
+            return array[0] if len(array) else array.reshape(0)
+        return array.reshape(-1)
+    if not isinstance(value, str):
+        return value if isinstance(value, list) else [value]
+    try:
+        loaded = json.loads(value)
+    except json.JSONDecodeError:
+        return []
+    if isinstance(loaded, list):
+        # Из двумерного массива берется первая строка
+        return loaded[0] if loaded and isinstance(loaded[0], list) else loaded
+    return [loaded]
+
+
+# Декодеры колонок с массивами (бинарный формат, в старых записях - JSON)
+_DECODERS = {
+    'P_detect': _decode_table,
+    'P_see': _decode_table,
+    'x_defense': _decode_list,
+    'y_defense': _decode_list,
+}
 
 class DatabaseManager:
-    def __init__(self, db_name: str = "military_data.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db_name: str = "military_data.db", pragmas: Optional[dict] = None):
+        """
+        :param db_name: файл базы данных
+        :param pragmas: настройки соединений (по умолчанию connection_pool.PRAGMAS, режим WAL)
+        """
+        self.pool = ConnectionPool(db_name, pragmas)
+        self._identity = {}  # карта объектов: класс -> {id: объект}
+        self._complete = set()  # классы, которые загружены в карту целиком
+        self._identity_lock = threading.RLock()
+        self._table_columns = {}  # таблица -> колонки
+        self._plans = {}  # (класс, колонки) -> план декодирования строк
         self._create_tables()
+        self._versions = self.versions()  # версии таблиц, с которыми согласована карта объектов
+        self._seen = threading.local()  # последний data_version соединения потока
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        return self.pool.connection()
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Курсор текущего потока"""
+        return self.pool.cursor()
 
     def _create_tables(self):
         """Создает таблицы в базе данных в соответствии с моделями классов"""
@@ -86,6 +203,24 @@ class DatabaseManager:
             P_see TEXT
         )
         """)
+
+        # Версии таблиц объектов: триггеры увеличивают версию при любом изменении строк,
+        # в том числе сделанном в обход DatabaseManager или из другого процесса
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        for table in TABLES.values():
+            self.cursor.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self.cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+                """)
         
         self.conn.commit()
 
@@ -93,9 +228,14 @@ class DatabaseManager:
         """Конвертирует объект в словарь для сохранения в БД"""
         data = vars(obj).copy()
         
-        # Конвертируем numpy массивы и списки в JSON
+        # Колонки массивов храним в бинарном формате, остальные numpy массивы и списки - в JSON
         for key, value in data.items():
-            if isinstance(value, np.ndarray):
+            if key in _DECODERS and isinstance(value, (list, np.ndarray)):
+                stored = _array_to_blob(value)
+                if stored is None:
+                    stored = json.dumps(value.tolist() if isinstance(value, np.ndarray) else value)
+                data[key] = stored
+            elif isinstance(value, np.ndarray):
                 data[key] = json.dumps(value.tolist())
             elif isinstance(value, list):
                 data[key] = json.dumps(value)  # Преобразуем списки в JSON
@@ -106,68 +246,284 @@ class DatabaseManager:
 
     def _dict_to_object(self, data: dict, obj_class):
         """Конвертирует словарь из БД в объект с учетом разных типов полей"""
-
-        def convert_value(x):
-            """Конвертирует значение в float, если возможно"""
-            try:
-                return float(x) if isinstance(x, (int, float, str)) else x
-            except (ValueError, TypeError):
-                return 0.0
-
         obj = obj_class()
-
         for key, value in data.items():
-            if value is None:
-                continue
-
-            # Поля, которые должны быть двумерными массивами
-            if key in ['P_detect', 'P_see']:
-                if isinstance(value, str):
-                    try:
-                        loaded = json.loads(value)
-                        # Убедимся, что это двумерный массив
-                        if isinstance(loaded, list):
-                            if loaded and isinstance(loaded[0], list):
-                                # Это уже двумерный массив - оставляем как есть
-                                setattr(obj, key, loaded)
-                            else:
-                                # Делаем двумерным (оборачиваем в список)
-                                setattr(obj, key, [loaded])
-                        else:
-                            # Одиночное значение - делаем двумерным
-                            setattr(obj, key, [[loaded]])
-                    except json.JSONDecodeError:
-                        setattr(obj, key, [[]])  # Пустой двумерный массив
-                else:
-                    setattr(obj, key, value if isinstance(value, list) else [[value]])
-
-            # Поля, которые должны быть одномерными списками
-            elif key in ['x_defense', 'y_defense']:
-                if isinstance(value, str):
-                    try:
-                        loaded = json.loads(value)
-                        # Убедимся, что это одномерный список
-                        if isinstance(loaded, list):
-                            if loaded and isinstance(loaded[0], list):
-                                # Если это двумерный массив, берем первую строку
-                                setattr(obj, key, loaded[0])
-                            else:
-                                # Это уже одномерный список
-                                setattr(obj, key, loaded)
-                        else:
-                            # Одиночное значение - делаем списком
-                            setattr(obj, key, [loaded])
-                    except json.JSONDecodeError:
-                        setattr(obj, key, [])  # Пустой одномерный список
-                else:
-                    setattr(obj, key, value if isinstance(value, list) else [value])
-
-            # Все остальные поля
-            else:
-                setattr(obj, key, value)
+            if value is not None:
+                setattr(obj, key, _DECODERS.get(key, _identity)(value))
 
+        # Таблицы вероятностей сортируются один раз при загрузке, а не при каждом поиске
+        compile_curves(obj)
         return obj
 
+    def migrate_arrays(self) -> int:
+        """
+        Переводит массивы, сохраненные в JSON, в бинарный формат одной транзакцией.
+
+        Чтение понимает оба формата, поэтому миграция необязательна и ее можно
+        прервать; возвращает количество переведенных значений. Запускается только явно
+        (python fill_bd.py --migrate-arrays): прежние версии приложения бинарный формат не читают.
+        """
+        converted = 0
+        with self.conn:
+            for table in TABLES.values():
+                for column in [column for column in self._columns(table) if column in _DECODERS]:
+                    self.cursor.execute(f"SELECT id, {column} FROM {table} WHERE typeof({column}) = 'text'")
+                    updates = []
+                    for row_id, text in self.cursor.fetchall():
+                        blob = _array_to_blob(_DECODERS[column](text))
+                        if blob is not None:
+                            updates.append((blob, row_id))
+                    self.cursor.executemany(f"UPDATE {table} SET {column}=? WHERE id=?", updates)
+                    converted += len(updates)
+        if converted:
+            self.invalidate()
+        return converted
+
+    def _columns(self, table: str) -> List[str]:
+        """Колонки таблицы (читаются из схемы один раз)"""
+        columns = self._table_columns.get(table)
+        if columns is None:
+            self.cursor.execute(f"PRAGMA table_info({table})")
+            columns = [row[1] for row in self.cursor.fetchall()]
+            self._table_columns[table] = columns
+        return columns
+
+    def _row_factory(self, obj_class, description):
+        """
+        Фабрика строк sqlite3, которая сразу строит объект obj_class.
+
+        План декодирования (имя атрибута и функция для каждой колонки) строится
+        один раз на класс и набор колонок.
+        """
+        names = tuple(column[0] for column in description)
+        plan = self._plans.get((obj_class, names))
+        if plan is None:
+            plan = [(name, _DECODERS.get(name, _identity)) for name in names]
+            self._plans[(obj_class, names)] = plan
+
+        def build(cursor, row):
+            obj = obj_class()
+            attributes = obj.__dict__
+            for (name, decode), value in zip(plan, row):
+                if value is not None:
+                    attributes[name] = decode(value)
+            # Таблицы вероятностей сортируются один раз при загрузке, а не при каждом поиске
+            compile_curves(obj)
+            return obj
+        return build
+
+    def _select(self, obj_class, where: str = "", params: tuple = (), columns: List[str] = None) -> list:
+        """
+        Общий путь загрузки: SELECT из таблицы класса и построение объектов фабрикой строк.
+
+        columns ограничивает набор загружаемых колонок (id загружается всегда),
+        остальные атрибуты остаются значениями по умолчанию.
+        """
+        table = TABLES[obj_class]
+        if columns is None:
+            selected = "*"
+        else:
+            unknown = set(columns) - set(self._columns(table))
+            if unknown:
+                raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+            selected = ', '.join(['id'] + [column for column in columns if column != 'id'])
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT {selected} FROM {table}{where}", params)
+            cursor.row_factory = self._row_factory(obj_class, cursor.description)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def get(self, obj_class: BASE_CLASSES_TYPE, obj_id: int, columns: List[str] = None):
+        """Получает объект класса obj_class по ID (None, если его нет)"""
+        if columns is None:
+            found = self.get_by_ids(obj_class, [obj_id])
+        else:
+            found = self._select(obj_class, " WHERE id=?", (obj_id,), columns)
+        return found[0] if found else None
+
+    def get_all(self, obj_class: BASE_CLASSES_TYPE, columns: List[str] = None) -> list:
+        """
+        Получает все объекты класса obj_class.
+
+        Полные объекты берутся из карты объектов: если она не менялась с прошлой
+        полной загрузки, запроса к базе нет, иначе загружаются только недостающие строки.
+        Объекты общие для всех вызывающих: измененный объект нужно сохранить через
+        update_*, иначе изменения увидят и другие.
+        """
+        if columns is not None:
+            return self._select(obj_class, columns=columns)
+        self._revalidate()
+        with self._identity_lock:
+            entities = self._identity.setdefault(obj_class, {})
+            if obj_class in self._complete:
+                return list(entities.values())
+            if not entities:
+                # Карта пуста: вся таблица одним запросом
+                self._identity[obj_class] = {obj.id: obj for obj in self._select(obj_class)}
+                self._complete.add(obj_class)
+                return list(self._identity[obj_class].values())
+
+            self.cursor.execute(f"SELECT id FROM {TABLES[obj_class]}")
+            ids = [row[0] for row in self.cursor.fetchall()]
+            self._load_missing(obj_class, ids)
+            # Порядок карты - порядок строк в таблице
+            self._identity[obj_class] = {obj_id: entities[obj_id] for obj_id in ids}
+            self._complete.add(obj_class)
+            return list(self._identity[obj_class].values())
+
+    def get_by_ids(self, obj_class: BASE_CLASSES_TYPE, obj_ids: List[int], columns: List[str] = None) -> list:
+        """Получает объекты класса obj_class по списку ID (в порядке возрастания ID)"""
+        if not obj_ids:
+            return []
+        if columns is not None:
+            placeholders = ','.join(['?'] * len(obj_ids))
+            return self._select(obj_class, f" WHERE id IN ({placeholders})", tuple(obj_ids), columns)
+        self._revalidate()
+        with self._identity_lock:
+            self._load_missing(obj_class, obj_ids)
+            entities = self._identity[obj_class]
+            return [entities[obj_id] for obj_id in sorted(set(obj_ids)) if obj_id in entities]
+
+    def _load_missing(self, obj_class, obj_ids: List[int]):
+        """Загружает в карту объектов строки obj_ids, которых в ней еще нет"""
+        entities = self._identity.setdefault(obj_class, {})
+        missing = [obj_id for obj_id in obj_ids if obj_id not in entities]
+        # Не больше 500 параметров в одном запросе (ограничение SQLite на число переменных)
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for obj in self._select(obj_class, f" WHERE id IN ({placeholders})", tuple(chunk)):
+                entities[obj.id] = obj
+
+    def versions(self) -> dict:
+        """Версии таблиц по классам: версия растет при каждом изменении строк таблицы"""
+        self.cursor.execute("SELECT name, version FROM table_versions")
+        by_table = dict(self.cursor.fetchall())
+        return {obj_class: by_table.get(table, 0) for obj_class, table in TABLES.items()}
+
+    def changed_since(self, versions: dict) -> set:
+        """Классы, таблицы которых изменились с момента, когда были получены versions"""
+        current = self.versions()
+        return {obj_class for obj_class, version in current.items() if versions.get(obj_class) != version}
+
+    def data_version(self) -> int:
+        """
+        PRAGMA data_version соединения текущего потока.
+
+        Меняется, когда базу изменило другое соединение (другой поток или процесс);
+        собственные изменения соединения его не меняют.
+        """
+        self.cursor.execute("PRAGMA data_version")
+        return self.cursor.fetchone()[0]
+
+    def _revalidate(self):
+        """
+        Сбрасывает в карте объектов классы, измененные другими соединениями.
+
+        Обычно это один PRAGMA data_version; версии таблиц читаются, только если он изменился.
+        """
+        data_version = self.data_version()
+        if getattr(self._seen, "data_version", None) == data_version:
+            return
+        self._seen.data_version = data_version
+        with self._identity_lock:
+            current = self.versions()
+            for obj_class, version in current.items():
+                if self._versions.get(obj_class) != version:
+                    self.invalidate(obj_class)
+            self._versions = current
+
+    def _added(self, obj_class):
+        """В таблицу добавлены строки: загруженные объекты остаются, но карта класса уже не полная"""
+        with self._identity_lock:
+            self._complete.discard(obj_class)
+
+    def invalidate(self, obj_class: BASE_CLASSES_TYPE = None, obj_id: int = None):
+        """
+        Сбрасывает карту объектов: запись obj_id класса obj_class, весь класс или всю карту.
+
+        Методы save/update/delete вызывают его сами; снаружи он нужен, если базу
+        изменили в обход DatabaseManager.
+        """
+        with self._identity_lock:
+            if obj_class is None:
+                self._identity.clear()
+                self._complete.clear()
+                return
+            self._complete.discard(obj_class)
+            if obj_id is None:
+                self._identity.pop(obj_class, None)
+            else:
+                self._identity.get(obj_class, {}).pop(obj_id, None)
+
+    def _table(self, obj) -> str:
+        table = TABLES.get(type(obj))
+        if table is None:
+            raise ValueError(f"Unsupported type: {type(obj)}")
+        return table
+
+    def save_many(self, objects: list) -> List[int]:
+        """
+        Сохраняет объекты (любых классов) одной транзакцией через executemany.
+
+        Возвращает ID новых записей в порядке objects.
+        """
+        groups = {}
+        for position, obj in enumerate(objects):
+            table = self._table(obj)
+            obj_data = self._object_to_dict(obj)
+            groups.setdefault((table, tuple(obj_data.keys())), []).append((position, tuple(obj_data.values())))
+
+        ids = [None] * len(objects)
+        with self.conn:
+            for (table, columns), rows in groups.items():
+                placeholders = ', '.join(['?'] * len(columns))
+                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+                if 'id' in columns:
+                    # Объекты с собственным id (например, из другой базы) сохраняют его,
+                    # ID таких строк не идут подряд - берем lastrowid каждой вставки
+                    for position, values in rows:
+                        self.cursor.execute(sql, values)
+                        ids[position] = self.cursor.lastrowid
+                    continue
+                self.cursor.executemany(sql, [values for _, values in rows])
+                # Внутри одной транзакции AUTOINCREMENT выдает ID подряд
+                self.cursor.execute("SELECT last_insert_rowid()")
+                first_id = self.cursor.fetchone()[0] - len(rows) + 1
+                for offset, (position, _) in enumerate(rows):
+                    ids[position] = first_id + offset
+        for obj_class in {type(obj) for obj in objects}:
+            self._added(obj_class)
+        return ids
+
+    def update_many(self, objects: list) -> int:
+        """
+        Обновляет объекты (любых классов) одной транзакцией через executemany.
+
+        Объекты без id пропускаются. Возвращает количество обновленных записей.
+        """
+        groups = {}
+        for obj in objects:
+            if getattr(obj, 'id', None) is None:
+                continue
+            table = self._table(obj)
+            obj_data = self._object_to_dict(obj)
+            groups.setdefault((table, tuple(obj_data.keys())), []).append(tuple(obj_data.values()) + (obj.id,))
+
+        updated = 0
+        with self.conn:
+            for (table, columns), rows in groups.items():
+                updates = ', '.join([f"{key}=?" for key in columns])
+                self.cursor.executemany(f"UPDATE {table} SET {updates} WHERE id=?", rows)
+                updated += self.cursor.rowcount
+        for obj in objects:
+            if getattr(obj, 'id', None) is not None:
+                self.invalidate(type(obj), obj.id)
+        return updated
+
     def get_all_objects(self, type: BASE_CLASSES_TYPE):
         if type == Plane:
             return self.get_all_planes()
@@ -192,31 +548,16 @@ class DatabaseManager:
         sql = f"INSERT INTO planes ({columns}) VALUES ({placeholders})"
         self.cursor.execute(sql, tuple(plane_data.values()))
         self.conn.commit()
+        self._added(Plane)
         return self.cursor.lastrowid
 
     def get_plane(self, plane_id: int) -> Optional[Plane]:
         """Получает Plane по ID"""
-        self.cursor.execute("SELECT * FROM planes WHERE id=?", (plane_id,))
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-            
-        columns = [column[0] for column in self.cursor.description]
-        plane_data = dict(zip(columns, row))
-        return self._dict_to_object(plane_data, Plane)
+        return self.get(Plane, plane_id)
 
     def get_all_planes(self) -> List[Plane]:
         """Получает все Plane из базы"""
-        self.cursor.execute("SELECT * FROM planes")
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            plane_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(plane_data, Plane))
-        
-        return result
+        return self.get_all(Plane)
 
     def update_plane(self, plane: Plane) -> bool:
         """Обновляет данные Plane в базе"""
@@ -231,12 +572,14 @@ class DatabaseManager:
         
         self.cursor.execute(sql, params)
         self.conn.commit()
+        self.invalidate(Plane, plane.id)
         return self.cursor.rowcount > 0
 
     def delete_plane(self, plane_id: int) -> bool:
         """Удаляет Plane из базы"""
         self.cursor.execute("DELETE FROM planes WHERE id=?", (plane_id,))
         self.conn.commit()
+        self.invalidate(Plane, plane_id)
         return self.cursor.rowcount > 0
 
     # Методы для работы с Rocket
@@ -249,31 +592,16 @@ class DatabaseManager:
         sql = f"INSERT INTO rockets ({columns}) VALUES ({placeholders})"
         self.cursor.execute(sql, tuple(rocket_data.values()))
         self.conn.commit()
+        self._added(Rocket)
         return self.cursor.lastrowid
 
     def get_rocket(self, rocket_id: int) -> Optional[Rocket]:
         """Получает Rocket по ID"""
-        self.cursor.execute("SELECT * FROM rockets WHERE id=?", (rocket_id,))
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-            
-        columns = [column[0] for column in self.cursor.description]
-        rocket_data = dict(zip(columns, row))
-        return self._dict_to_object(rocket_data, Rocket)
+        return self.get(Rocket, rocket_id)
 
     def get_all_rockets(self) -> List[Rocket]:
         """Получает все Rocket из базы"""
-        self.cursor.execute("SELECT * FROM rockets")
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            rocket_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(rocket_data, Rocket))
-        
-        return result
+        return self.get_all(Rocket)
 
     def update_rocket(self, rocket: Rocket) -> bool:
         """Обновляет данные Rocket в базе"""
@@ -288,12 +616,14 @@ class DatabaseManager:
         
         self.cursor.execute(sql, params)
         self.conn.commit()
+        self.invalidate(Rocket, rocket.id)
         return self.cursor.rowcount > 0
 
     def delete_rocket(self, rocket_id: int) -> bool:
         """Удаляет Rocket из базы"""
         self.cursor.execute("DELETE FROM rockets WHERE id=?", (rocket_id,))
         self.conn.commit()
+        self.invalidate(Rocket, rocket_id)
         return self.cursor.rowcount > 0
 
     # Методы для работы с Purpose
@@ -306,31 +636,16 @@ class DatabaseManager:
         sql = f"INSERT INTO purposes ({columns}) VALUES ({placeholders})"
         self.cursor.execute(sql, tuple(purpose_data.values()))
         self.conn.commit()
+        self._added(Purpose)
         return self.cursor.lastrowid
 
     def get_purpose(self, purpose_id: int) -> Optional[Purpose]:
         """Получает Purpose по ID"""
-        self.cursor.execute("SELECT * FROM purposes WHERE id=?", (purpose_id,))
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-            
-        columns = [column[0] for column in self.cursor.description]
-        purpose_data = dict(zip(columns, row))
-        return self._dict_to_object(purpose_data, Purpose)
+        return self.get(Purpose, purpose_id)
 
     def get_all_purposes(self) -> List[Purpose]:
         """Получает все Purpose из базы"""
-        self.cursor.execute("SELECT * FROM purposes")
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            purpose_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(purpose_data, Purpose))
-        
-        return result
+        return self.get_all(Purpose)
 
     def update_purpose(self, purpose: Purpose) -> bool:
         """Обновляет данные Purpose в базе"""
@@ -345,12 +660,14 @@ class DatabaseManager:
         
         self.cursor.execute(sql, params)
         self.conn.commit()
+        self.invalidate(Purpose, purpose.id)
         return self.cursor.rowcount > 0
 
     def delete_purpose(self, purpose_id: int) -> bool:
         """Удаляет Purpose из базы"""
         self.cursor.execute("DELETE FROM purposes WHERE id=?", (purpose_id,))
         self.conn.commit()
+        self.invalidate(Purpose, purpose_id)
         return self.cursor.rowcount > 0
 
     # Методы для работы с AirDefense
@@ -363,31 +680,16 @@ class DatabaseManager:
         sql = f"INSERT INTO air_defenses ({columns}) VALUES ({placeholders})"
         self.cursor.execute(sql, tuple(air_defense_data.values()))
         self.conn.commit()
+        self._added(AirDefense)
         return self.cursor.lastrowid
 
     def get_air_defense(self, air_defense_id: int) -> Optional[AirDefense]:
         """Получает AirDefense по ID"""
-        self.cursor.execute("SELECT * FROM air_defenses WHERE id=?", (air_defense_id,))
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-            
-        columns = [column[0] for column in self.cursor.description]
-        air_defense_data = dict(zip(columns, row))
-        return self._dict_to_object(air_defense_data, AirDefense)
+        return self.get(AirDefense, air_defense_id)
 
     def get_all_air_defenses(self) -> List[AirDefense]:
         """Получает все AirDefense из базы"""
-        self.cursor.execute("SELECT * FROM air_defenses")
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            air_defense_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(air_defense_data, AirDefense))
-        
-        return result
+        return self.get_all(AirDefense)
 
     def update_air_defense(self, air_defense: AirDefense) -> bool:
         """Обновляет данные AirDefense в базе"""
@@ -402,12 +704,14 @@ class DatabaseManager:
         
         self.cursor.execute(sql, params)
         self.conn.commit()
+        self.invalidate(AirDefense, air_defense.id)
         return self.cursor.rowcount > 0
 
     def delete_air_defense(self, air_defense_id: int) -> bool:
         """Удаляет AirDefense из базы"""
         self.cursor.execute("DELETE FROM air_defenses WHERE id=?", (air_defense_id,))
         self.conn.commit()
+        self.invalidate(AirDefense, air_defense_id)
         return self.cursor.rowcount > 0
 
     # Методы для работы с Relief
@@ -420,31 +724,16 @@ class DatabaseManager:
         sql = f"INSERT INTO reliefs ({columns}) VALUES ({placeholders})"
         self.cursor.execute(sql, tuple(relief_data.values()))
         self.conn.commit()
+        self._added(Relief)
         return self.cursor.lastrowid
 
     def get_relief(self, relief_id: int) -> Optional[Relief]:
         """Получает Relief по ID"""
-        self.cursor.execute("SELECT * FROM reliefs WHERE id=?", (relief_id,))
-        row = self.cursor.fetchone()
-        if not row:
-            return None
-            
-        columns = [column[0] for column in self.cursor.description]
-        relief_data = dict(zip(columns, row))
-        return self._dict_to_object(relief_data, Relief)
+        return self.get(Relief, relief_id)
 
     def get_all_reliefs(self) -> List[Relief]:
         """Получает все Relief из базы"""
-        self.cursor.execute("SELECT * FROM reliefs")
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            relief_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(relief_data, Relief))
-        
-        return result
+        return self.get_all(Relief)
 
     def update_relief(self, relief: Relief) -> bool:
         """Обновляет данные Relief в базе"""
@@ -459,12 +748,14 @@ class DatabaseManager:
         
         self.cursor.execute(sql, params)
         self.conn.commit()
+        self.invalidate(Relief, relief.id)
         return self.cursor.rowcount > 0
 
     def delete_relief(self, relief_id: int) -> bool:
         """Удаляет Relief из базы"""
         self.cursor.execute("DELETE FROM reliefs WHERE id=?", (relief_id,))
         self.conn.commit()
+        self.invalidate(Relief, relief_id)
         return self.cursor.rowcount > 0
     
     # Методы для получения наборов объектов по массиву ID
@@ -472,96 +763,31 @@ class DatabaseManager:
     # Для самолетов
     def get_planes_by_ids(self, plane_ids: List[int]) -> List[Plane]:
         """Получает несколько Plane по списку ID"""
-        if not plane_ids:
-            return []
-            
-        placeholders = ','.join(['?'] * len(plane_ids))
-        self.cursor.execute(f"SELECT * FROM planes WHERE id IN ({placeholders})", plane_ids)
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            plane_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(plane_data, Plane))
-        
-        return result
+        return self.get_by_ids(Plane, plane_ids)
 
     # Для ракет
     def get_rockets_by_ids(self, rocket_ids: List[int]) -> List[Rocket]:
         """Получает несколько Rocket по списку ID"""
-        if not rocket_ids:
-            return []
-            
-        placeholders = ','.join(['?'] * len(rocket_ids))
-        self.cursor.execute(f"SELECT * FROM rockets WHERE id IN ({placeholders})", rocket_ids)
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            rocket_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(rocket_data, Rocket))
-        
-        return result
+        return self.get_by_ids(Rocket, rocket_ids)
 
     # Для целей
     def get_purposes_by_ids(self, purpose_ids: List[int]) -> List[Purpose]:
         """Получает несколько Purpose по списку ID"""
-        if not purpose_ids:
-            return []
-            
-        placeholders = ','.join(['?'] * len(purpose_ids))
-        self.cursor.execute(f"SELECT * FROM purposes WHERE id IN ({placeholders})", purpose_ids)
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            purpose_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(purpose_data, Purpose))
-        
-        return result
+        return self.get_by_ids(Purpose, purpose_ids)
 
     # Для систем ПВО
     def get_air_defenses_by_ids(self, air_defense_ids: List[int]) -> List[AirDefense]:
         """Получает несколько AirDefense по списку ID"""
-        if not air_defense_ids:
-            return []
-            
-        placeholders = ','.join(['?'] * len(air_defense_ids))
-        self.cursor.execute(f"SELECT * FROM air_defenses WHERE id IN ({placeholders})", air_defense_ids)
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            air_defense_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(air_defense_data, AirDefense))
-        
-        return result
+        return self.get_by_ids(AirDefense, air_defense_ids)
 
     # Для рельефа
     def get_reliefs_by_ids(self, relief_ids: List[int]) -> List[Relief]:
         """Получает несколько Relief по списку ID"""
-        if not relief_ids:
-            return []
-            
-        placeholders = ','.join(['?'] * len(relief_ids))
-        self.cursor.execute(f"SELECT * FROM reliefs WHERE id IN ({placeholders})", relief_ids)
-        rows = self.cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            columns = [column[0] for column in self.cursor.description]
-            relief_data = dict(zip(columns, row))
-            result.append(self._dict_to_object(relief_data, Relief))
-        
-        return result
+        return self.get_by_ids(Relief, relief_ids)
 
     def close(self):
-        """Закрывает соединение с базой данных"""
-        self.conn.close()
+        """Закрывает соединения с базой данных всех потоков"""
+        self.pool.close()
 
 # Пример использования
 if __name__ == "__main__":
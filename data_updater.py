@@ -3,6 +3,7 @@ from tkinter import ttk
 import tkinter as tk
 from graph import LinearGraph, BarGraph
 from count import Count
+from progress import CancellationToken, CountCancelled
 from window_builder import WindowBuilder
 
 class DataUpdater:
@@ -19,6 +20,14 @@ class DataUpdater:
         # Настраиваем кнопку обновления
         self.update_button = self.window.update_button
         self.update_button.config(command=self._start_update_process)
+
+        # Кнопка отмены показывается рядом с кнопкой обновления только во время расчета
+        self.cancel_button = ttk.Button(
+            self.window.update_button.master,
+            text="Отмена",
+            command=self._cancel_update
+        )
+        self.cancel_token = None
         
         # Создаем элементы для отображения статуса обновления
         self.status_frame = ttk.Frame(self.window.update_button.master)
@@ -31,7 +40,8 @@ class DataUpdater:
             self.status_frame,
             orient=tk.HORIZONTAL,
             length=100,
-            mode='indeterminate'
+            mode='determinate',
+            maximum=100
         )
         
         # Изначально скрываем элементы статуса
@@ -42,11 +52,37 @@ class DataUpdater:
         # Блокируем кнопку на время обновления
         self.update_button.config(state=tk.DISABLED)
         self._show_status("Обновление данных...")
-        self.progress.start()
-        self.count.dataCollection()
+        self.progress.config(value=0)
+        self.cancel_token = CancellationToken()
+        self.cancel_button.config(state=tk.NORMAL)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5, after=self.update_button)
+        try:
+            self.count.dataCollection()
+        except Exception as e:
+            # Без этого кнопка обновления осталась бы заблокированной, а кнопка отмены - видимой
+            self._finish_update(success=False, error_msg=str(e))
+            return
         
         # Запускаем обновление в отдельном потоке
-        threading.Thread(target=self._update_data, daemon=True).start()
+        threading.Thread(target=self._update_data, args=(self.cancel_token,), daemon=True).start()
+
+    def _cancel_update(self):
+        """Просит поток расчета остановиться"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.loading_label.config(text="Отмена...", foreground="black")
+
+    def _show_progress(self, token, event):
+        """Показывает ход расчета (в основном потоке)"""
+        # События отмененного запуска могут прийти уже после начала нового
+        if token is not self.cancel_token or token.cancelled:
+            return
+        self.progress.config(value=event.fraction * 100)
+        text = f"Обновление данных... {event.done}/{event.total}, {event.rate:.0f} сц/с"
+        if event.eta is not None:
+            text += f", осталось ~{event.eta:.0f} с"
+        self.loading_label.config(text=text)
 
     def _validate_graph_data(self, dataGraf1, dataGraf2, dataGraf3):
         """Проверяет данные графиков на корректность"""
@@ -97,22 +133,32 @@ class DataUpdater:
         #     if not isinstance(value, (int, float)):
         #         raise TypeError(f"{graph_name}: Значения должны быть числами, получен {type(value)} для категории {category}")
 
-    def _update_data(self):
+    def _update_data(self, token: CancellationToken):
         """Основная функция обновления данных"""
+        # Итог запуска; _finish_update вызывается в любом случае (finally)
+        outcome = {"success": False, "error_msg": "Расчет прерван"}
         try:
             # Получаем новые данные
-            dataGraf1, dataGraf2, dataGraf3 = self.count.count()
+            dataGraf1, dataGraf2, dataGraf3 = self.count.count(
+                progress=lambda event: self.window.root.after(0, lambda: self._show_progress(token, event)),
+                cancel=token
+            )
             
             # Комплексная проверка данных
             self._validate_graph_data(dataGraf1, dataGraf2, dataGraf3)
             
             # Обновляем графики в основном потоке
             self.window.root.after(0, lambda: self._update_charts(dataGraf1, dataGraf2, dataGraf3))
-            self.window.root.after(0, lambda: self._finish_update(success=True))
+            outcome = {"success": True}
             
+        except CountCancelled:
+            outcome = {"success": False, "cancelled": True}
+
         except Exception as e:
-            error_msg = str(e)
-            self.window.root.after(0, lambda: self._finish_update(success=False, error_msg=error_msg))
+            outcome = {"success": False, "error_msg": str(e)}
+
+        finally:
+            self.window.root.after(0, lambda: self._finish_update(**outcome))
 
     def _update_charts(self, dataGraf1, dataGraf2, dataGraf3):
         """Обновляет графики с новыми данными"""
@@ -157,12 +203,17 @@ class DataUpdater:
         self.loading_label.config(text="")
         self.status_frame.pack_forget()
 
-    def _finish_update(self, success=True, error_msg=None):
+    def _finish_update(self, success=True, error_msg=None, cancelled=False):
         """Завершает процесс обновления"""
         self.progress.stop()
+        self.cancel_button.pack_forget()
+        self.cancel_token = None
         
         if success:
+            self.progress.config(value=100)
             self.loading_label.config(text="Готово!", foreground="green")
+        elif cancelled:
+            self.loading_label.config(text="Отменено", foreground="black")
         else:
             self.loading_label.config(text=f"Ошибка: {error_msg}", foreground="red")
             print(f"Ошибка: {error_msg}")
@@ -170,5 +221,5 @@ class DataUpdater:
         self.update_button.config(state=tk.NORMAL)
         
         # Прячем статус через 3 секунды (если ошибка) или 2 секунды (если успех)
-        delay = 10000 if not success else 2000
+        delay = 10000 if not success and not cancelled else 2000
         self.window.root.after(delay, self._hide_status_elements)
\ No newline at end of file
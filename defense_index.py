@@ -0,0 +1,76 @@
+import weakref
+import numpy as np
+from typing import List
+from entities import AirDefense
+
+# При малом числе сфер перебор всех быстрее, чем поиск по индексу
+BRUTE_FORCE_LIMIT = 16
+
+# Запас на округление: индекс может вернуть лишнюю сферу, но не потерять нужную
+SLACK = 1e-9
+
+
+class DefenseIndex:
+    """
+    Пространственный индекс сфер ПВО.
+
+    Сферы отсортированы по y; запрос по диапазону высот [h_min, h_max] бинарным поиском
+    выбирает сферы, чей y попадает в этот диапазон с запасом radius, и оставляет
+    только те, до которых траектория (x = 0) может дотянуться с учетом x и z.
+    Возвращаемые номера идут по возрастанию, поэтому суммы по сферам
+    складываются в том же порядке, что и при полном переборе.
+    """
+
+    def __init__(self, x_defense, y_defense, n_defense: int):
+        self.n = int(n_defense)
+        self._x = np.array([float(x_defense[i]) for i in range(self.n)])
+        self._y = np.array([float(y_defense[i]) for i in range(self.n)])
+        self._order = np.argsort(self._y, kind="stable")
+        self._y_sorted = self._y[self._order]
+        self._all = list(range(self.n))
+        self._queries = {}
+
+    def candidates(self, radius: float, h_min: float, h_max: float, z_min: float = 0.0) -> List[int]:
+        """Номера сфер радиуса radius, которые могут содержать точки с h в [h_min, h_max] и |z| >= z_min"""
+        if self.n <= BRUTE_FORCE_LIMIT:
+            return self._all
+
+        key = (radius, h_min, h_max, z_min)
+        found = self._queries.get(key)
+        if found is None:
+            reach = radius * (1 + SLACK)
+            lo = np.searchsorted(self._y_sorted, h_min - reach, side="left")
+            hi = np.searchsorted(self._y_sorted, h_max + reach, side="right")
+            indices = self._order[lo:hi]
+
+            x = self._x[indices]
+            y = self._y[indices]
+            dy = np.maximum(0, np.maximum(h_min - y, y - h_max))
+            near = x ** 2 + dy ** 2 + z_min ** 2 <= reach ** 2
+            found = np.sort(indices[near]).tolist()
+
+            if len(self._queries) >= 4096:
+                self._queries.clear()
+            self._queries[key] = found
+        return found
+
+
+# Индексы объектов ПВО: объект -> (исходные x, y, n_defense, индекс)
+_indexes = weakref.WeakKeyDictionary()
+
+
+def defense_index(air_defence: AirDefense) -> DefenseIndex:
+    """
+    Индекс сфер объекта ПВО.
+
+    Строится один раз и пересобирается, только если x_defense, y_defense
+    или n_defense объекта заменили.
+    """
+    source = (air_defence.x_defense, air_defence.y_defense, air_defence.n_defense)
+    cached = _indexes.get(air_defence)
+    if cached is not None and cached[0] is source[0] and cached[1] is source[1] and cached[2] == source[2]:
+        return cached[3]
+
+    index = DefenseIndex(*source)
+    _indexes[air_defence] = (*source, index)
+    return index
@@ -1,10 +1,166 @@
+import argparse
 from data_base import DatabaseManager
 from entities import *
 import numpy as np
 
-def main():
+# Типы боевых частей ракет
+ROCKET_TYPES = ["фугас", "кумулятив"]
+
+
+def _curve(rng: np.random.Generator, d_max: float, points: int) -> list:
+    """Убывающая таблица [[D, P], ...]: P = 1 на нуле, 0 на d_max, промежуточные точки случайны"""
+    D = np.sort(rng.uniform(0, d_max, points - 2))
+    P = np.sort(rng.uniform(0, 1, points - 2))[::-1]
+    return ([[0.0, 1.0]]
+            + [[round(float(d), 1), round(float(p), 3)] for d, p in zip(D, P)]
+            + [[round(float(d_max), 1), 0.0]])
+
+
+def generate_catalog(n_planes: int = 1000, n_rockets: int = 1000, n_purposes: int = 100,
+                     n_air_defenses: int = 1000, n_reliefs: int = 100, seed: int = 0) -> dict:
+    """
+    Синтетический каталог объектов: {класс: [объекты]}.
+
+    Одинаковый seed дает одинаковый каталог. Параметры берутся из диапазонов вокруг
+    реальных объектов main(); у ПВО от 1 до 8 позиций (x_defense, y_defense).
+    """
+    rng = np.random.default_rng(seed)
+
+    planes = []
+    for i in range(n_planes):
+        plane = Plane()
+        plane.name = f"Самолет {i + 1}"
+        plane.n_rocket = int(rng.integers(2, 9))
+        plane.sigma_z = float(rng.choice([300.0, 400.0, 500.0, 600.0]))
+        plane.psi_max = round(float(rng.uniform(40, 65)), 1)
+        plane.t_aim = round(float(rng.uniform(4, 10)), 1)
+        plane.gap_max = int(rng.integers(5, 10))
+        plane.visibility = round(float(rng.uniform(2, 4)), 1)
+        plane.P_detect = _curve(rng, float(rng.uniform(6000, 12000)), int(rng.integers(3, 7)))
+        planes.append(plane)
+
+    rockets = []
+    for i in range(n_rockets):
+        rocket = Rocket()
+        rocket.name = f"Ракета {i + 1}"
+        rocket.type = ROCKET_TYPES[int(rng.integers(len(ROCKET_TYPES)))]
+        rocket.R_min = round(float(rng.uniform(1000, 3000)), 1)
+        rocket.R_max = round(float(rng.uniform(6000, 12000)), 1)
+        rocket.midle_speed = round(float(rng.uniform(300, 900)), 1)
+        rocket.angle_effect = float(rng.choice([30.0, 40.0, 45.0]))
+        rockets.append(rocket)
+
+    purposes = []
+    for i in range(n_purposes):
+        purpose = Purpose()
+        purpose.name = f"Цель {i + 1}"
+        purpose.a = round(float(rng.uniform(3, 12)), 1)
+        purpose.b = round(float(rng.uniform(2, 6)), 1)
+        purpose.h = round(float(rng.uniform(1.5, 4)), 1)
+        purpose.R_defeat = round(float(rng.uniform(1, 4)), 1)
+        purpose.average_number = float(rng.integers(1, 6))
+        purposes.append(purpose)
+
+    air_defenses = []
+    for i in range(n_air_defenses):
+        air_defense = AirDefense()
+        air_defense.name = f"ПВО {i + 1}"
+        air_defense.n_defense = int(rng.integers(1, 9))
+        air_defense.n_rocket_d = int(rng.integers(2, 9))
+        air_defense.v_defense = round(float(rng.uniform(400, 900)), 1)
+        air_defense.t_passive = round(float(rng.uniform(3, 8)), 1)
+        air_defense.t_changing = round(float(rng.uniform(3, 12)), 1)
+        air_defense.t_def = round(float(rng.uniform(2, 10)), 1)
+        # Позиции комплексов разбросаны вокруг цели; y не дальше 1500 м, чтобы сфера
+        # среднего радиуса накрывала все z в пределах трех sigma_z (иначе модель не определена)
+        air_defense.x_defense = np.round(rng.uniform(-4000, 4000, air_defense.n_defense), 1).tolist()
+        air_defense.y_defense = np.round(rng.uniform(0, 1500, air_defense.n_defense), 1).tolist()
+        air_defense.l_min = round(float(rng.uniform(500, 1000)), 1)
+        air_defense.l_max = round(float(rng.uniform(5000, 10000)), 1)
+        air_defense.angle_effect = 90.0
+        air_defense.width_defense = round(float(rng.uniform(3000, 6000)), 1)
+        air_defense.h_max = round(float(rng.uniform(3000, 6000)), 1)
+        air_defense.P_defeat = round(float(rng.uniform(0.4, 0.9)), 2)
+        air_defense.P_detect = _curve(rng, float(rng.uniform(20000, 40000)), int(rng.integers(3, 7)))
+        air_defenses.append(air_defense)
+
+    reliefs = []
+    for i in range(n_reliefs):
+        relief = Relief()
+        relief.name = f"Рельеф {i + 1}"
+        relief.P_see = _curve(rng, float(rng.uniform(10000, 30000)), int(rng.integers(3, 7)))
+        reliefs.append(relief)
+
+    return {Plane: planes, Rocket: rockets, Purpose: purposes, AirDefense: air_defenses, Relief: reliefs}
+
+
+def write_catalog(db_name: str, catalog: dict) -> dict:
+    """
+    Записывает каталог в базу db_name (DatabaseManager.save_many, одна транзакция на класс).
+
+    Возвращает количество записанных объектов по классам.
+    """
+    db = DatabaseManager(db_name)
+    try:
+        return {obj_class: len(db.save_many(objects)) for obj_class, objects in catalog.items()}
+    finally:
+        db.close()
+
+
+def _save_demo(db: DatabaseManager, obj_class, rows: list):
+    """Сохраняет демонстрационные объекты одной транзакцией и печатает их ID"""
+    objects = []
+    for row in rows:
+        obj = obj_class()
+        for key, value in row.items():
+            setattr(obj, key, value)
+        objects.append(obj)
+    for obj, obj_id in zip(objects, db.save_many(objects)):
+        print(f"  - {obj.name} (ID: {obj_id})")
+
+
+def generate(argv=None):
+    """
+    Режим генератора: python fill_bd.py --generate --db big.db --planes 5000 ...
+
+    python fill_bd.py --migrate-arrays --db military_data.db - перевод массивов базы в бинарный формат.
+    """
+    parser = argparse.ArgumentParser(description="Заполнение базы данных")
+    parser.add_argument("--generate", action="store_true", help="синтетический каталог вместо демонстрационных объектов")
+    parser.add_argument("--db", default="military_data.db")
+    parser.add_argument("--planes", type=int, default=1000)
+    parser.add_argument("--rockets", type=int, default=1000)
+    parser.add_argument("--purposes", type=int, default=100)
+    parser.add_argument("--air-defenses", type=int, default=1000)
+    parser.add_argument("--reliefs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--migrate-arrays", action="store_true",
+                        help="перевести массивы из JSON в бинарный формат (прежние версии его не читают)")
+    args = parser.parse_args(argv)
+
+    if args.migrate_arrays:
+        db = DatabaseManager(args.db)
+        try:
+            converted = db.migrate_arrays()
+        finally:
+            db.close()
+        print(f"В базе {args.db} переведено значений: {converted}")
+        return
+
+    if not args.generate:
+        main(args.db)
+        return
+
+    catalog = generate_catalog(args.planes, args.rockets, args.purposes, args.air_defenses, args.reliefs, args.seed)
+    written = write_catalog(args.db, catalog)
+    for obj_class, count in written.items():
+        print(f"  - {BASE_CLASSES_MAP[obj_class]}: {count}")
+    print(f"\nБаза данных {args.db} заполнена синтетическими объектами (seed={args.seed})")
+
+
+def main(db_name: str = "military_data.db"):
     # Создаем подключение к базе данных
-    db = DatabaseManager()
+    db = DatabaseManager(db_name)
     
     try:
         # Заполняем таблицу самолетов
@@ -42,12 +198,7 @@ def main():
         ]
         
         print("Добавляем самолеты:")
-        for plane_data in planes:
-            plane = Plane()
-            for key, value in plane_data.items():
-                setattr(plane, key, value)
-            plane_id = db.save_plane(plane)
-            print(f"  - {plane.name} (ID: {plane_id})")
+        _save_demo(db, Plane, planes)
         
         # Заполняем таблицу ракет
         rockets = [
@@ -71,12 +222,7 @@ def main():
         ]
         
         print("\nДобавляем ракеты:")
-        for rocket_data in rockets:
-            rocket = Rocket()
-            for key, value in rocket_data.items():
-                setattr(rocket, key, value)
-            rocket_id = db.save_rocket(rocket)
-            print(f"  - {rocket.name} (ID: {rocket_id})")
+        _save_demo(db, Rocket, rockets)
         
         # Заполняем таблицу целей
         purposes = [
@@ -94,12 +240,7 @@ def main():
         ]
         
         print("\nДобавляем цели:")
-        for purpose_data in purposes:
-            purpose = Purpose()
-            for key, value in purpose_data.items():
-                setattr(purpose, key, value)
-            purpose_id = db.save_purpose(purpose)
-            print(f"  - {purpose.name} (ID: {purpose_id})")
+        _save_demo(db, Purpose, purposes)
         
         # Заполняем таблицу систем ПВО
         air_defenses = [
@@ -124,12 +265,7 @@ def main():
         ]
         
         print("\nДобавляем системы ПВО:")
-        for air_defense_data in air_defenses:
-            air_defense = AirDefense()
-            for key, value in air_defense_data.items():
-                setattr(air_defense, key, value)
-            air_defense_id = db.save_air_defense(air_defense)
-            print(f"  - {air_defense.name} (ID: {air_defense_id})")
+        _save_demo(db, AirDefense, air_defenses)
         
         # Заполняем таблицу рельефа
         reliefs = [
@@ -141,12 +277,7 @@ def main():
         ]
         
         print("\nДобавляем рельефы:")
-        for relief_data in reliefs:
-            relief = Relief()
-            for key, value in relief_data.items():
-                setattr(relief, key, value)
-            relief_id = db.save_relief(relief)
-            print(f"  - {relief.name} (ID: {relief_id})")
+        _save_demo(db, Relief, reliefs)
         
         print("\nБаза данных успешно заполнена!")
         
@@ -156,4 +287,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    generate()
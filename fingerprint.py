@@ -0,0 +1,48 @@
+import hashlib
+import json
+import numpy as np
+
+# Поля, которые не влияют на расчет
+IGNORED_FIELDS = {"id"}
+
+# Версия модели расчета: увеличивается при любом изменении формул вероятностей
+# (_P_4, _ZVA, _polygon, кривые и т.д.), чтобы агрегаты, сохраненные в постоянном
+# кэше прежней версией, не использовались
+MODEL_VERSION = 1
+
+
+def _plain(value):
+    """Приводит массивы NumPy к спискам для сериализации"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Unsupported value type: {type(value).__name__}")
+
+
+def entity_fingerprint(obj) -> str:
+    """
+    Отпечаток содержимого объекта: одинаковые по данным объекты дают одинаковый отпечаток.
+
+    Учитываются тип объекта и все его публичные поля, кроме id.
+    """
+    fields = {key: value for key, value in vars(obj).items()
+              if key not in IGNORED_FIELDS and not key.startswith("_")}
+    payload = json.dumps([type(obj).__name__, fields], sort_keys=True, default=_plain)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def array_key(*arrays) -> str:
+    """Ключ содержимого массивов NumPy (тип, форма и значения) вместо копии самих данных"""
+    digest = hashlib.sha1()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode("utf-8"))
+        digest.update(array.data)
+    return digest.hexdigest()
+
+
+def block_key(fingerprints, grid_key) -> str:
+    """Ключ блока сценариев: версия модели, отпечатки набора объектов и описание сетки"""
+    payload = json.dumps([MODEL_VERSION, list(fingerprints), grid_key], default=_plain)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
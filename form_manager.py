@@ -227,6 +227,7 @@ class DataViewer:
         frame = self._create_scrollable_frame(window)
         tree, scroll_x, scroll_y = self._create_treeview_with_scrollbars(frame)
         
+        data = self._complex_value(data)
         if isinstance(data, list) and data:
             self._setup_and_populate_list_data(tree, data)
         else:
@@ -293,7 +294,7 @@ class DataViewer:
         values = []
         for col in columns:
             value = getattr(item, col)
-            if isinstance(value, (list, dict)) and value:
+            if self._complex_value(value) is not None:
                 values.append("Показать массив")
             else:
                 values.append(str(value))
@@ -301,10 +302,19 @@ class DataViewer:
 
     def _has_complex_data(self, item: Any, columns: List[str]) -> bool:
         """Проверяет, есть ли в объекте сложные данные (списки/словари)"""
-        return any(
-            isinstance(getattr(item, col), (list, dict)) and getattr(item, col)
-            for col in columns
-        )
+        return any(self._complex_value(getattr(item, col)) is not None for col in columns)
+
+    def _complex_value(self, value: Any) -> Union[List, Dict, None]:
+        """
+        Непустой список/словарь для просмотра в отдельном окне или None.
+
+        Массивы из базы загружаются как np.ndarray, для отображения они переводятся в списки.
+        """
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        if isinstance(value, (list, dict)) and value:
+            return value
+        return None
 
     def _setup_double_click_handler(self, tree: ttk.Treeview, item_id_to_index: Dict[str, int], 
                                   data: List[Any], columns: List[str]) -> None:
@@ -319,9 +329,9 @@ class DataViewer:
                 return
                 
             item_data = data[item_id_to_index[item_id]]
-            value = getattr(item_data, col_name)
+            value = self._complex_value(getattr(item_data, col_name))
             
-            if isinstance(value, (list, dict)) and value:
+            if value is not None:
                 self.show_complex_data(value, col_name)
         
         tree.bind("<Double-1>", on_item_double_click)
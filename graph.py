@@ -1,10 +1,54 @@
 import numpy as np
 import tkinter as tk
 from tkinter import ttk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib.figure import Figure
 import copy
-from matplotlib import ticker
+import types
+
+# matplotlib (вместе с бэкендом TkAgg) импортируется при первом построении графика,
+# а не при импорте модуля: окно приложения появляется, не дожидаясь его загрузки
+_matplotlib = None
+
+# Загруженные иконки: (путь, размер) -> PhotoImage или None, если загрузить не удалось
+_icons = {}
+
+ZOOM_ICON = "pictures/zoom_icon.png"
+
+
+def matplotlib_modules():
+    """Модули matplotlib, нужные графикам (импортируются один раз)"""
+    global _matplotlib
+    if _matplotlib is None:
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+        from matplotlib import ticker
+        _matplotlib = types.SimpleNamespace(
+            FigureCanvasTkAgg=FigureCanvasTkAgg,
+            NavigationToolbar2Tk=NavigationToolbar2Tk,
+            Figure=Figure,
+            ticker=ticker
+        )
+    return _matplotlib
+
+
+def load_icon(path, size=(16, 16)):
+    """
+    Иконка из файла, уменьшенная до size.
+
+    Файл читается и масштабируется один раз, все графики используют один PhotoImage.
+    Если иконку загрузить не удалось, возвращается None (кнопка будет текстовой).
+    """
+    key = (path, size)
+    if key not in _icons:
+        try:
+            from PIL import Image, ImageTk
+            image = Image.open(path)
+            image = image.resize(size, Image.LANCZOS)
+            _icons[key] = ImageTk.PhotoImage(image)
+        except Exception as e:
+            print(f"Не удалось загрузить иконку: {e}")
+            _icons[key] = None
+    return _icons[key]
+
 
 class BaseGraph:
     """Базовый класс для графиков с общими методами"""
@@ -15,29 +59,16 @@ class BaseGraph:
         self.toolbar = None
         self.zoom_button = None
         self.zoom_icon = None
-        # Загружаем иконку при инициализации
-        self._load_zoom_icon()
     
     def _setup_figure(self, figsize=(8, 4), dpi=100):
         """Настройка базовой фигуры"""
-        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.figure = matplotlib_modules().Figure(figsize=figsize, dpi=dpi)
         self.ax = self.figure.add_subplot(111)
-    
-    def _load_zoom_icon(self):
-        """Загружает иконку лупы из файла"""
-        try:
-            from PIL import Image, ImageTk
-            # Предполагаем, что файл называется 'zoom_icon.png' и лежит в той же папке
-            image = Image.open("pictures/zoom_icon.png")
-            image = image.resize((16, 16), Image.LANCZOS)  # Ресайз до нужного размера
-            self.zoom_icon = ImageTk.PhotoImage(image)
-        except Exception as e:
-            print(f"Не удалось загрузить иконку: {e}")
-            # Фолбэк на простую текстовую кнопку
-            self.zoom_icon = None
 
     def _create_zoom_button(self, parent):
         """Создает кнопку увеличения с загруженной иконкой или текстом"""
+        # Иконка общая для всех графиков и загружается при первой кнопке
+        self.zoom_icon = load_icon(ZOOM_ICON)
         if self.zoom_icon:
             btn = tk.Button(
                 parent,
@@ -81,7 +112,8 @@ class BaseGraph:
                 self.zoom_button.destroy()
         
         # Создаем canvas
-        self.canvas = FigureCanvasTkAgg(self.figure, master=root)
+        mpl = matplotlib_modules()
+        self.canvas = mpl.FigureCanvasTkAgg(self.figure, master=root)
         self.canvas.draw()
         
         # Настройки по умолчанию для pack()
@@ -95,7 +127,7 @@ class BaseGraph:
         
         # Добавляем панель инструментов если требуется
         if show_toolbar:
-            self.toolbar = NavigationToolbar2Tk(self.canvas, root)
+            self.toolbar = mpl.NavigationToolbar2Tk(self.canvas, root)
             self.toolbar.update()
             canvas_widget.pack(**default_pack_options)
         
@@ -117,12 +149,13 @@ class BaseGraph:
         fig_copy = copy.deepcopy(self.figure)
         
         # Создаем canvas для нового окна
-        canvas = FigureCanvasTkAgg(fig_copy, master=new_window)
+        mpl = matplotlib_modules()
+        canvas = mpl.FigureCanvasTkAgg(fig_copy, master=new_window)
         canvas.draw()
         canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         
         # Добавляем панель инструментов
-        toolbar = NavigationToolbar2Tk(canvas, new_window)
+        toolbar = mpl.NavigationToolbar2Tk(canvas, new_window)
         toolbar.update()
         canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         
@@ -180,6 +213,7 @@ class BarGraph(BaseGraph):
     
     def build(self, x_label="", y_label="", title="", grid=True, y_range=None, y_margin=0.1):
         self._setup_figure()
+        ticker = matplotlib_modules().ticker
         
         default_params = {
             'color': 'blue',
@@ -253,6 +287,7 @@ class LinearGraph(BaseGraph):
     
     def build(self, x_label="X", y_label="Y", title="", grid=True, y_margin=0.1):
         self._setup_figure()
+        ticker = matplotlib_modules().ticker
         
         default_params = {
             'color': None,
@@ -0,0 +1,79 @@
+import functools
+import time
+from collections import defaultdict
+
+
+class Instrumentation:
+    """
+    Счетчики и таймеры горячих участков расчета.
+
+    Методы оборачиваются только при включенной инструментации (см. Count(instrument=True)),
+    поэтому выключенная она ничего не стоит. Время вызова - полное, вместе с вложенными
+    вызовами (как cumtime у cProfile).
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.times = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.scenarios = 0
+        self.elapsed = 0.0
+
+    def wrap(self, name: str, function):
+        """Обертка, которая считает вызовы function и их суммарное время"""
+        calls = self.calls
+        times = self.times
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[name] += perf_counter() - start
+                calls[name] += 1
+        return timed
+
+    def instrument(self, obj, names, prefix: str = ""):
+        """Заменяет методы объекта обертками (атрибутами экземпляра)"""
+        for name in names:
+            setattr(obj, name, self.wrap(prefix + name, getattr(obj, name)))
+
+    def add(self, name: str, n: int = 1):
+        """Увеличивает счетчик"""
+        self.counters[name] += n
+
+    def merge(self, other: "Instrumentation"):
+        """Добавляет показания другого экземпляра (например, из процесса пула)"""
+        for name, value in other.calls.items():
+            self.calls[name] += value
+        for name, value in other.times.items():
+            self.times[name] += value
+        for name, value in other.counters.items():
+            self.counters[name] += value
+
+    def reset(self):
+        """Обнуляет все показания"""
+        self.calls.clear()
+        self.times.clear()
+        self.counters.clear()
+        self.scenarios = 0
+        self.elapsed = 0.0
+
+    def report(self) -> dict:
+        """Структурированный отчет: вызовы с временем, счетчики и скорость расчета"""
+        return {
+            "calls": {
+                name: {
+                    "count": self.calls[name],
+                    "total_s": self.times[name],
+                    "mean_s": self.times[name] / self.calls[name] if self.calls[name] else 0.0
+                }
+                for name in sorted(self.calls, key=lambda name: -self.times[name])
+            },
+            "counters": dict(self.counters),
+            "scenarios": self.scenarios,
+            "elapsed_s": self.elapsed,
+            "scenarios_per_s": self.scenarios / self.elapsed if self.elapsed > 0 else 0.0
+        }
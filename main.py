@@ -1,37 +1,61 @@
-from graph import *
-from window_builder import WindowBuilder
+import time
+_start = time.perf_counter()
+
+import sys
 import tkinter as tk
-from data_base import DatabaseManager
-from form_manager import FormManager
-from count import Count
-from data_updater import DataUpdater
-from error_handler import ErrorHandler
-from db_cache import DBCache
-from entities import *
+from startup import StartupTimer
+from window_builder import WindowBuilder
 
-# Пример использования
-if __name__ == "__main__":
-    root = tk.Tk()
-    root.geometry("1500x1000")
+
+def start_subsystems(root, window, timer, save_results=False):
+    """
+    Запускает тяжелые подсистемы: базу данных, формы и расчет.
+
+    Вызывается после того, как главное окно показано; модули расчета (numpy и др.)
+    импортируются здесь же, а matplotlib - при первом построении графиков.
+    save_results включает хранилище результатов запусков (results.db).
+    """
+    from data_base import DatabaseManager
+    from form_manager import FormManager
+    from count import Count
+    from result_cache import ResultCache
+    from result_store import ResultStore
+    from data_updater import DataUpdater
+    from error_handler import ErrorHandler
+    from db_cache import DBCache
+    from entities import BASE_CLASSES_MAP
+    timer.mark("импорт подсистем")
 
     error_handler = ErrorHandler()
     cache = DBCache()
 
-    window = WindowBuilder(root)
-    window.build()
-
     db = DatabaseManager()
+    timer.mark("база данных")
 
     for i, type in enumerate(BASE_CLASSES_MAP.keys()):
         FormManager(db, window.forms_data[i], type, cache, error_handler)
+    timer.mark("формы")
 
-    count = Count(db, cache)
+    # --save-results: результаты запусков сохраняются, графики строятся запросами к results.db
+    results = ResultStore() if save_results else None
+    count = Count(db, cache, result_cache=ResultCache(), results=results)
 
     # Создаем объект для обновления данных
-    data_updater = DataUpdater(
+    DataUpdater(
         count=count,
         window_builder=window
     )
+    window.update_button.config(state=tk.NORMAL)
+    timer.mark("расчет")
+
+    draw_placeholders(window)
+    timer.mark("графики")
+
+
+def draw_placeholders(window):
+    """Пустые графики в областях окна до первого расчета (matplotlib загружается здесь)"""
+    import numpy as np
+    from graph import LinearGraph, BarGraph, ScatterGraph
 
     graph = LinearGraph()
     graph.build(x_label="количество", y_label="эфективность")
@@ -53,21 +77,48 @@ if __name__ == "__main__":
     np.random.seed(42)
     x = np.random.rand(50) * 10
     y = np.random.rand(50) * 10
-    sizes = np.random.rand(50) * 100
 
     graph = ScatterGraph()
     graph.add_data_set(x, y)
     graph.build(x_label="v", y_label="k")
     graph.display(window.chart_area_5)
 
-    root.mainloop()
 
+# Пример использования
+if __name__ == "__main__":
+    # --measure-startup: вывести время этапов запуска и закрыть приложение
+    measure = "--measure-startup" in sys.argv[1:]
+    # --save-results: сохранять результаты запусков в results.db
+    save_results = "--save-results" in sys.argv[1:]
+    timer = StartupTimer(_start)
+
+    root = tk.Tk()
+    root.geometry("1500x1000")
+
+    window = WindowBuilder(root)
+    window.build()
+    # Построить графики можно только после запуска подсистем
+    window.update_button.config(state=tk.DISABLED)
+
+    # Показываем окно сразу, графики-заготовки рисуются после запуска подсистем
+    root.update()
+    timer.mark("окно показано")
+
+    def start():
+        start_subsystems(root, window, timer, save_results)
+        if measure:
+            print(timer.report())
+            root.destroy()
+
+    root.after(0, start)
+    root.mainloop()
 
 '''
 Описания основных компонентов приложения(в порядке вызова):
 
     * WindowBuilder() - Заполняет графическое окно пустыми контейнерами(для последующего заполнения графичискими элементами),
-с необходимыми характеристиками(размер, местоположение и т.д.)
+с необходимыми характеристиками(размер, местоположение и т.д.). Окно показывается сразу, остальные компоненты
+создаются в start_subsystems() уже после этого
 
     * DatabaseManager() - Подключается/создает базу данных, предоставляет функции для управления данными
 
@@ -0,0 +1,125 @@
+import bisect
+import weakref
+import numpy as np
+from typing import Optional
+from entities import *
+from fingerprint import array_key
+
+# Поля объектов, которые хранят таблицы вероятностей (дальность, вероятность)
+CURVE_FIELDS = {
+    Plane: ["P_detect"],
+    AirDefense: ["P_detect"],
+    Relief: ["P_see"]
+}
+
+
+class ProbabilityCurve:
+    """
+    Таблица вероятностей, заранее отсортированная по дальности.
+
+    Поиск повторяет Count._choice: точное совпадение дальности дает свое значение,
+    между точками берется среднее соседних, за пределами таблицы - крайние значения.
+    Работает как для одного числа, так и для массива дальностей.
+    """
+
+    def __init__(self, D_values: np.ndarray, P_values: np.ndarray):
+        self.D_values = D_values
+        self.P_values = P_values
+        # Списки для скалярного поиска: bisect по списку быстрее, чем NumPy на одном числе
+        self._D_list = D_values.tolist()
+        self._P_list = P_values.tolist()
+        self._key = None
+
+    @property
+    def key(self) -> str:
+        """Ключ содержимого таблицы для кэшей расчета (таблица после создания не меняется)"""
+        if self._key is None:
+            self._key = array_key(self.D_values, self.P_values)
+        return self._key
+
+    @classmethod
+    def from_points(cls, points) -> Optional["ProbabilityCurve"]:
+        """Строит таблицу из строк [D, P, ...]; для пустых и некорректных данных возвращает None"""
+        if points is None or len(points) == 0:
+            return None
+        if isinstance(points, np.ndarray) and points.ndim == 2 and points.shape[1] >= 2:
+            # Массив из базы: столбцы берутся срезами, без обхода строк
+            D_values = points[:, 0].astype(float)
+            P_values = points[:, 1].astype(float)
+            order = np.argsort(D_values, kind="stable")
+            return cls(D_values[order], P_values[order])
+        try:
+            D_values = np.array([row[0] for row in points], dtype=float)
+            P_values = np.array([row[1] for row in points], dtype=float)
+        except (TypeError, IndexError, ValueError):
+            return None
+
+        order = np.argsort(D_values, kind="stable")
+        return cls(D_values[order], P_values[order])
+
+    def __len__(self):
+        return len(self._D_list)
+
+    def lookup(self, D_ob):
+        """Вероятность для дальности D_ob (числа или массива)"""
+        if np.ndim(D_ob) == 0:
+            return self.lookup_scalar(D_ob)
+        return self.lookup_array(np.asarray(D_ob, dtype=float))
+
+    def lookup_scalar(self, D_ob) -> float:
+        """Поиск для одного числа"""
+        D_sorted = self._D_list
+        P_sorted = self._P_list
+        pos = bisect.bisect_left(D_sorted, D_ob)
+
+        if pos == 0:
+            return P_sorted[0]
+        elif pos == len(D_sorted):
+            return P_sorted[-1]
+        elif D_sorted[pos] == D_ob:
+            return P_sorted[pos]
+        return (P_sorted[pos - 1] + P_sorted[pos]) / 2
+
+    def lookup_array(self, D_ob: np.ndarray) -> np.ndarray:
+        """Поиск сразу для массива дальностей"""
+        D_sorted = self.D_values
+        P_sorted = self.P_values
+        n = len(D_sorted)
+        pos = np.searchsorted(D_sorted, D_ob, side="left")
+
+        inner = np.clip(pos, 1, max(n - 1, 1))
+        result = (P_sorted[inner - 1] + P_sorted[np.minimum(inner, n - 1)]) / 2
+
+        at = np.minimum(pos, n - 1)
+        result = np.where((pos < n) & (D_sorted[at] == D_ob), P_sorted[at], result)
+        result = np.where(pos == 0, P_sorted[0], result)
+        result = np.where(pos == n, P_sorted[-1], result)
+        return result
+
+
+# Скомпилированные таблицы объектов: объект -> {поле: (исходные точки, таблица)}
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compile_curves(obj) -> None:
+    """Компилирует все таблицы вероятностей объекта (вызывается при загрузке из базы)"""
+    for field in CURVE_FIELDS.get(type(obj), []):
+        curve_for(obj, field)
+
+
+def curve_for(obj, field: str) -> Optional[ProbabilityCurve]:
+    """
+    Скомпилированная таблица поля объекта.
+
+    Таблица строится один раз и пересобирается, только если атрибут объекта
+    заменили другим значением.
+    """
+    points = getattr(obj, field)
+    curves = _compiled.setdefault(obj, {})
+    cached = curves.get(field)
+    if cached is not None and cached[0] is points:
+        return cached[1]
+
+    curve = ProbabilityCurve.from_points(points)
+    curves[field] = (points, curve)
+    return curve
@@ -0,0 +1,79 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+class CountCancelled(Exception):
+    """Расчет остановлен по токену отмены"""
+
+
+@dataclass
+class ProgressEvent:
+    """Состояние расчета: сценарии посчитано/всего, скорость (сценариев в секунду) и оценка оставшегося времени"""
+    done: int
+    total: int
+    elapsed: float
+    rate: float
+    eta: Optional[float]
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+
+class CancellationToken:
+    """Флаг отмены, который можно выставить из другого потока"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CountCancelled("Расчет отменен")
+
+
+class ProgressReporter:
+    """
+    Считает посчитанные сценарии и публикует ProgressEvent.
+
+    События отправляются не чаще чем раз в interval секунд (и всегда в конце),
+    чтобы не заваливать интерфейс обновлениями.
+    """
+
+    def __init__(self, total: int, callback: Optional[Callable[[ProgressEvent], None]] = None,
+                 interval: float = 0.1):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.interval = interval
+        self._start = time.perf_counter()
+        self._last = None
+
+    def advance(self, n: int):
+        """Отмечает n посчитанных сценариев"""
+        self.done += n
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if self._last is None or now - self._last >= self.interval or self.done >= self.total:
+            self._last = now
+            self.callback(self.event(now))
+
+    def extend(self, n: int):
+        """Добавляет n сценариев к общему числу (например, точки уточнения сетки)"""
+        self.total += n
+
+    def event(self, now: float = None) -> ProgressEvent:
+        """Текущее состояние расчета"""
+        elapsed = (now if now is not None else time.perf_counter()) - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else None
+        return ProgressEvent(done=self.done, total=self.total, elapsed=elapsed, rate=rate, eta=eta)
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List
+from accumulator import GroupAccumulator
+
+
+class ResultCache:
+    """
+    Постоянный кэш агрегатов блоков сценариев в отдельном файле SQLite.
+
+    Ключ - хэш содержимого объектов блока и описания сетки (см. Count._block_key),
+    значение - три GroupAccumulator блока. Размер ограничен max_entries,
+    лишние записи вытесняются по давности последнего использования.
+    Соединение открывается на каждый вызов, поэтому кэш можно использовать
+    из потока обновления графиков.
+    """
+
+    def __init__(self, db_name: str = "results_cache.db", max_entries: int = 100000):
+        self.db_name = db_name
+        self.max_entries = max_entries
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS block_results (
+                key TEXT PRIMARY KEY,
+                payload TEXT,
+                last_used REAL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS block_results_last_used ON block_results (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_name)
+
+    def get_many(self, keys: List[str]) -> Dict[str, tuple]:
+        """Агрегаты блоков, найденных в кэше; найденные записи отмечаются как использованные"""
+        found = {}
+        if not keys:
+            return found
+
+        with closing(self._connect()) as conn, conn:
+            # Ограничение SQLite на число параметров в одном запросе
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(f"SELECT key, payload FROM block_results WHERE key IN ({placeholders})", chunk)
+                for key, payload in rows:
+                    found[key] = self._loads(payload)
+
+            now = time.time()
+            conn.executemany("UPDATE block_results SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+        return found
+
+    def put_many(self, partials: Dict[str, tuple]):
+        """Сохраняет агрегаты блоков и вытесняет давно неиспользуемые записи сверх лимита"""
+        if not partials:
+            return
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO block_results (key, payload, last_used) VALUES (?, ?, ?)",
+                [(key, self._dumps(partial), now) for key, partial in partials.items()]
+            )
+            conn.execute("""
+            DELETE FROM block_results WHERE key IN (
+                SELECT key FROM block_results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM block_results").fetchone()[0]
+
+    def clear(self):
+        """Удаляет все записи кэша"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM block_results")
+
+    @staticmethod
+    def _dumps(partial: tuple) -> str:
+        return json.dumps([
+            {"keys": accumulator.keys, "sums": accumulator.sums.tolist(), "counts": accumulator.counts.tolist()}
+            for accumulator in partial
+        ])
+
+    @staticmethod
+    def _loads(payload: str) -> tuple:
+        partial = []
+        for data in json.loads(payload):
+            accumulator = GroupAccumulator.from_arrays([tuple(key) for key in data["keys"]], data["sums"], data["counts"])
+            partial.append(accumulator)
+        return tuple(partial)
@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import time
+from contextlib import closing
+from typing import List, Optional, Sequence, Tuple
+from accumulator import GroupAccumulator
+
+# Колонки ключа ячейки в порядке ключей аккумулятора ячеек (см. Count._block_partial)
+RESULT_COLUMNS = ["plane_name", "rocket_name", "purpose_name", "air_defense_name", "relief_name", "v", "h", "plane_num"]
+
+# Индексы results по группировкам графиков Count.chart_items
+GROUP_INDEXES = {
+    "results_plane_num": ["plane_name", "plane_num"],
+    "results_plane_rocket": ["plane_name", "rocket_name"],
+    "results_plane_v_h": ["plane_name", "v", "h"],
+}
+
+
+class ResultStore:
+    """
+    Результаты запусков Count.count() в отдельном файле SQLite.
+
+    Для каждого запуска сохраняются ячейки: сумма K и сумма весов по набору объектов
+    и точке (v, h, plane_num), z уже усреднен. Среднее K любой группировки ячеек -
+    SUM(sum_k) / SUM(weight), поэтому графики и новые разрезы строятся запросами
+    GROUP BY без повторного расчета. Ячейки адаптивного уточнения сетки помечены
+    refined: они участвуют только в разрезах по v и h.
+    Запуск хранится с ключом (см. Count._run_key): повторный расчет тех же данных
+    не записывается, а находится по ключу. Хранятся последние max_runs запусков.
+    """
+
+    def __init__(self, db_name: str = "results.db", max_runs: int = 20):
+        self.db_name = db_name
+        self.max_runs = max_runs
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL,
+                grid TEXT,
+                key TEXT
+            )
+            """)
+            # Файлы, созданные до появления ключа запуска
+            if "key" not in [row[1] for row in conn.execute("PRAGMA table_info(runs)")]:
+                conn.execute("ALTER TABLE runs ADD COLUMN key TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS runs_key ON runs (key)")
+            # Строки запуска лежат рядом (ключ run_id, seq), запрос по запуску - чтение диапазона
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                run_id INTEGER,
+                seq INTEGER,
+                plane_name TEXT,
+                rocket_name TEXT,
+                purpose_name TEXT,
+                air_defense_name TEXT,
+                relief_name TEXT,
+                v NUMERIC,
+                h NUMERIC,
+                plane_num NUMERIC,
+                refined INTEGER,
+                sum_k REAL,
+                weight REAL,
+                PRIMARY KEY (run_id, seq)
+            ) WITHOUT ROWID
+            """)
+            # Индексы под группировки графиков: GROUP BY читает строки запуска уже упорядоченными
+            for name, columns in GROUP_INDEXES.items():
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON results (run_id, {', '.join(columns)})")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_name)
+
+    def save_run(self, cells: GroupAccumulator, refined: Optional[GroupAccumulator] = None, grid=None,
+                 key: Optional[str] = None) -> int:
+        """
+        Сохраняет ячейки запуска и возвращает его номер.
+
+        Порядок строк (seq) - порядок первого появления ячеек, по нему группы
+        в group_by идут в том же порядке, что и в аккумуляторах Count.
+        """
+        rows = []
+        for flag, accumulator in ((0, cells), (1, refined)):
+            if accumulator is None:
+                continue
+            for cell, sum_k, weight in zip(accumulator.keys, accumulator.sums.tolist(), accumulator.counts.tolist()):
+                rows.append((*cell, flag, sum_k, weight))
+
+        with closing(self._connect()) as conn, conn:
+            run_id = conn.execute("INSERT INTO runs (created, grid, key) VALUES (?, ?, ?)",
+                                  (time.time(), json.dumps(grid), key)).lastrowid
+            conn.executemany(
+                f"INSERT INTO results (run_id, seq, {', '.join(RESULT_COLUMNS)}, refined, sum_k, weight) "
+                f"VALUES ({', '.join('?' * (len(RESULT_COLUMNS) + 5))})",
+                [(run_id, seq, *row) for seq, row in enumerate(rows)]
+            )
+            # Старые запуски сверх лимита удаляются вместе со строками
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM runs ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_runs,))]
+            for stale_id in stale:
+                conn.execute("DELETE FROM results WHERE run_id = ?", (stale_id,))
+                conn.execute("DELETE FROM runs WHERE id = ?", (stale_id,))
+        return run_id
+
+    def group_by(self, run_id: int, columns: Sequence[str], refined: bool = True) -> List[Tuple[tuple, float]]:
+        """
+        Средние K запуска по группам columns: пары (ключ группы, среднее).
+
+        Группы идут в порядке первого появления; refined=False исключает ячейки
+        адаптивного уточнения сетки.
+        """
+        unknown = [column for column in columns if column not in RESULT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Неизвестные колонки результатов: {unknown}")
+
+        select = ", ".join(columns)
+        group = f"GROUP BY {select}" if columns else ""
+        where = "run_id = ?" if refined else "run_id = ? AND refined = 0"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {select + ', ' if columns else ''}SUM(sum_k) / SUM(weight) FROM results "
+                f"WHERE {where} {group} ORDER BY MIN(seq)",
+                (run_id,)
+            ).fetchall()
+        return [(tuple(row[:-1]), row[-1]) for row in rows]
+
+    def find_run(self, key: str) -> Optional[int]:
+        """Последний сохраненный запуск с ключом key (None, если такого нет)"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MAX(id) FROM runs WHERE key = ?", (key,)).fetchone()
+        return row[0]
+
+    def runs(self) -> List[int]:
+        """Номера сохраненных запусков по возрастанию"""
+        with closing(self._connect()) as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM runs ORDER BY id")]
+
+    def last_run(self) -> Optional[int]:
+        """Номер последнего запуска (None, если запусков нет)"""
+        runs = self.runs()
+        return runs[-1] if runs else None
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def clear(self):
+        """Удаляет все запуски"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM runs")
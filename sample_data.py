@@ -0,0 +1,62 @@
+"""
+Образец данных для расчета: используется тестами (test_count.py) и бенчмарком.
+"""
+from count import CurrentDataSet
+from entities import Plane, Purpose, Rocket, AirDefense, Relief
+
+
+def sample_data() -> CurrentDataSet:
+    """Один набор объектов с параметрами сценария"""
+    plane = Plane()
+    plane.name="TestPlane"
+    plane.sigma_z=500
+    plane.gap_max=5
+    plane.t_aim=10
+    plane.psi_max=60
+    plane.n_rocket=4
+    plane.P_detect=[[1000, 0.8], [4000, 0.6], [20000, 0.1]]
+
+
+    purpose = Purpose()
+    purpose.a=5
+    purpose.b=4
+    purpose.h=3
+    purpose.R_defeat=2
+    purpose.average_number=2
+
+    rocket = Rocket()
+    rocket.name="TestRocket"
+    rocket.R_min=500
+    rocket.angle_effect=45
+    rocket.type="фугас"
+
+    air_defence = AirDefense()
+    air_defence.P_detect=[[1000, 0.9], [8000, 0.7], [20000, 0.5]]
+    air_defence.n_defense=2
+    air_defence.n_rocket_d=4
+    air_defence.v_defense=400
+    air_defence.t_passive=5
+    air_defence.t_changing=3
+    air_defence.t_def=10
+    air_defence.x_defense=[0, 200]
+    air_defence.y_defense=[0, 150]
+    air_defence.l_min=500
+    air_defence.l_max=6000
+    air_defence.width_defense=5000
+    air_defence.h_max=5000
+    air_defence.P_defeat=0.8
+
+    relief = Relief()
+    relief.P_see=[[1000, 0.9], [8000, 0.7], [20000, 0.5]]
+
+    return CurrentDataSet(
+        plane=plane,
+        purpose=purpose,
+        rocket=rocket,
+        air_defence=air_defence,
+        relief=relief,
+        v=200,
+        h=100,
+        z=50,
+        plane_num=2
+    )
@@ -0,0 +1,96 @@
+import numpy as np
+from typing import List, Optional, Sequence
+
+# Сетка перебора скорости, высоты, количества самолетов и отклонения z по умолчанию
+SPEED_RANGE = range(100, 301, 50)
+HEIGHT_RANGE = range(50, 500, 50)
+PLANE_NUM_RANGE = range(1, 6)
+Z_STEP = 100
+
+
+class ScenarioGrid:
+    """
+    Сетка перебора (v, h, plane_num, z) для Count.
+
+    По умолчанию совпадает с прежними вложенными циклами dataCollection.
+    z перебирается с шагом z_step в пределах трех сигм или, если задано z_nodes,
+    узлами квадратуры Гаусса.
+
+    В адаптивном режиме (adaptive=True) скорости и высоты - начальная грубая сетка:
+    Count.count() добавляет середины соседних интервалов там, где K между соседями
+    меняется больше чем на tolerance, пока общее число точек (v, h) не превысит
+    max_points или шаг не уменьшится в 2**max_depth раз.
+    """
+
+    def __init__(self, speeds: Sequence[float] = SPEED_RANGE, heights: Sequence[float] = HEIGHT_RANGE,
+                 plane_nums: Sequence[int] = PLANE_NUM_RANGE, z_step: int = Z_STEP, z_nodes: Optional[int] = None,
+                 adaptive: bool = False, tolerance: float = 0.01, max_points: int = 500, max_depth: int = 3):
+        self.speeds = list(speeds)
+        self.heights = list(heights)
+        self.plane_nums = list(plane_nums)
+        self.z_step = z_step
+        self.z_nodes = z_nodes
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.max_points = max_points
+        self.max_depth = max_depth
+
+    def z_range(self, sigma_z: float) -> range:
+        """Значения z в пределах трех сигм"""
+        return range(int(-3 * sigma_z), int(3 * sigma_z), self.z_step)
+
+    def z_points(self, sigma_z: float):
+        """
+        Значения z и их веса.
+
+        Без z_nodes - плотный перебор z_range с равными весами (None).
+        С z_nodes - узлы и веса квадратуры Гаусса на том же отрезке [-3 sigma_z, 3 sigma_z]:
+        плотный перебор усредняет K по z равномерно, поэтому квадратура берется
+        с постоянным весом (Гаусс-Лежандр), а веса нормированы на единицу.
+        """
+        if self.z_nodes is None:
+            return list(self.z_range(sigma_z)), None
+        nodes, weights = np.polynomial.legendre.leggauss(self.z_nodes)
+        return (3 * sigma_z * nodes).tolist(), (weights / 2).tolist()
+
+    def points(self, sigma_z: float, speeds: Sequence[float] = None, heights: Sequence[float] = None):
+        """Все точки сетки (v, h, plane_num, z) для одного самолета в порядке вложенных циклов"""
+        z, _ = self.z_points(sigma_z)
+        speeds = self.speeds if speeds is None else speeds
+        heights = self.heights if heights is None else heights
+        v, h, plane_num, z = np.meshgrid(speeds, heights, self.plane_nums, z, indexing='ij')
+        return v.ravel(), h.ravel(), plane_num.ravel(), z.ravel()
+
+    def weights(self, sigma_z: float, n_cells: int = None) -> Optional[np.ndarray]:
+        """Веса точек для n_cells ячеек (v, h) (None - все точки равноправны)"""
+        _, weights = self.z_points(sigma_z)
+        if weights is None:
+            return None
+        n_cells = len(self.speeds) * len(self.heights) if n_cells is None else n_cells
+        return np.tile(weights, n_cells * len(self.plane_nums))
+
+    def size(self, sigma_z: float) -> int:
+        """Количество точек сетки для одного самолета"""
+        return len(self.speeds) * len(self.heights) * len(self.plane_nums) * len(self.z_points(sigma_z)[0])
+
+    def definition(self) -> list:
+        """Описание сетки для ключей кэша"""
+        z_definition = self.z_step if self.z_nodes is None else ["gauss", self.z_nodes]
+        return [self.speeds, self.heights, self.plane_nums, z_definition]
+
+    def midpoints(self, values: List[float], split) -> List[float]:
+        """Середины интервалов между соседними значениями, для которых split(a, b) истинно"""
+        values = sorted(values)
+        return [_midpoint(a, b) for a, b in zip(values, values[1:]) if split(a, b)]
+
+    def min_step(self, values: Sequence[float]) -> float:
+        """Минимальный шаг уточнения для начальных значений оси"""
+        values = sorted(values)
+        steps = [b - a for a, b in zip(values, values[1:])]
+        return min(steps) / 2 ** self.max_depth if steps else 0
+
+
+def _midpoint(a, b):
+    """Середина интервала; целая, если делится нацело"""
+    middle = (a + b) / 2
+    return int(middle) if middle == int(middle) else middle
@@ -0,0 +1,29 @@
+import time
+from typing import Dict, Optional
+
+
+class StartupTimer:
+    """
+    Время этапов запуска приложения.
+
+    mark(name) запоминает, сколько секунд прошло от создания таймера до конца этапа.
+    Таймер создается первой строкой main.py, поэтому в замер входит и импорт модулей.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self._start = time.perf_counter() if start is None else start
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str) -> float:
+        """Отмечает конец этапа name и возвращает время от запуска"""
+        self.marks[name] = time.perf_counter() - self._start
+        return self.marks[name]
+
+    def report(self) -> str:
+        """Этапы в порядке завершения: время от запуска и длительность этапа"""
+        lines = []
+        previous = 0.0
+        for name, seconds in self.marks.items():
+            lines.append(f"{name:30} {seconds:8.3f} с  (+{seconds - previous:.3f} с)")
+            previous = seconds
+        return "\n".join(lines)
@@ -1,7 +1,13 @@
+import copy
 import pytest
 from math import isclose
 from count import *
 from entities import Plane, Purpose, Rocket, AirDefense, Relief
+from probability_curve import ProbabilityCurve, curve_for
+from trajectory import TrajectoryCache, solve_trajectory
+from sample_data import sample_data
+from scenario_grid import ScenarioGrid, SPEED_RANGE, HEIGHT_RANGE, PLANE_NUM_RANGE, Z_STEP
+import numpy as np
 
 class testBD:
 
@@ -21,68 +27,13 @@ class testBD:
         return None
 
 
-def test_data():
-    plane = Plane()
-    plane.name="TestPlane"
-    plane.sigma_z=500
-    plane.gap_max=5
-    plane.t_aim=10
-    plane.psi_max=60
-    plane.n_rocket=4
-    plane.P_detect=[[1000, 0.8], [4000, 0.6], [20000, 0.1]]
-
-
-    purpose = Purpose()
-    purpose.a=5
-    purpose.b=4
-    purpose.h=3
-    purpose.R_defeat=2
-    purpose.average_number=2
-
-    rocket = Rocket()
-    rocket.name="TestRocket"
-    rocket.R_min=500
-    rocket.angle_effect=45
-    rocket.type="фугас"
-
-    air_defence = AirDefense()
-    air_defence.P_detect=[[1000, 0.9], [8000, 0.7], [20000, 0.5]]
-    air_defence.n_defense=2
-    air_defence.n_rocket_d=4
-    air_defence.v_defense=400
-    air_defence.t_passive=5
-    air_defence.t_changing=3
-    air_defence.t_def=10
-    air_defence.x_defense=[0, 200]
-    air_defence.y_defense=[0, 150]
-    air_defence.l_min=500
-    air_defence.l_max=6000
-    air_defence.width_defense=5000
-    air_defence.h_max=5000
-    air_defence.P_defeat=0.8
-
-    relief = Relief()
-    relief.P_see=[[1000, 0.9], [8000, 0.7], [20000, 0.5]]
-
-    return CurrentDataSet(
-        plane=plane,
-        purpose=purpose,
-        rocket=rocket,
-        air_defence=air_defence,
-        relief=relief,
-        v=200,
-        h=100,
-        z=50,
-        plane_num=2
-    )
-
 @pytest.fixture
 def sample_current_data():
-    return test_data()
+    return sample_data()
 
 @pytest.fixture
 def sample_probab_data():
-    tmp = test_data()
+    tmp = sample_data()
     probab_data = ProbabSurlData(
         P_detect=tmp.air_defence.P_detect,
         n_defense=tmp.air_defence.n_defense,
@@ -204,4 +155,981 @@ def test_choice():
     
     # Пустые данные
     assert count._choice([], 100) is None
-    #assert count._choice([[100, 0.5]], 100) is None
\ No newline at end of file
+    #assert count._choice([[100, 0.5]], 100) is None
+
+def sample_grid(sample):
+    """Точки сетки (v, h, plane_num, z) в порядке циклов dataCollection"""
+    points = [
+        (v, h, plane_num, z)
+        for v in range(100, 301, 50)
+        for h in range(50, 500, 50)
+        for plane_num in range(1, 6)
+        for z in range(int(-3 * sample.plane.sigma_z), int(3 * sample.plane.sigma_z), 100)
+    ]
+    return [list(column) for column in zip(*points)]
+
+def test_calculate_block_matches_scalar(sample_current_data):
+    count = Count(testBD())
+    v, h, plane_num, z = sample_grid(sample_current_data)
+    s = sample_current_data
+
+    block = count.calculate_block(s.plane, s.purpose, s.rocket, s.air_defence, s.relief, v, h, plane_num, z)
+    assert len(block) == len(v)
+
+    for i, data_K in enumerate(block):
+        expected = count._calculate_probabilities(CurrentDataSet(
+            plane=s.plane, purpose=s.purpose, rocket=s.rocket, air_defence=s.air_defence, relief=s.relief,
+            v=v[i], h=h[i], z=z[i], plane_num=plane_num[i]
+        ))
+        for field in ["P_def", "P5", "P4", "P_prl1", "P_prl2", "W_a", "W_a_max"]:
+            assert isclose(getattr(data_K, field), getattr(expected, field), rel_tol=1e-9, abs_tol=1e-12)
+        assert (data_K.plane_name, data_K.rocket_name, data_K.v, data_K.h, data_K.z, data_K.plane_num) == \
+            (expected.plane_name, expected.rocket_name, expected.v, expected.h, expected.z, expected.plane_num)
+        assert isclose(count._cout_K(data_K), count._cout_K(expected), rel_tol=1e-9)
+
+def test_count_vectorized_matches_scalar(sample_current_data):
+    s = sample_current_data
+    v, h, plane_num, z = sample_grid(s)
+    data = [
+        CurrentDataSet(plane=s.plane, purpose=s.purpose, rocket=s.rocket, air_defence=s.air_defence, relief=s.relief,
+                       v=v[i], h=h[i], z=z[i], plane_num=plane_num[i])
+        for i in range(len(v))
+    ]
+
+    scalar = Count(testBD(), vectorized=False)
+    scalar.data = list(data)
+    vectorized = Count(testBD())
+    vectorized.data = list(data)
+
+    expected = scalar.count()
+    result = vectorized.count()
+
+    assert expected[0].keys() == result[0].keys()
+    for name in expected[0]:
+        assert expected[0][name]["plane_nums"] == result[0][name]["plane_nums"]
+        for a, b in zip(expected[0][name]["K_values"], result[0][name]["K_values"]):
+            assert isclose(a, b, rel_tol=1e-9)
+    assert list(expected[1].keys()) == list(result[1].keys())
+    for key in expected[1]:
+        assert isclose(expected[1][key], result[1][key], rel_tol=1e-9)
+    assert expected[2].keys() == result[2].keys()
+    for h_key in expected[2]:
+        assert expected[2][h_key]["v"] == result[2][h_key]["v"]
+        for a, b in zip(expected[2][h_key]["k"], result[2][h_key]["k"]):
+            assert isclose(a, b, rel_tol=1e-9)
+
+class listBD(testBD):
+    """Тестовая база с одним объектом каждого типа"""
+
+    def __init__(self, sample):
+        self.sample = sample
+
+    def get_all_planes(self):
+        return [self.sample.plane]
+
+    def get_all_rockets(self):
+        return [self.sample.rocket]
+
+    def get_all_purposes(self):
+        return [self.sample.purpose]
+
+    def get_all_air_defenses(self):
+        return [self.sample.air_defence]
+
+    def get_all_reliefs(self):
+        return [self.sample.relief]
+
+def test_data_collection_is_lazy(sample_current_data):
+    count = Count(listBD(sample_current_data))
+    count.dataCollection()
+
+    assert isinstance(count.data, ScenarioStream)
+    v, h, plane_num, z = sample_grid(sample_current_data)
+    assert len(count.data) == len(v)
+
+    scenarios = iter(count.data)
+    first = next(scenarios)
+    assert isinstance(first, CurrentDataSet)
+    assert (first.v, first.h, first.plane_num, first.z) == (v[0], h[0], plane_num[0], z[0])
+
+    (entities, block), = list(count.data.blocks())
+    assert entities[0] is sample_current_data.plane
+    assert [array.tolist() for array in block] == [v, h, plane_num, z]
+    assert [(d.v, d.h, d.plane_num, d.z) for d in count.data] == list(zip(v, h, plane_num, z))
+
+def test_count_parallel_matches_serial(sample_current_data):
+    second_rocket = Rocket()
+    vars(second_rocket).update(vars(sample_current_data.rocket))
+    second_rocket.name = "SecondRocket"
+    second_rocket.type = "кумулятив"
+
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+
+    serial = Count(db)
+    serial.dataCollection()
+    parallel = Count(db, workers=2)
+    parallel.dataCollection()
+
+    assert len(parallel.data.shards()) == 2
+    assert parallel.count() == serial.count()
+
+def test_count_parallel_cancel_returns_promptly(sample_current_data):
+    import threading
+    import time
+    from progress import CancellationToken, CountCancelled
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+
+    # Скалярный расчет на частой сетке по z: каждый шард считается несколько секунд
+    count = Count(db, vectorized=False, workers=2, grid=ScenarioGrid(z_step=50))
+    count.dataCollection()
+    token = CancellationToken()
+    timer = threading.Timer(0.5, token.cancel)
+    timer.start()
+    start = time.perf_counter()
+    with pytest.raises(CountCancelled):
+        count.count(cancel=token)
+    # Отмена не ждет завершения шардов, которые уже считаются в процессах пула
+    assert time.perf_counter() - start < 1.5
+    timer.cancel()
+
+    # Отмена из progress, как в DataUpdater: посчитанные шарды сохраняются для следующего запуска
+    third_rocket = copy.copy(sample_current_data.rocket)
+    third_rocket.name = "ThirdRocket"
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket, third_rocket]
+    fresh = Count(db, vectorized=False, workers=2)
+    fresh.dataCollection()
+    token = CancellationToken()
+    cancelled_at = []
+
+    def cancel(event):
+        token.cancel()
+        cancelled_at.append(time.perf_counter())
+
+    with pytest.raises(CountCancelled):
+        fresh.count(progress=cancel, cancel=token)
+    assert time.perf_counter() - cancelled_at[0] < 0.5
+
+    fresh.dataCollection()
+    result = fresh.count()
+    assert fresh.reused_blocks >= 1 and fresh.reused_blocks + fresh.computed_blocks == 3
+    assert list(result[1]) == ["TestPlane TestRocket", "TestPlane SecondRocket", "TestPlane ThirdRocket"]
+
+def test_probability_curve():
+    count = Count(testBD())
+    P_detect = [[300, 0.5], [100, 0.9], [200, 0.7]]
+    curve = ProbabilityCurve.from_points(P_detect)
+
+    D_values = [50, 100, 150, 200, 250, 300, 350]
+    expected = [count._choice(P_detect, D) for D in D_values]
+    assert [count._choice(curve, D) for D in D_values] == expected
+    assert curve.lookup(np.array(D_values)).tolist() == expected
+
+    assert ProbabilityCurve.from_points([]) is None
+    assert ProbabilityCurve.from_points([[100]]) is None
+
+    # Ключ таблицы зависит только от ее содержимого
+    assert ProbabilityCurve.from_points([[100, 0.9], [200, 0.7], [300, 0.5]]).key == curve.key
+    assert ProbabilityCurve.from_points([[100, 0.9], [200, 0.6], [300, 0.5]]).key != curve.key
+
+def test_curve_for_compiles_once(sample_current_data):
+    plane = sample_current_data.plane
+    curve = curve_for(plane, "P_detect")
+    assert curve_for(plane, "P_detect") is curve
+
+    plane.P_detect = [[1000, 0.5]]
+    assert curve_for(plane, "P_detect") is not curve
+    assert curve_for(plane, "P_detect").lookup(1000) == 0.5
+
+def test_trajectory_cache_shared(sample_probab_data):
+    count = Count(testBD())
+    count._ZVA(sample_probab_data)
+    count._P_4(sample_probab_data)
+    sample_probab_data.n_planes = 5
+    sample_probab_data.h = 300
+    count._ZVA(sample_probab_data)
+
+    # Метод Ньютона решен один раз, остальные вызовы взяты из кэша
+    assert count.trajectories.misses == 1
+    assert count.trajectories.hits == 2
+
+def test_trajectory_cache_eviction():
+    cache = TrajectoryCache(maxsize=2)
+    for v in (100, 150, 200):
+        cache.get(v, 50, 500, 10, 60, 5, 45)
+    assert len(cache) == 2
+
+    cache.get(100, 50, 500, 10, 60, 5, 45)
+    assert cache.misses == 4
+
+    geometry = cache.get_array([100, 100, 150], [50, 50, -50], 500, 10, 60, 5, 45)
+    assert geometry.D1.shape == (3,)
+    assert geometry.D1[0] == geometry.D1[1]
+    assert isclose(geometry.D2_zva[2], solve_trajectory(150, -50, 500, 10, 60, 5, 45).D2_zva, rel_tol=1e-9)
+
+def test_submodels_shared_between_blocks(sample_current_data):
+    s = sample_current_data
+    v, h, plane_num, z = sample_grid(s)
+    count = Count(testBD())
+
+    other_plane = copy.copy(s.plane)
+    other_plane.name, other_plane.t_aim, other_plane.n_rocket = "Plane 2", 12, 2
+    first = count.engine.calculate_block(s.plane, s.purpose, s.rocket, s.air_defence, s.relief, v, h, plane_num, z)
+    misses = count.engine.submodel_misses
+    second = count.engine.calculate_block(other_plane, s.purpose, s.rocket, s.air_defence, s.relief, v, h, plane_num, z)
+
+    # Перехват в _P_prl1/_P_prl2 и многоугольник цели от самолета не зависят
+    assert count.engine.submodel_hits == 3
+    assert count.engine.submodel_misses == misses + 1
+    assert np.array_equal(first.P_prl1, second.P_prl1) and np.array_equal(first.P_prl2, second.P_prl2)
+    # Ключи кэша подмоделей не хранят копии сетки
+    assert not any(isinstance(part, bytes) for key in count.engine._submodels for part in key)
+
+    for i in range(0, len(v), 37):
+        expected = count._calculate_probabilities(CurrentDataSet(
+            plane=other_plane, purpose=s.purpose, rocket=s.rocket, air_defence=s.air_defence, relief=s.relief,
+            v=v[i], h=h[i], z=z[i], plane_num=plane_num[i]
+        ))
+        for field in ["P_def", "P5", "P4", "P_prl1", "P_prl2", "W_a", "W_a_max"]:
+            assert isclose(getattr(second, field)[i], getattr(expected, field), rel_tol=1e-9, abs_tol=1e-12)
+
+def test_intercept_lockstep_matches_loops(sample_current_data):
+    from vector_engine import intercept, INTERCEPT_PRL1, INTERCEPT_PRL2, INTERCEPT_P4
+    count = Count(testBD())
+    air_defence = sample_current_data.air_defence
+    curve = curve_for(air_defence, "P_detect")
+    D = np.array([0.0, 150.0, 999.0, 1000.0, 4500.0, 5400.0, 8000.0, 12000.0])
+    v = np.array([100.0, 150.0, 200.0, 250.0, 300.0, 100.0, 200.0, 300.0])
+
+    def loop(D_pys, v, rule):
+        # Циклы из Count._P_prl1, Count._P_prl2 и Count._P_4
+        N = 0
+        speed = air_defence.v_defense - v if rule == INTERCEPT_PRL2 else v + air_defence.v_defense
+        while (D_pys > 0 or N < air_defence.n_rocket_d) if rule == INTERCEPT_PRL1 else \
+                (D_pys > 0 and N < air_defence.n_rocket_d):
+            t_per = D_pys / speed + air_defence.t_def
+            if t_per * v > D_pys:
+                N += count._choice(air_defence.P_detect, D_pys)
+            elif rule == INTERCEPT_P4:
+                break
+            D_pys -= v * t_per
+        return N
+
+    for rule, speed in [(INTERCEPT_PRL1, v + air_defence.v_defense),
+                        (INTERCEPT_PRL2, air_defence.v_defense - v),
+                        (INTERCEPT_P4, v + air_defence.v_defense)]:
+        N = intercept(D, v, speed, air_defence, curve, rule)
+        assert N.tolist() == [loop(d, lane_v, rule) for d, lane_v in zip(D.tolist(), v.tolist())]
+
+def test_group_accumulator():
+    from accumulator import GroupAccumulator
+    first = GroupAccumulator()
+    first.add(("A",), [[300, 100, 300, 100]], [1.0, 2.0, 3.0, 4.0])
+    assert first.keys == [("A", 300), ("A", 100)]
+    assert list(first.items()) == [(("A", 300), 2.0), (("A", 100), 3.0)]
+
+    second = GroupAccumulator()
+    second.add(("A",), [[100, 200]], [6.0, 5.0])
+    first.merge(second)
+    assert list(first.items()) == [(("A", 300), 2.0), (("A", 100), 4.0), (("A", 200), 5.0)]
+
+    weighted = GroupAccumulator()
+    weighted.add(("B", "R"), [], [1.0, 4.0], weights=[3.0, 1.0])
+    assert list(weighted.items()) == [(("B", "R"), 1.75)]
+
+def test_count_recomputes_only_changed_blocks(sample_current_data):
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    rockets = [sample_current_data.rocket]
+
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: list(rockets)
+    count = Count(db)
+    count.dataCollection()
+    count.count()
+    assert (count.computed_blocks, count.reused_blocks) == (1, 0)
+
+    # Добавление ракеты: считается только новый блок
+    rockets.append(second_rocket)
+    count.dataCollection()
+    result = count.count()
+    assert (count.computed_blocks, count.reused_blocks) == (1, 1)
+
+    fresh = Count(db)
+    fresh.dataCollection()
+    assert result == fresh.count()
+
+    # Изменение ракеты пересчитывает ее блок, удаление - только убирает его из суммы
+    second_rocket.R_min = 600
+    count.dataCollection()
+    count.count()
+    assert (count.computed_blocks, count.reused_blocks) == (1, 1)
+
+    rockets.pop()
+    count.dataCollection()
+    result = count.count()
+    assert (count.computed_blocks, count.reused_blocks) == (0, 1)
+
+    fresh.dataCollection()
+    assert result == fresh.count()
+
+def test_result_cache_between_instances(sample_current_data, tmp_path, monkeypatch):
+    import fingerprint
+    from result_cache import ResultCache
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+
+    result_cache = ResultCache(str(tmp_path / "results.db"))
+    first = Count(db, result_cache=result_cache)
+    first.dataCollection()
+    expected = first.count()
+    assert first.computed_blocks == 2 and len(result_cache) == 2
+
+    # Новый экземпляр (перезапуск приложения) берет готовые агрегаты из файла
+    second = Count(db, result_cache=ResultCache(str(tmp_path / "results.db")))
+    second.dataCollection()
+    assert second.count() == expected
+    assert (second.computed_blocks, second.reused_blocks) == (0, 2)
+
+    # Агрегаты другой версии модели расчета не используются
+    monkeypatch.setattr(fingerprint, "MODEL_VERSION", fingerprint.MODEL_VERSION + 1)
+    changed = Count(db, result_cache=ResultCache(str(tmp_path / "results.db")))
+    changed.dataCollection()
+    assert changed.count() == expected
+    assert (changed.computed_blocks, changed.reused_blocks) == (2, 0)
+    monkeypatch.undo()
+
+    # Лимит размера вытесняет давно неиспользуемые записи
+    small = ResultCache(str(tmp_path / "small.db"), max_entries=1)
+    third = Count(db, result_cache=small)
+    third.dataCollection()
+    third.count()
+    assert len(small) == 1
+
+def test_z_quadrature(sample_current_data):
+    z, weights = ScenarioGrid(z_nodes=8).z_points(500)
+    assert len(z) == 8 and isclose(sum(weights), 1.0)
+    assert min(z) > -1500 and max(z) < 1500
+    assert ScenarioGrid().z_points(500) == (list(range(-1500, 1500, Z_STEP)), None)
+
+    count = Count(listBD(sample_current_data), z_nodes=8)
+    count.dataCollection()
+    assert len(count.data) == len(SPEED_RANGE) * len(HEIGHT_RANGE) * len(PLANE_NUM_RANGE) * 8
+    report = count.z_error_report()
+    assert report["TestPlane"]["points_quadrature"] * 3 < report["TestPlane"]["points_dense"]
+    assert report["TestPlane"]["max_rel_error"] < 0.05
+
+    result = count.count()
+    assert list(result[0]) == ["TestPlane"]
+    # Отчет доступен и для только что выполненного запуска
+    assert count.z_error_report() == report
+
+
+def test_z_error_report_covers_all_tuples(sample_current_data, monkeypatch):
+    import warnings
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+    count = Count(db, z_nodes=8)
+    count.dataCollection()
+    report = count.z_error_report()
+    assert report["TestPlane"]["tuples"] == 2
+
+    # Нулевое плотное среднее K не дает деления на ноль
+    original = count._k_values
+
+    def zero_k(entities, grid):
+        values = original(entities, grid)
+        return None if values is None else (*values[:-1], np.zeros_like(values[-1]))
+
+    monkeypatch.setattr(count, "_k_values", zero_k)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        report = count.z_error_report()
+    assert report["TestPlane"]["max_abs_error"] == report["TestPlane"]["max_rel_error"] == 0
+
+def test_adaptive_grid_refines_height_chart(sample_current_data):
+    uniform = Count(listBD(sample_current_data))
+    uniform.dataCollection()
+    expected = uniform.count()
+
+    count = Count(listBD(sample_current_data), grid=ScenarioGrid(adaptive=True, tolerance=1e-6))
+    count.dataCollection()
+    result = count.count()
+
+    # Уточняются только интервалы, где K заметно меняется
+    assert set(SPEED_RANGE) < set(count.refined_speeds)
+    assert len(count.refined_speeds) < 2 ** count.grid.max_depth * (len(SPEED_RANGE) - 1) + 1
+    assert result[0] == expected[0] and result[1] == expected[1]
+    for h, line in result[2].items():
+        assert line["v"] == sorted(line["v"]) == count.refined_speeds
+        uniform_k = dict(zip(expected[2][h]["v"], expected[2][h]["k"]))
+        assert all(isclose(k, uniform_k[v]) for v, k in zip(line["v"], line["k"]) if v in uniform_k)
+
+    # Бюджет точек не дает уточнять сетку
+    limited = Count(listBD(sample_current_data), grid=ScenarioGrid(adaptive=True, tolerance=1e-6, max_points=45))
+    limited.dataCollection()
+    assert limited.count()[2] == expected[2]
+
+
+def test_adaptive_refinement_reuses_blocks(sample_current_data, tmp_path):
+    from result_cache import ResultCache
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+    grid = ScenarioGrid(adaptive=True, tolerance=1e-6)
+
+    count = Count(db, grid=grid)
+    count.dataCollection()
+    expected = count.count()
+    first_computed = count.computed_refine_blocks
+    assert first_computed > 0 and count.reused_refine_blocks == 0
+
+    # Повторный запуск не пересчитывает куски уточнения
+    count.dataCollection()
+    assert count.count() == expected
+    assert (count.computed_refine_blocks, count.reused_refine_blocks) == (0, first_computed)
+
+    # Измененная ракета: пересчитываются только ее куски
+    second_rocket.name = "ChangedRocket"
+    count.dataCollection()
+    count.count()
+    assert 0 < count.computed_refine_blocks < first_computed
+    assert count.reused_refine_blocks > 0
+
+    # Новый экземпляр берет куски уточнения из постоянного кэша
+    second_rocket.name = "SecondRocket"
+    first = Count(db, grid=grid, result_cache=ResultCache(str(tmp_path / "results.db")))
+    first.dataCollection()
+    assert first.count() == expected
+    second = Count(db, grid=grid, result_cache=ResultCache(str(tmp_path / "results.db")))
+    second.dataCollection()
+    assert second.count() == expected
+    assert (second.computed_refine_blocks, second.reused_refine_blocks) == (0, first_computed)
+
+def test_defense_index_culling_is_exact(sample_current_data, monkeypatch):
+    import defense_index
+    s = sample_current_data
+    rng = np.random.default_rng(1)
+    air_defence = copy.copy(s.air_defence)
+    air_defence.n_defense = 300
+    air_defence.x_defense = (rng.choice([-1, 1], 300) * rng.uniform(10000, 60000, 300)).tolist()
+    air_defence.y_defense = rng.uniform(-60000, 60000, 300).tolist()
+    air_defence.x_defense[:4] = [0, 200, 5000, 0]
+    air_defence.y_defense[:4] = [0, 150, 3000, 7000]
+
+    index = defense_index.defense_index(air_defence)
+    assert index is defense_index.defense_index(air_defence)
+    spheres = index.candidates(air_defence.l_max, 50, 450)
+    assert spheres == [0, 1, 2]
+
+    v, h, plane_num, z = sample_grid(s)
+    points = list(range(0, len(v), 53))
+
+    def run():
+        count = Count(testBD())
+        block = count.engine.calculate_block(s.plane, s.purpose, s.rocket, air_defence, s.relief, v, h, plane_num, z)
+        scalar = [count._calculate_probabilities(CurrentDataSet(
+            plane=s.plane, purpose=s.purpose, rocket=s.rocket, air_defence=air_defence, relief=s.relief,
+            v=v[i], h=h[i], z=z[i], plane_num=plane_num[i]
+        )) for i in points]
+        return block.K().tolist(), [count._cout_K(data_K) for data_K in scalar]
+
+    culled = run()
+    monkeypatch.setattr(defense_index, "BRUTE_FORCE_LIMIT", 10 ** 6)
+    assert run() == culled
+
+def test_count_progress_and_cancel(sample_current_data):
+    from progress import CancellationToken, CountCancelled
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+
+    count = Count(db)
+    count.dataCollection()
+    events = []
+    expected = count.count(progress=events.append)
+    assert events[-1].done == events[-1].total == len(sample_grid(sample_current_data)[0]) * 2
+    assert events[-1].eta == 0 and events[-1].rate > 0
+
+    # Отмена после первого блока: расчет прерывается, посчитанные блоки не теряются
+    fresh = Count(db)
+    fresh.dataCollection()
+    token = CancellationToken()
+    with pytest.raises(CountCancelled):
+        fresh.count(progress=lambda event: token.cancel(), cancel=token)
+    assert fresh.computed_blocks == 1
+
+    fresh.dataCollection()
+    assert fresh.count() == expected
+    assert (fresh.computed_blocks, fresh.reused_blocks) == (1, 1)
+
+    # Точки адаптивного уточнения входят в общее число сценариев
+    adaptive = Count(db, grid=ScenarioGrid(adaptive=True, tolerance=1e-6))
+    adaptive.dataCollection()
+    uniform_total = len(adaptive.data)
+    events = []
+    adaptive.count(progress=events.append)
+    assert events[-1].done == events[-1].total > uniform_total
+    assert all(event.done <= event.total for event in events)
+
+
+def test_data_updater_always_finishes(sample_current_data):
+    import tkinter as tk
+    from data_updater import DataUpdater
+    from progress import CancellationToken
+
+    class Widget:
+        """Виджет Tk, который только запоминает состояние"""
+        def __init__(self):
+            self.state = {}
+
+        def config(self, **options):
+            self.state.update(options)
+
+        def pack(self, **options):
+            self.state["visible"] = True
+
+        def pack_forget(self):
+            self.state["visible"] = False
+
+        def stop(self):
+            pass
+
+    class Root:
+        def after(self, delay, callback):
+            if delay == 0:
+                callback()
+
+    def updater(count):
+        updater = DataUpdater.__new__(DataUpdater)
+        updater.count = count
+        updater.window = type("Window", (), {"root": Root()})()
+        for name in ("update_button", "cancel_button", "status_frame", "loading_label", "progress"):
+            setattr(updater, name, Widget())
+        updater._update_charts = lambda *data: None
+        return updater
+
+    # Ошибка при сборе данных: кнопки возвращаются в исходное состояние
+    failing = updater(Count(testBD()))
+    failing._start_update_process()
+    assert failing.update_button.state["state"] == tk.NORMAL
+    assert failing.cancel_button.state["visible"] is False and failing.cancel_token is None
+    assert failing.loading_label.state["text"].startswith("Ошибка")
+
+    working = updater(Count(listBD(sample_current_data)))
+    working.count.dataCollection()
+    working.cancel_token = CancellationToken()
+    working._update_data(working.cancel_token)
+    assert working.loading_label.state["text"] == "Готово!"
+    assert working.update_button.state["state"] == tk.NORMAL
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_count_instrumentation(sample_current_data, vectorized):
+    db = listBD(sample_current_data)
+    plain = Count(db, vectorized=vectorized)
+    plain.dataCollection()
+    expected = plain.count()
+    assert plain.stats is None
+
+    count = Count(db, vectorized=vectorized, instrument=True)
+    count.dataCollection()
+    assert count.count() == expected
+
+    report = count.stats.report()
+    assert report["scenarios"] == len(sample_grid(sample_current_data)[0])
+    assert report["scenarios_per_s"] > 0
+    assert report["counters"]["newton_iterations"] > 0
+    assert report["counters"]["intercept_steps"] > 0
+    hot = "VectorEngine.calculate_block" if vectorized else "_calculate_probabilities"
+    assert report["calls"][hot]["count"] > 0
+
+
+def test_benchmark_reports_throughput_and_regressions(tmp_path, capsys):
+    from benchmark import find_regressions, main, run_benchmarks
+    results = run_benchmarks(n_planes=2, n_rockets=1, n_sites=1, sigma_z=[100], repeat=1)
+    benchmarks = results["benchmarks"]
+    for name in ["dataCollection", "count", "count_scalar", "probability._P_prl1", "db.get_all_planes"]:
+        assert benchmarks[name]["throughput"] > 0
+    assert benchmarks["count"]["operations"] == 2 * 5 * 9 * 5 * 6
+
+    assert find_regressions(results, results) == []
+    faster = copy.deepcopy(results)
+    faster["benchmarks"]["count"]["throughput"] *= 2
+    assert [regression.split(":")[0] for regression in find_regressions(results, faster)] == ["count"]
+    # Допуск по умолчанию - 30%
+    slightly_faster = copy.deepcopy(results)
+    slightly_faster["benchmarks"]["count"]["throughput"] *= 1.3
+    assert find_regressions(results, slightly_faster) == []
+
+    # Общее замедление машины (калибровка) регрессией не считается
+    slower_machine = copy.deepcopy(results)
+    slower_machine["calibration"] /= 2
+    for entry in slower_machine["benchmarks"].values():
+        entry["throughput"] /= 2
+    assert find_regressions(slower_machine, results) == []
+
+    # База создается на машине, где идет сравнение; без базы сравнение пропускается
+    args = ["--planes", "1", "--rockets", "1", "--sites", "1", "--sigma-z", "100", "--repeat", "1",
+            "--output", str(tmp_path / "results.json"), "--baseline", str(tmp_path / "baseline.json")]
+    assert main(args) == 0 and "--update-baseline" in capsys.readouterr().out
+    assert main(args + ["--update-baseline", "--baseline-runs", "1"]) == 0
+    assert (tmp_path / "baseline.json").exists()
+    assert main(args + ["--tolerance", "0.99"]) == 0
+
+
+def test_fill_bd_generator_is_deterministic(tmp_path):
+    from data_base import DatabaseManager
+    from fill_bd import generate_catalog, write_catalog
+    catalog = generate_catalog(20, 10, 2, 15, 3, seed=7)
+    again = generate_catalog(20, 10, 2, 15, 3, seed=7)
+    assert [vars(plane) for plane in catalog[Plane]] == [vars(plane) for plane in again[Plane]]
+    other = generate_catalog(20, 10, 2, 15, 3, seed=8)
+    assert [vars(site) for site in catalog[AirDefense]] != [vars(site) for site in other[AirDefense]]
+
+    for site in catalog[AirDefense]:
+        assert len(site.x_defense) == len(site.y_defense) == site.n_defense
+        D, P = zip(*site.P_detect)
+        assert list(D) == sorted(D) and list(P) == sorted(P, reverse=True)
+
+    db_name = str(tmp_path / "catalog.db")
+    written = write_catalog(db_name, catalog)
+    assert written[Plane] == 20 and written[Relief] == 3
+    db = DatabaseManager(db_name)
+    loaded = db.get_all_air_defenses()
+    assert len(loaded) == 15
+    assert np.array_equal(loaded[3].x_defense, catalog[AirDefense][3].x_defense)
+    db.close()
+
+
+def test_save_many_and_update_many(sample_current_data, tmp_path):
+    from data_base import DatabaseManager
+    db = DatabaseManager(str(tmp_path / "bulk.db"))
+    db.save_plane(sample_current_data.plane)
+
+    planes = [copy.deepcopy(sample_current_data.plane) for _ in range(3)]
+    for i, plane in enumerate(planes):
+        plane.name = f"Plane {i}"
+    objects = [planes[0], sample_current_data.rocket, planes[1], sample_current_data.air_defence, planes[2]]
+    ids = db.save_many(objects)
+    assert ids == [2, 1, 3, 1, 4]
+    assert [plane.name for plane in db.get_planes_by_ids(ids[::2])] == ["Plane 0", "Plane 1", "Plane 2"]
+    assert np.array_equal(db.get_air_defense(ids[3]).x_defense, sample_current_data.air_defence.x_defense)
+
+    loaded = db.get_planes_by_ids([2, 4])
+    for plane in loaded:
+        plane.sigma_z = 777.0
+    assert db.update_many(loaded + [Plane()]) == 2
+    assert [plane.sigma_z for plane in db.get_all_planes()] == [500.0, 777.0, 500.0, 777.0]
+
+    with pytest.raises(ValueError):
+        db.save_many([planes[0], object()])
+    assert len(db.get_all_planes()) == 4
+
+    # Объекты из другой базы сохраняют свои id, они не идут подряд
+    imported = []
+    for plane_id in (10, 7):
+        plane = copy.deepcopy(planes[0])
+        plane.id = plane_id
+        plane.name = f"Imported {plane_id}"
+        imported.append(plane)
+    assert db.save_many(imported + [copy.deepcopy(planes[1])]) == [10, 7, 11]
+    assert [plane.name for plane in db.get_planes_by_ids([10, 7])] == ["Imported 7", "Imported 10"]
+    db.close()
+
+
+def test_generic_loader_matches_dict_path(sample_current_data, tmp_path):
+    from data_base import DatabaseManager
+    db = DatabaseManager(str(tmp_path / "loader.db"))
+    site = sample_current_data.air_defence
+    site_id = db.save_air_defense(site)
+    db.save_relief(sample_current_data.relief)
+
+    db.cursor.execute("SELECT * FROM air_defenses")
+    columns = [column[0] for column in db.cursor.description]
+    expected = db._dict_to_object(dict(zip(columns, db.cursor.fetchone())), AirDefense)
+    assert entity_fingerprint(db.get_all_air_defenses()[0]) == entity_fingerprint(expected)
+    assert entity_fingerprint(db.get(AirDefense, site_id)) == entity_fingerprint(expected)
+    assert db.get(AirDefense, site_id + 1) is None
+    assert db.get_by_ids(Relief, []) == []
+
+    partial = db.get_all(AirDefense, columns=["x_defense", "P_defeat"])[0]
+    assert (partial.id, partial.P_defeat) == (site_id, site.P_defeat)
+    assert np.array_equal(partial.x_defense, site.x_defense)
+    assert partial.y_defense == [] and partial.P_detect == [[]]
+    with pytest.raises(ValueError):
+        db.get_all(AirDefense, columns=["x_defense; DROP TABLE planes"])
+    db.close()
+
+
+def test_arrays_stored_as_blobs_and_json_rows_migrate(sample_current_data, tmp_path):
+    import json
+    from data_base import DatabaseManager
+    db = DatabaseManager(str(tmp_path / "arrays.db"))
+    site = sample_current_data.air_defence
+    site_id = db.save_air_defense(site)
+
+    db.cursor.execute("SELECT typeof(P_detect), typeof(x_defense) FROM air_defenses")
+    assert db.cursor.fetchone() == ("blob", "blob")
+    loaded = db.get_air_defense(site_id)
+    assert isinstance(loaded.P_detect, np.ndarray) and not loaded.P_detect.flags.writeable
+    assert np.array_equal(loaded.P_detect, site.P_detect)
+    assert np.array_equal(loaded.x_defense, site.x_defense)
+
+    # Строка в старом формате JSON читается так же и переводится в бинарный формат
+    db.cursor.execute("INSERT INTO air_defenses (x_defense, y_defense, P_detect) VALUES (?, ?, ?)",
+                      (json.dumps([site.x_defense]), json.dumps(site.y_defense), json.dumps(site.P_detect)))
+    db.conn.commit()
+    old_id = db.cursor.lastrowid
+    before = db.get_air_defense(old_id)
+    assert before.x_defense == site.x_defense and before.P_detect == site.P_detect
+
+    assert db.migrate_arrays() == 3
+    assert db.migrate_arrays() == 0
+    after = db.get_air_defense(old_id)
+    assert np.array_equal(after.x_defense, site.x_defense) and np.array_equal(after.P_detect, site.P_detect)
+    assert curve_for(after, "P_detect").lookup(8000) == curve_for(site, "P_detect").lookup(8000)
+
+    # Миграция запускается явно из командной строки fill_bd.py
+    import fill_bd
+    db.cursor.execute("INSERT INTO reliefs (P_see) VALUES (?)", (json.dumps(sample_current_data.relief.P_see),))
+    db.conn.commit()
+    db.close()
+    fill_bd.generate(["--migrate-arrays", "--db", str(tmp_path / "arrays.db")])
+    db = DatabaseManager(str(tmp_path / "arrays.db"))
+    db.cursor.execute("SELECT typeof(P_see) FROM reliefs")
+    assert db.cursor.fetchall() == [("blob",)]
+    db.close()
+
+
+def test_loaded_array_columns_open_viewer(sample_current_data, tmp_path):
+    from data_base import DatabaseManager
+    from db_cache import DBCache
+    from form_manager import DataViewer
+    db = DatabaseManager(str(tmp_path / "viewer.db"))
+    site = db.get_air_defense(db.save_air_defense(sample_current_data.air_defence))
+    db.close()
+
+    viewer = DataViewer(None, DBCache())
+    columns = list(vars(site))
+    values = dict(zip(columns, viewer._prepare_row_values(site, columns)))
+    assert values["P_detect"] == values["x_defense"] == "Показать массив"
+    assert viewer._has_complex_data(site, columns)
+
+    class Tree:
+        """Treeview, на котором сделан двойной клик по колонке P_detect"""
+        def focus(self):
+            return "row"
+
+        def item(self, item_id, option):
+            return ("has_complex",)
+
+        def identify_column(self, x):
+            return f"#{columns.index('P_detect') + 1}"
+
+        def bind(self, sequence, handler):
+            self.handler = handler
+
+    shown = []
+    viewer.show_complex_data = lambda data, title: shown.append((data, title))
+    tree = Tree()
+    viewer._setup_double_click_handler(tree, {"row": 0}, [site], columns)
+    tree.handler(type("Event", (), {"x": 0}))
+    (data, title), = shown
+    assert title == "P_detect" and data == site.P_detect.tolist()
+    assert viewer._is_two_dimensional_list(data)
+
+
+def test_connection_per_thread_with_wal(sample_current_data, tmp_path):
+    import threading
+    from data_base import DatabaseManager
+    db = DatabaseManager(str(tmp_path / "pool.db"))
+    db.save_plane(sample_current_data.plane)
+    db.cursor.execute("PRAGMA journal_mode")
+    assert db.cursor.fetchone()[0] == "wal"
+
+    # Поток расчета держит открытую транзакцию чтения, а поток интерфейса в это время пишет
+    reading = threading.Event()
+    written = threading.Event()
+    seen = {}
+
+    def reader():
+        conn = db.conn
+        count_planes = lambda: conn.execute("SELECT COUNT(*) FROM planes").fetchone()[0]
+        conn.execute("BEGIN")
+        seen["before"] = count_planes()
+        seen["same_connection"] = db.conn is conn
+        reading.set()
+        written.wait(5)
+        seen["snapshot"] = count_planes()
+        conn.commit()
+        seen["after"] = count_planes()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    assert reading.wait(5)
+    db.save_plane(sample_current_data.plane)
+    written.set()
+    thread.join(5)
+
+    assert seen == {"before": 1, "same_connection": True, "snapshot": 1, "after": 2}
+    assert len(db.pool) == 2
+    db.close()
+    assert len(db.pool) == 0
+
+
+def test_identity_map_serves_repeated_reads(sample_current_data, tmp_path):
+    from data_base import DatabaseManager
+    db = DatabaseManager(str(tmp_path / "identity.db"))
+    db.save_many([copy.deepcopy(sample_current_data.plane) for _ in range(3)])
+
+    # PRAGMA data_version (проверка изменений другими соединениями) не читает таблицы
+    statements = []
+    db.conn.set_trace_callback(lambda sql: sql.startswith("PRAGMA") or statements.append(sql))
+    first = db.get_all_planes()
+    queries = len(statements)
+    second = db.get_all_planes()
+    assert len(statements) == queries
+    assert [a is b for a, b in zip(first, second)] == [True] * 3
+    assert db.get_plane(first[1].id) is first[1] and db.get_planes_by_ids([3, 1]) == [first[0], first[2]]
+    assert len(statements) == queries
+
+    # Новая строка догружается, уже загруженные объекты остаются теми же
+    db.save_plane(sample_current_data.plane)
+    planes = db.get_all_planes()
+    assert len(planes) == 4 and all(a is b for a, b in zip(first, planes))
+
+    changed = copy.copy(first[0])
+    changed.sigma_z = 900.0
+    db.update_plane(changed)
+    db.delete_plane(first[2].id)
+    planes = db.get_all_planes()
+    assert [plane.id for plane in planes] == [1, 2, 4]
+    assert planes[0] is not first[0] and planes[0].sigma_z == 900.0 and planes[1] is first[1]
+    assert db.get_plane(first[2].id) is None
+    db.close()
+
+
+def test_table_versions_invalidate_other_connections(sample_current_data, tmp_path):
+    from data_base import DatabaseManager
+    from entities import Plane, Rocket
+    path = str(tmp_path / "versions.db")
+    ui, other = DatabaseManager(path), DatabaseManager(path)
+    ui.save_many([copy.deepcopy(sample_current_data.plane) for _ in range(2)])
+    ui.save_rocket(sample_current_data.rocket)
+
+    before = ui.versions()
+    planes = ui.get_all_planes()
+    rockets = ui.get_all_rockets()
+    assert ui.changed_since(before) == set()
+
+    # Запись через другой экземпляр (соединение) видна без ручного invalidate
+    changed = copy.copy(planes[0])
+    changed.sigma_z = 900.0
+    other.update_plane(changed)
+    assert ui.changed_since(before) == {Plane}
+    reloaded = ui.get_all_planes()
+    assert reloaded[0].sigma_z == 900.0 and reloaded[0] is not planes[0]
+    assert ui.get_all_rockets()[0] is rockets[0]
+
+    # Изменение в обход DatabaseManager тоже увеличивает версию таблицы
+    with other.conn:
+        other.conn.execute("DELETE FROM rockets")
+    assert ui.changed_since(before) == {Plane, Rocket}
+    assert ui.get_all_rockets() == []
+    ui.close()
+    other.close()
+
+
+def test_startup_defers_matplotlib_and_shares_icons(capsys, tmp_path):
+    import os
+    import subprocess
+    import sys
+    import graph
+    from startup import StartupTimer
+
+    # Модули окна и графиков не тянут matplotlib и PIL при импорте
+    code = "import sys, graph, data_updater, window_builder; print(sorted({'matplotlib', 'PIL'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert output.strip() == "[]"
+
+    # Иконка загружается один раз на все графики (здесь - неудачно, без окна Tk)
+    path = str(tmp_path / "missing.png")
+    assert graph.load_icon(path) is graph.load_icon(path)
+    assert capsys.readouterr().out.count("Не удалось загрузить иконку") == 1
+
+    timer = StartupTimer()
+    timer.mark("окно показано")
+    timer.mark("база данных")
+    assert list(timer.marks) == ["окно показано", "база данных"]
+    assert timer.marks["окно показано"] <= timer.marks["база данных"]
+    assert "база данных" in timer.report()
+
+
+def test_result_store_group_by_matches_count(sample_current_data, tmp_path):
+    from result_store import ResultStore
+    second_rocket = copy.copy(sample_current_data.rocket)
+    second_rocket.name = "SecondRocket"
+    db = listBD(sample_current_data)
+    db.get_all_rockets = lambda: [sample_current_data.rocket, second_rocket]
+
+    def flatten(charts):
+        by_num, by_rocket, by_height = charts
+        values = [(name, line["plane_nums"], line["K_values"]) for name, line in by_num.items()]
+        values += list(by_rocket.items())
+        values += [(h, line["v"], line["k"]) for h, line in by_height.items()]
+        return values
+
+    def assert_close(result, expected):
+        for actual, wanted in zip(flatten(result), flatten(expected)):
+            assert actual[:-1] == wanted[:-1] and np.allclose(actual[-1], wanted[-1], rtol=1e-12)
+        assert len(flatten(result)) == len(flatten(expected))
+
+    grid = ScenarioGrid(adaptive=True, tolerance=1e-6)
+    plain = Count(db, grid=grid)
+    plain.dataCollection()
+    expected = plain.count()
+
+    store = ResultStore(str(tmp_path / "results.db"), max_runs=2)
+    count = Count(db, grid=grid, results=store)
+    count.dataCollection()
+    assert_close(count.count(), expected)
+    assert store.last_run() == count.run_id
+
+    # Новые разрезы считаются по сохраненным ячейкам, в том числе после перезапуска
+    reopened = ResultStore(str(tmp_path / "results.db"))
+    by_rocket_and_h = reopened.group_by(count.run_id, ["rocket_name", "h"], refined=False)
+    assert [key for key, _ in by_rocket_and_h] == [(rocket, h) for rocket in ["TestRocket", "SecondRocket"]
+                                                   for h in HEIGHT_RANGE]
+    (key, mean), = reopened.group_by(count.run_id, [], refined=False)
+    assert key == () and isclose(mean, np.mean([k for _, k in by_rocket_and_h]))
+    with pytest.raises(ValueError):
+        reopened.group_by(count.run_id, ["K; DROP TABLE results"])
+
+    # Повтор с теми же данными не перебирает сценарии (и уточнение сетки) и не записывает новый запуск
+    first_run = count.run_id
+    replay = Count(db, grid=grid, results=store)
+    replay._block_partial = None  # любой расчет блока или точки уточнения упадет
+    replay.dataCollection()
+    events = []
+    assert_close(replay.count(progress=events.append), expected)
+    assert replay.run_id == first_run and len(store) == 1
+    assert events[-1].done == events[-1].total
+
+    # Измененные данные - новый запуск; хранятся только последние max_runs
+    for R_min in (second_rocket.R_min + 100, second_rocket.R_min + 200):
+        second_rocket.R_min = R_min
+        count.dataCollection()
+        count.count()
+        assert count.computed_blocks == 1
+    assert len(store) == 2 and store.runs()[-1] == count.run_id and first_run not in store.runs()
@@ -0,0 +1,227 @@
+import math
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+
+G = 9.81  # ускорение свободного падения (м/с²)
+RAD = math.pi / 180
+
+
+def checked_sqrt(x):
+    """np.sqrt с той же реакцией на отрицательный аргумент, что и math.sqrt"""
+    if np.any(x < 0):
+        raise ValueError("math domain error")
+    return np.sqrt(x)
+
+
+def checked_asin(x):
+    """np.arcsin с той же реакцией на выход из области, что и math.asin"""
+    if np.any(np.abs(x) > 1):
+        raise ValueError("math domain error")
+    return np.arcsin(x)
+
+
+def checked_divide(a, b):
+    """Деление с ZeroDivisionError, как в скалярном коде"""
+    if np.any(b == 0):
+        raise ZeroDivisionError("float division by zero")
+    return a / b
+
+
+@dataclass
+class TrajectoryGeometry:
+    """
+    Геометрия захода на цель, общая для Count._ZVA и Count._P_4.
+
+    D1 и D3 у обоих методов одинаковые, а y_0 и fi_0 считаются по-разному,
+    поэтому x_2 и D2 хранятся для каждого метода отдельно.
+    Поля - числа для скалярного расчета или массивы для VectorEngine.
+    """
+    D1: any
+    D3: any
+    x_2_zva: any
+    D2_zva: any
+    x_2_p4: any
+    D2_p4: any
+
+
+FIELDS = ["D1", "D3", "x_2_zva", "D2_zva", "x_2_p4", "D2_p4"]
+
+
+def _newton_alf(z, y_0, fi_0, R, stats=None) -> float:
+    """Решение уравнения для alf методом Ньютона"""
+    def equation(alf):
+        return z - (y_0 * math.sin(alf * RAD) + R * (1 - math.cos((alf - fi_0) * RAD)))
+
+    alf = 0.5  # Начальное приближение
+    tolerance = 1e-6
+    max_iter = 100
+
+    for iteration in range(max_iter):
+        f = equation(alf)
+        df = y_0 * math.cos(alf * RAD) - R * math.sin((alf - fi_0) * RAD)
+        alf_new = alf - f / df
+
+        if abs(alf_new - alf) < tolerance:
+            break
+        alf = alf_new
+    if stats is not None:
+        stats.add("newton_iterations", iteration + 1)
+    return alf
+
+
+def _newton_alf_array(z, y_0, fi_0, R, stats=None) -> np.ndarray:
+    """Метод Ньютона сразу для массива точек"""
+    alf = np.full(np.shape(z), 0.5)
+    active = np.ones(np.shape(z), dtype=bool)
+    tolerance = 1e-6
+    max_iter = 100
+
+    for _ in range(max_iter):
+        if stats is not None:
+            stats.add("newton_iterations", int(active.sum()))
+        f = z - (y_0 * np.sin(alf * RAD) + R * (1 - np.cos((alf - fi_0) * RAD)))
+        df = y_0 * np.cos(alf * RAD) - R * np.sin((alf - fi_0) * RAD)
+        if np.any(df[active] == 0):
+            raise ZeroDivisionError("float division by zero")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alf_new = alf - f / df
+
+        # Как и в скалярном коде, при сходимости остается предыдущее приближение
+        active &= ~(np.abs(alf_new - alf) < tolerance)
+        alf = np.where(active, alf_new, alf)
+        if not active.any():
+            break
+    return alf
+
+
+def solve_trajectory(v, z, R_min, t_aim, psi_max, gap_max, angle_effect, stats=None) -> TrajectoryGeometry:
+    """Скалярный расчет геометрии (формулы Count._ZVA и Count._P_4)"""
+    # Расчет D1
+    sqrt_part = math.sqrt(abs(R_min ** 2 - z ** 2))
+    D1 = math.sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * sqrt_part)
+
+    # Расчет R
+    R = v ** 2 / (G * math.sqrt(gap_max ** 2 - 1))
+
+    # Расчет D3
+    D3 = z / math.sin(psi_max * RAD)
+
+    # y_0 и fi_0 в варианте _ZVA
+    y_0 = math.sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * angle_effect)
+    fi_0 = math.asin(R_min * angle_effect / y_0 * RAD)
+    alf = _newton_alf(z, y_0, fi_0, R, stats)
+    x_2_zva = y_0 * math.cos(alf * RAD) + R * math.sin((alf - fi_0) * RAD)
+    D2_zva = math.sqrt(x_2_zva ** 2 + z ** 2)
+
+    # y_0 и fi_0 в варианте _P_4
+    y_0 = math.sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * math.cos(psi_max * RAD))
+    fi_0 = abs(math.asin(R_min * math.sin(psi_max * RAD) / y_0 * RAD))
+    alf = _newton_alf(z, y_0, fi_0, R, stats)
+    x_2_p4 = y_0 * math.cos(alf * RAD) + R * math.sin((alf - fi_0) * RAD)
+    D2_p4 = math.sqrt(x_2_p4 ** 2 + z ** 2)
+
+    return TrajectoryGeometry(D1=D1, D3=D3, x_2_zva=x_2_zva, D2_zva=D2_zva, x_2_p4=x_2_p4, D2_p4=D2_p4)
+
+
+def solve_trajectory_array(v, z, R_min, t_aim, psi_max, gap_max, angle_effect, stats=None) -> TrajectoryGeometry:
+    """Тот же расчет для массивов v и z"""
+    sqrt_part = np.sqrt(np.abs(R_min ** 2 - z ** 2))
+    D1 = np.sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * sqrt_part)
+    R = v ** 2 / (G * math.sqrt(gap_max ** 2 - 1))
+    D3 = checked_divide(z, math.sin(psi_max * RAD))
+
+    y_0 = checked_sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * angle_effect)
+    fi_0 = checked_asin(R_min * angle_effect / y_0 * RAD)
+    alf = _newton_alf_array(z, y_0, fi_0, R, stats)
+    x_2_zva = y_0 * np.cos(alf * RAD) + R * np.sin((alf - fi_0) * RAD)
+    D2_zva = np.sqrt(x_2_zva ** 2 + z ** 2)
+
+    y_0 = checked_sqrt(R_min ** 2 + (v * t_aim) ** 2 + 2 * v * t_aim * math.cos(psi_max * RAD))
+    fi_0 = np.abs(checked_asin(R_min * math.sin(psi_max * RAD) / y_0 * RAD))
+    alf = _newton_alf_array(z, y_0, fi_0, R, stats)
+    x_2_p4 = y_0 * np.cos(alf * RAD) + R * np.sin((alf - fi_0) * RAD)
+    D2_p4 = np.sqrt(x_2_p4 ** 2 + z ** 2)
+
+    return TrajectoryGeometry(D1=D1, D3=D3, x_2_zva=x_2_zva, D2_zva=D2_zva, x_2_p4=x_2_p4, D2_p4=D2_p4)
+
+
+class TrajectoryCache:
+    """
+    Кэш геометрии захода с ограниченным размером (вытесняется давно неиспользуемое).
+
+    Геометрия зависит только от (v, z, R_min, t_aim, psi_max, gap_max, angle_effect)
+    и не зависит от количества самолетов, цели, рельефа и ПВО, поэтому метод Ньютона
+    решается один раз на такой набор.
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.stats = None  # Instrumentation для подсчета итераций Ньютона
+        self._entries = OrderedDict()
+
+    def get(self, v, z, R_min, t_aim, psi_max, gap_max, angle_effect) -> TrajectoryGeometry:
+        """Геометрия для одной точки"""
+        key = (v, z, R_min, t_aim, psi_max, gap_max, angle_effect)
+        return self._lookup(key, lambda: solve_trajectory(*key, stats=self.stats))
+
+    def get_array(self, v, z, R_min, t_aim, psi_max, gap_max, angle_effect) -> TrajectoryGeometry:
+        """
+        Геометрия для массивов v и z.
+
+        В кэш попадают уникальные пары (v, z); Ньютон решается одним векторным вызовом
+        только для пар, которых в кэше еще нет, результат раскладывается обратно по точкам.
+        """
+        v = np.asarray(v, dtype=float)
+        z = np.asarray(z, dtype=float)
+        pairs, inverse = np.unique(np.stack([v, z]), axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # Отдельное пространство ключей: векторный расчет может отличаться от скалярного в последнем знаке
+        keys = [("array", pair_v, pair_z, R_min, t_aim, psi_max, gap_max, angle_effect)
+                for pair_v, pair_z in zip(pairs[0].tolist(), pairs[1].tolist())]
+        rows = [self._get_entry(key) for key in keys]
+
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            solved = solve_trajectory_array(pairs[0][missing], pairs[1][missing],
+                                            R_min, t_aim, psi_max, gap_max, angle_effect, self.stats)
+            columns = [values.tolist() for values in vars(solved).values()]
+            for j, i in enumerate(missing):
+                rows[i] = tuple(column[j] for column in columns)
+                self._put_entry(keys[i], rows[i])
+
+        table = np.array(rows, dtype=float).reshape(len(rows), len(FIELDS))
+        return TrajectoryGeometry(**{field: table[:, k][inverse] for k, field in enumerate(FIELDS)})
+
+    def _lookup(self, key, solve) -> TrajectoryGeometry:
+        geometry = self._get_entry(key)
+        if geometry is None:
+            geometry = solve()
+            self._put_entry(key, geometry)
+        return geometry
+
+    def _get_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_entry(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Очищает кэш и счетчики"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
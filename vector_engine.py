@@ -0,0 +1,370 @@
+import math
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from entities import *
+from probability_curve import ProbabilityCurve, curve_for
+from defense_index import defense_index
+from fingerprint import array_key
+from trajectory import TrajectoryCache, TrajectoryGeometry, checked_divide, checked_sqrt
+
+RAD = math.pi / 180
+
+# Законы перехвата из скалярных циклов Count._P_prl1, Count._P_prl2 и Count._P_4
+INTERCEPT_PRL1 = "prl1"  # while D > 0 or N < n_rocket_d, D уменьшается на каждом шаге
+INTERCEPT_PRL2 = "prl2"  # while D > 0 and N < n_rocket_d, D уменьшается на каждом шаге
+INTERCEPT_P4 = "p4"      # while D > 0 and N < n_rocket_d, выход из цикла при промахе
+
+
+def _keep_going(D, N, n_rocket_d, rule: str) -> np.ndarray:
+    """Условие продолжения цикла перехвата"""
+    if rule == INTERCEPT_PRL1:
+        return (D > 0) | (N < n_rocket_d)
+    return (D > 0) & (N < n_rocket_d)
+
+
+def intercept(D_pys, v, speed, air_defence: AirDefense, curve: ProbabilityCurve, rule: str,
+              stats=None) -> np.ndarray:
+    """
+    Циклы перехвата скалярного кода для массива пар (точка, сфера).
+
+    Все активные пары делают шаг одновременно, пара выбывает, когда для нее
+    перестает выполняться условие цикла. Операции те же, что и в скалярном
+    цикле, поэтому N совпадает с ним для каждой пары.
+    """
+    D = np.array(D_pys, dtype=float)
+    N = np.zeros(np.shape(D))
+    active = _keep_going(D, N, air_defence.n_rocket_d, rule)
+
+    while active.any():
+        lanes = np.flatnonzero(active)
+        if stats is not None:
+            stats.add("intercept_steps", len(lanes))
+        D_lane = D[lanes]
+        v_lane = v[lanes]
+
+        t_per = checked_divide(D_lane, speed[lanes]) + air_defence.t_def
+        hit = t_per * v_lane > D_lane
+        N[lanes[hit]] += curve.lookup_array(D_lane[hit])
+
+        if rule == INTERCEPT_P4:
+            D[lanes[hit]] = D_lane[hit] - v_lane[hit] * t_per[hit]
+            active[lanes[~hit]] = False
+        else:
+            D[lanes] = D_lane - v_lane * t_per
+        active[lanes] &= _keep_going(D[lanes], N[lanes], air_defence.n_rocket_d, rule)
+    return N
+
+
+@dataclass
+class DataKBlock:
+    """Результат расчета блока сценариев: те же поля, что и у Data_K, но массивами"""
+    P_def: np.ndarray
+    P5: np.ndarray
+    P4: np.ndarray
+    P_prl1: np.ndarray
+    P_prl2: np.ndarray
+    W_a: np.ndarray
+    W_a_max: np.ndarray
+    plane_name: str
+    plane_num: np.ndarray
+    rocket_name: str
+    v: np.ndarray
+    h: np.ndarray
+    z: np.ndarray
+
+    def __len__(self):
+        return len(self.v)
+
+    def K(self) -> np.ndarray:
+        """Векторный аналог Count._cout_K"""
+        W = (self.P_def * self.P4 * self.W_a + (self.W_a_max - self.W_a) * self.P_def * self.P5 + (1 - self.W_a_max))
+        Q = (1 - self.P_prl1 * self.P_prl2) * self.W_a + (self.W_a_max - self.W_a) * (1 - (1 - self.P_prl1 * self.P_prl2)**2) + (1 - self.W_a_max) * (1 - self.P_prl1)
+        if np.any(Q == 0):
+            raise ZeroDivisionError("float division by zero")
+        return W / Q
+
+
+class VectorEngine:
+    """
+    Векторный расчет вероятностей для блока сценариев.
+
+    Для фиксированного набора (самолет, цель, ракета, ПВО, рельеф) считает сразу
+    все точки сетки (v, h, plane_num, z) массивами NumPy. Формулы повторяют
+    скалярные методы Count один в один, поэтому результат совпадает с ними
+    с точностью до округления.
+    """
+
+    def __init__(self, trajectories: TrajectoryCache = None, submodel_maxsize: int = 256):
+        self.trajectories = trajectories if trajectories is not None else TrajectoryCache()
+        self.stats = None  # Instrumentation, если включена
+        # Кэш подмоделей по их настоящим входам (ПВО и точки v, h, z), общий для всех блоков
+        self.submodel_maxsize = submodel_maxsize
+        self.submodel_hits = 0
+        self.submodel_misses = 0
+        self._submodels = OrderedDict()
+
+    def calculate_block(self, plane: Plane, purpose: Purpose, rocket: Rocket,
+                        air_defence: AirDefense, relief: Relief,
+                        v, h, plane_num, z) -> DataKBlock:
+        """
+        Векторный аналог Count._calculate_probabilities для блока точек.
+
+        Каждая подмодель считается на уникальных значениях своих настоящих входов
+        и раскладывается по точкам блока: от plane_num зависят только показатели степени.
+        """
+        v = np.asarray(v, dtype=float)
+        h = np.asarray(h, dtype=float)
+        plane_num = np.asarray(plane_num, dtype=float)
+        z = np.asarray(z, dtype=float)
+
+        # Уникальные точки (v, h, z): перехват и геометрия не зависят от plane_num
+        points, inverse = np.unique(np.stack([v, h, z]), axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        point_v, point_h, point_z = points
+        points_key = array_key(points)
+        defence_key = self._defence_key(air_defence)
+
+        # Геометрия захода общая для _P_4 и _ZVA
+        geometry = self.trajectories.get_array(point_v, point_z, rocket.R_min, plane.t_aim, plane.psi_max,
+                                               plane.gap_max, rocket.angle_effect)
+
+        # Перехват в _P_prl1/_P_prl2 не зависит от самолета, ракеты и цели
+        N_prl1 = self._submodel(("prl1", defence_key, points_key),
+                                lambda: self._N_prl(air_defence, point_v, point_h, point_z, INTERCEPT_PRL1))
+        N_prl2 = self._submodel(("prl2", defence_key, points_key),
+                                lambda: self._N_prl(air_defence, point_v, point_h, point_z, INTERCEPT_PRL2))
+        N_p4 = self._submodel(("p4", defence_key, points_key, rocket.R_min, rocket.angle_effect,
+                               plane.t_aim, plane.psi_max, plane.gap_max),
+                              lambda: self._N_p4(geometry, air_defence, point_v, point_h, point_z))
+
+        P4 = self._survival(air_defence, N_p4[inverse], plane_num)
+        P_prl1 = self._survival(air_defence, N_prl1[inverse], plane_num)
+        P_prl2 = self._survival(air_defence, N_prl2[inverse], plane_num)
+        P5 = P_prl1 * P_prl2
+
+        p_z = self._P_z(plane.sigma_z, point_z)
+
+        plane_curve = self._curve(plane, "P_detect")
+        W_a_max = (plane_curve.lookup(geometry.D3) * p_z)[inverse]
+
+        D_ob = self._ZVA(geometry)
+        W_a = (plane_curve.lookup(D_ob) * p_z)[inverse]
+
+        P_def = self._polygon(plane, purpose, rocket, h, plane_num)
+
+        return DataKBlock(
+            P_def=P_def,
+            P4=P4,
+            P5=P5,
+            P_prl1=P_prl1,
+            P_prl2=P_prl2,
+            W_a_max=W_a_max,
+            W_a=W_a,
+            plane_name=plane.name,
+            plane_num=plane_num,
+            rocket_name=rocket.name,
+            v=v,
+            h=h,
+            z=z
+        )
+
+    def _submodel(self, key, calculate) -> np.ndarray:
+        """Результат подмодели из кэша или новый расчет"""
+        values = self._submodels.get(key)
+        if values is None:
+            self.submodel_misses += 1
+            values = calculate()
+            self._submodels[key] = values
+            if len(self._submodels) > self.submodel_maxsize:
+                self._submodels.popitem(last=False)
+        else:
+            self.submodel_hits += 1
+            self._submodels.move_to_end(key)
+        return values
+
+    def _defence_key(self, air_defence: AirDefense) -> tuple:
+        """Параметры ПВО, от которых зависит перехват"""
+        curve = self._curve(air_defence, "P_detect")
+        return (air_defence.n_defense, tuple(air_defence.x_defense[:air_defence.n_defense]),
+                tuple(air_defence.y_defense[:air_defence.n_defense]), air_defence.l_min, air_defence.l_max,
+                air_defence.v_defense, air_defence.t_def, air_defence.n_rocket_d, air_defence.P_defeat,
+                curve.key)
+
+    def _survival(self, air_defence: AirDefense, N, plane_num) -> np.ndarray:
+        """Вероятность непоражения при N ракетах ПВО на группу из plane_num самолетов"""
+        P_kill = 1 - (1 - air_defence.P_defeat) ** (N / plane_num)
+        return 1 - P_kill
+
+    def _polygon(self, plane: Plane, purpose: Purpose, rocket: Rocket, h, plane_num) -> np.ndarray:
+        """Векторный аналог Count._polygon; P_polygon считается один раз на каждую высоту"""
+        unique_h, inverse = np.unique(h, return_inverse=True)
+        key = ("polygon", rocket.type.lower(), rocket.R_min, purpose.a, purpose.b, purpose.h, purpose.R_defeat,
+               array_key(unique_h))
+        P_polygon = self._submodel(key, lambda: np.array(
+            [self._P_polygon(rocket, purpose, value) for value in unique_h.tolist()]))[inverse.reshape(-1)]
+
+        if rocket.type.lower() == "фугас":
+            return 1 - (1 - P_polygon) ** (plane.n_rocket * plane_num)
+        return 1 - (1 - P_polygon / purpose.average_number) ** (plane.n_rocket * plane_num)
+
+    def _P_polygon(self, rocket: Rocket, purpose: Purpose, altitude: float) -> float:
+        """Вероятность попадания в многоугольник цели для одной высоты"""
+        tet = math.atan2(altitude, rocket.R_min * RAD)
+        ctg_tet = 1 / math.tan(tet * RAD) if math.tan(tet * RAD) != 0 else float('inf')
+        sig_x = 4
+        sig_y = 4
+
+        a = purpose.a
+        b = purpose.b
+        h = purpose.h
+        R_defeat = purpose.R_defeat
+        if rocket.type.lower() == "фугас":
+            x1, y1 = 0, 0
+            al1 = -b / 2 - R_defeat
+            bt1 = b / 2 + R_defeat
+            ga1 = -a / 2 - R_defeat
+            de1 = a / 2 + R_defeat
+
+            x2 = (b + R_defeat + h * ctg_tet) / 2
+            y2 = 0
+            al2 = b / 2 + R_defeat
+            bt2 = b / 2 + h * ctg_tet
+            ga2 = -a / 2
+            de2 = a / 2
+        else:
+            x1, y1 = 0, 0
+            al1 = -b / 2
+            bt1 = b / 2
+            ga1 = -a / 2
+            de1 = a / 2
+
+            x2 = (b + h * ctg_tet) / 2
+            y2 = 0
+            al2 = b / 2
+            bt2 = b / 2 + h * ctg_tet
+            ga2 = -a / 2
+            de2 = a / 2
+
+        def lagrange_function(x: float) -> float:
+            return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+
+        term1 = (lagrange_function((bt1 - x1) / sig_x) - lagrange_function((al1 - x1) / sig_x))
+        term2 = (lagrange_function((de1 - y1) / sig_y) - lagrange_function((ga1 - y1) / sig_y))
+        term3 = (lagrange_function((bt2 - x2) / sig_x) - lagrange_function((al2 - x2) / sig_x))
+        term4 = (lagrange_function((de2 - y2) / sig_y) - lagrange_function((ga2 - y2) / sig_y))
+
+        return term1 * term2 + term3 * term4
+
+    def _ZVA(self, geometry: TrajectoryGeometry) -> np.ndarray:
+        """Векторный аналог Count._ZVA"""
+        return np.maximum(np.maximum(geometry.D1, geometry.D2_zva), geometry.D3)
+
+    def _P_z(self, sigma_z: float, z) -> np.ndarray:
+        """Векторный аналог Count._P_z"""
+        coefficient = 1 / (sigma_z * math.sqrt(2 * math.pi))
+        exponent = -0.5 * ((z / sigma_z) ** 2)
+        return coefficient * np.exp(exponent)
+
+    def _N_p4(self, geometry: TrajectoryGeometry, air_defence: AirDefense, v, h, z) -> np.ndarray:
+        """Суммарное число ракет ПВО из Count._P_4 (без деления на plane_num)"""
+        D1 = geometry.D1
+        x_2 = geometry.x_2_p4
+        D2 = geometry.D2_p4
+        D3 = geometry.D3
+
+        curve = self._curve(air_defence, "P_detect")
+        sphere_radius = (air_defence.l_min + air_defence.l_max) / 2  # Средний радиус сферы защиты
+        near = (D1 > D2) & (D3 < D1)
+        D_min = np.minimum(D2, D3)
+        D_max = np.maximum(D2, D3)
+
+        D_rows = []
+        lane_rows = []
+        spheres = defense_index(air_defence).candidates(sphere_radius, h.min(), h.max()) if len(h) else []
+        for i in spheres:
+            sphere_x = air_defence.x_defense[i]
+            sphere_y = air_defence.y_defense[i]
+
+            # Проверка пересечения траектории со сферой
+            distance_to_axis = np.sqrt((sphere_x - 0) ** 2 + (sphere_y - h) ** 2)
+            inside = ~(distance_to_axis > sphere_radius)
+            if not inside.any():
+                continue
+
+            right_bound = np.full(np.shape(z), -np.inf)
+            left_bound = np.full(np.shape(z), np.inf)
+            half_chord = checked_sqrt(sphere_radius ** 2 - (h[inside] - sphere_y) ** 2 - z[inside] ** 2)
+            right_bound[inside] = sphere_x + half_chord
+            left_bound[inside] = sphere_x - half_chord
+
+            # В ветке D1 > D2 и D3 < D1 скалярный код не добавляет N в N_sym,
+            # поэтому считаются только точки второй ветки
+            lanes = inside & ~near
+            crossing = lanes & (right_bound > D_min)
+
+            # Первый отрезок
+            first = crossing & ((h - sphere_y) ** 2 + z ** 2 <= sphere_radius ** 2)
+            x_start = np.where(D2 > D3, x_2, 0.0)
+            from_D3 = first & ~(D2 > D3)
+            x_start[from_D3] = checked_sqrt(D3[from_D3] ** 2 - z[from_D3] ** 2)
+            segment1 = np.where(first, np.maximum(0, right_bound - x_start), 0.0)
+
+            # Второй отрезок
+            segment2 = np.where(crossing, np.maximum(0, np.minimum(right_bound, D_max) - np.maximum(left_bound, D_min)), 0.0)
+
+            D_rows.append(segment1 + segment2)
+            lane_rows.append(lanes)
+
+        return self._sum_spheres(air_defence, D_rows, lane_rows, v, curve,
+                                 v + air_defence.v_defense, INTERCEPT_P4)
+
+    def _N_prl(self, air_defence: AirDefense, v, h, z, rule: str) -> np.ndarray:
+        """Суммарное число ракет ПВО из Count._P_prl1/_P_prl2 с заданным законом перехвата"""
+        curve = self._curve(air_defence, "P_detect")
+        sphere_radius = air_defence.l_max
+
+        D_rows = []
+        lane_rows = []
+        spheres = defense_index(air_defence).candidates(sphere_radius, h.min(), h.max(), np.abs(z).min()) \
+            if len(h) else []
+        for i in spheres:
+            sphere_x = air_defence.x_defense[i]
+            sphere_y = air_defence.y_defense[i]
+
+            distance_squared = (sphere_x - 0) ** 2 + (sphere_y - h) ** 2 + z ** 2
+            inside = ~(distance_squared > sphere_radius ** 2)
+            if not inside.any():
+                continue
+
+            right_bound = np.zeros(np.shape(z))
+            right_bound[inside] = sphere_x + checked_sqrt(sphere_radius ** 2 - (h[inside] - sphere_y) ** 2 - z[inside] ** 2)
+            D_rows.append(np.maximum(0, right_bound - (sphere_y + air_defence.l_min)))
+            lane_rows.append(inside)
+
+        # В _P_prl2 сближение идет со скоростью v_defense - v
+        speed = v + air_defence.v_defense if rule == INTERCEPT_PRL1 else air_defence.v_defense - v
+        return self._sum_spheres(air_defence, D_rows, lane_rows, v, curve, speed, rule)
+
+    def _sum_spheres(self, air_defence: AirDefense, D_rows, lane_rows, v, curve, speed, rule) -> np.ndarray:
+        """Перехват сразу для всех пар (точка, сфера) и сумма N по сферам в порядке их перебора"""
+        total_N = np.zeros(np.shape(v))
+        if not D_rows:
+            return total_N
+
+        lanes = np.stack(lane_rows)
+        columns = np.nonzero(lanes)[1]
+        N = np.zeros(lanes.shape)
+        N[lanes] = intercept(np.stack(D_rows)[lanes], v[columns], speed[columns], air_defence, curve, rule,
+                             self.stats)
+
+        for row in np.minimum(N, air_defence.n_rocket_d):
+            total_N += row
+        return total_N
+
+    def _curve(self, obj, field: str) -> ProbabilityCurve:
+        """Скомпилированная таблица вероятностей объекта"""
+        curve = curve_for(obj, field)
+        if curve is None:
+            raise ValueError(f"Некорректная таблица {field} у объекта '{obj.name}'")
+        return curve